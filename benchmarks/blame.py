@@ -0,0 +1,78 @@
+# coding: utf-8
+#
+# This file is part of gitinspector.
+#
+# gitinspector is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# gitinspector is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark comparing the thread and process blame engines on the
+# pelican repository bundled with the tests. Run it from the root of
+# the repository with:
+#
+#   python -m benchmarks.blame [JOBS...]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+from gitinspector.blame import Blame, BLAME_ENGINES
+from gitinspector.changes import Changes
+from gitinspector.gitinspector import Runner, __parse_arguments__
+
+REPOSITORY = "tests/resources/pelican-repository.zip"
+REPEAT = 3
+
+
+def blame(changes, config, context):
+    """Returns the best wall-clock time of the blames, with the rows
+    found in each (author, file)."""
+    best = None
+    for i in range(REPEAT):
+        start = time.perf_counter()
+        blames = Blame(None, changes, config, context)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, { k: v.rows for k, v in blames.all_blames().items() }
+
+
+def main(jobs):
+    directory = tempfile.mkdtemp()
+    try:
+        zipfile.ZipFile(REPOSITORY).extractall(directory)
+        location = os.path.join(directory, "pelican-repository")
+
+        config = __parse_arguments__(args=["--file-types", "**", "--silent", location])
+        config.progress = False
+        context = Runner(config, None).context # Holds the filters
+        config.branches = ["refs/heads/master"]
+        config.branch = "refs/heads/master"
+        changes = Changes(None, config, context, location)
+
+        print("{0:<10}{1:>6}{2:>12}".format("engine", "jobs", "seconds"))
+        reference = None
+        for j in jobs:
+            for engine in BLAME_ENGINES:
+                config.jobs, config.blame_engine = j, engine
+                elapsed, rows = blame(changes, config, context)
+                reference = rows if reference is None else reference
+                assert rows == reference
+                print("{0:<10}{1:>6}{2:>12.2f}".format(engine, j, elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main([int(j) for j in sys.argv[1:]] or [1, os.cpu_count() or 1])
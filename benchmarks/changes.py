@@ -0,0 +1,82 @@
+# coding: utf-8
+#
+# This file is part of gitinspector.
+#
+# gitinspector is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# gitinspector is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark comparing the former insertion of every commit with
+# bisect.insort to the single k-way merge of Changes.merge, on
+# synthetic repositories whose histories overlap in time. Run it from
+# the root of the repository with:
+#
+#   python -m benchmarks.changes [COMMITS [REPOSITORIES]]
+
+import argparse
+import bisect
+import random
+import sys
+import time
+
+from gitinspector import localization
+localization.init_null()
+
+from gitinspector.changes import Changes, Commit
+
+
+def repositories(commits, count):
+    """Returns `count` Changes holding `commits` commits in total, each
+    repository being sorted by timestamps over the same period."""
+    config = argparse.Namespace(aliases={}, merge_authors=False)
+    random.seed(0)
+    result = []
+    for r in range(count):
+        changes = Changes.empty()
+        timestamps = sorted(random.randrange(1000000000, 1600000000)
+                            for _ in range(commits // count))
+        changes.__commits__ = [ Commit([t, "2001-09-09", "%040x" % i, "Author %d" % r,
+                                        "author%d@example.com" % r], config, changes.store)
+                                for (i, t) in enumerate(timestamps) ]
+        result.append(changes)
+    return result
+
+
+def insort(changes_list):
+    """The former merge, inserting each commit with bisect.insort."""
+    commits = []
+    for changes in changes_list:
+        for commit in changes.all_commits():
+            bisect.insort(commits, commit)
+    return commits
+
+
+def main(commits, count):
+    changes_list = repositories(commits, count)
+
+    start = time.perf_counter()
+    merged = Changes.merge(changes_list).all_commits()
+    merge_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    inserted = insort(changes_list)
+    insort_time = time.perf_counter() - start
+
+    assert [c.sha for c in merged] == [c.sha for c in inserted]
+    print("{0} commits in {1} repositories".format(len(merged), count))
+    print("{0:<16}{1:>10.2f}s".format("bisect.insort", insort_time))
+    print("{0:<16}{1:>10.2f}s".format("heapq.merge", merge_time))
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [500000, 20][len(args):]))
@@ -0,0 +1,113 @@
+# coding: utf-8
+#
+# This file is part of gitinspector.
+#
+# gitinspector is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# gitinspector is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
+
+# Microbenchmark comparing the per-line cost of the former
+# unicode_escape/latin-1/utf-8 round trip with the byte-level decoding
+# of git_utils. Run it from the root of the repository with:
+#
+#   python -m benchmarks.decoding
+
+import timeit
+
+from gitinspector import git_utils
+
+REPEAT = 5
+NUMBER = 20000
+
+PATH = "src/modules/café/naïve_über_module.c".encode("utf-8")
+HEADER = [b"1445092633", b"2015-10-17", b"a0baec63fd41baa219b0ef0242dc612527411be6",
+          "Frödo Baggins".encode("utf-8"), b"frodo.baggins@shire.net"]
+BLAME_ROWS = [
+    b"a0baec63fd41baa219b0ef0242dc612527411be6 12 12 1\n",
+    "author Frödo Baggins\n".encode("utf-8"),
+    b"author-mail <frodo.baggins@shire.net>\n",
+    b"author-time 1445092633\n",
+    b"author-tz +0200\n",
+    "committer Frödo Baggins\n".encode("utf-8"),
+    b"committer-mail <frodo.baggins@shire.net>\n",
+    b"committer-time 1445092633\n",
+    b"committer-tz +0200\n",
+    b"summary Add the trie structure\n",
+    b"filename src/trie.c\n",
+    b"\tstruct trie *trie_new(void);\n",
+]
+
+
+def legacy_decode(line):
+    """The decoding applied to every line before the byte-level layer."""
+    return line.strip().decode("unicode_escape", "ignore").\
+        encode("latin-1", "replace").\
+        decode("utf-8", "replace")
+
+
+def legacy_blame(rows):
+    """The blame parsing loop that decoded and split every row."""
+    fields = {}
+    for row in rows:
+        row = row.decode("utf-8", "replace").strip()
+        keyval = row.split(" ", 2)
+        if keyval[0] == "author" or keyval[0] == "author-mail":
+            fields[keyval[0]] = " ".join(keyval[1:])
+        elif keyval[0] == "author-time":
+            fields[keyval[0]] = int(keyval[1])
+    return fields
+
+
+def bytes_blame(rows):
+    """The blame parsing loop of BlameThread.run, on raw bytes."""
+    fields = {}
+    for row in rows:
+        if row.startswith(b"author "):
+            fields["author"] = git_utils.decode(row[7:]).strip()
+        elif row.startswith(b"author-mail "):
+            fields["author-mail"] = git_utils.decode(row[12:]).strip()
+        elif row.startswith(b"author-time "):
+            fields["author-time"] = int(row[12:])
+    return fields
+
+
+def per_line(statement, lines):
+    """Returns the best time per line (in nanoseconds) of `statement`."""
+    best = min(timeit.repeat(statement, repeat=REPEAT, number=NUMBER))
+    return 1e9 * best / (NUMBER * lines)
+
+
+def main():
+    path_view = memoryview(PATH)
+    cases = [
+        ("path (ls-tree -z)",
+         lambda: legacy_decode(PATH),
+         lambda: git_utils.decode(path_view[0:len(PATH)]), 1),
+        ("commit header",
+         lambda: [legacy_decode(f) for f in HEADER],
+         lambda: [git_utils.decode(f) for f in HEADER], len(HEADER)),
+        ("blame porcelain",
+         lambda: legacy_blame(BLAME_ROWS),
+         lambda: bytes_blame(BLAME_ROWS), len(BLAME_ROWS)),
+    ]
+
+    print("{0:<20}{1:>14}{2:>14}{3:>10}".format("ns per line", "round trip", "bytes", "speedup"))
+    for (name, legacy, current, lines) in cases:
+        assert legacy() == current()
+        legacy_time = per_line(legacy, lines)
+        current_time = per_line(current, lines)
+        print("{0:<20}{1:>14.1f}{2:>14.1f}{3:>9.1f}x".format(name, legacy_time, current_time,
+                                                            legacy_time / current_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# coding: utf-8
+#
+# This file is part of gitinspector.
+#
+# gitinspector is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# gitinspector is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark comparing the separate ELOC and cyclomatic complexity passes
+# with the single-pass scanner of MetricsLogic, on the files bundled with
+# the tests. Run it from the root of the repository with:
+#
+#   python -m benchmarks.metrics
+
+import os
+import shutil
+import tempfile
+import timeit
+import zipfile
+
+from gitinspector import git_utils
+from gitinspector.changes import FileDiff
+from gitinspector.metrics import MetricsLogic
+
+RESOURCES = "tests/resources"
+REPEAT = 5
+NUMBER = 10
+
+
+def read_files(directory):
+    """Returns the lines of the files under `directory` (outside of the
+    .git directories), grouped by extension."""
+    files = {}
+    for (root, dirs, names) in os.walk(directory):
+        dirs[:] = [ d for d in dirs if d != ".git" ]
+        for name in names:
+            with open(os.path.join(root, name), "rb") as blob:
+                file_r = git_utils.decode(blob.read()).split("\n")
+            if file_r and not file_r[-1]:
+                file_r.pop()
+            files.setdefault(FileDiff.get_extension(name), []).append(file_r)
+    return files
+
+
+def separate(files, extension):
+    return [ (MetricsLogic.get_eloc(f, extension),
+              MetricsLogic.get_cyclomatic_complexity(f, extension)) for f in files ]
+
+
+def fused(files, extension):
+    return [ MetricsLogic.get_metrics(f, extension)[0::2] for f in files ]
+
+
+def per_line(statement, lines):
+    """Returns the best time per line (in nanoseconds) of `statement`."""
+    best = min(timeit.repeat(statement, repeat=REPEAT, number=NUMBER))
+    return 1e9 * best / (NUMBER * lines)
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        for name in os.listdir(RESOURCES):
+            if name.endswith(".zip"):
+                zipfile.ZipFile(os.path.join(RESOURCES, name)).extractall(directory)
+            else:
+                shutil.copy(os.path.join(RESOURCES, name), directory)
+        files = read_files(directory)
+    finally:
+        shutil.rmtree(directory)
+
+    print("{0:<18}{1:>8}{2:>12}{3:>12}{4:>10}".format("extension", "lines", "separate", "fused",
+                                                      "speedup"))
+    (separate_total, fused_total, lines_total) = (0, 0, 0)
+    for extension in sorted(files, key=lambda e: -sum(len(f) for f in files[e])):
+        lines = sum(len(f) for f in files[extension])
+        if not lines:
+            continue
+        assert separate(files[extension], extension) == fused(files[extension], extension)
+        separate_time = per_line(lambda: separate(files[extension], extension), lines)
+        fused_time = per_line(lambda: fused(files[extension], extension), lines)
+        (separate_total, fused_total) = (separate_total + separate_time * lines,
+                                         fused_total + fused_time * lines)
+        lines_total += lines
+        print("{0:<18}{1:>8}{2:>12.1f}{3:>12.1f}{4:>9.1f}x".format(extension or "(none)", lines,
+                                                                   separate_time, fused_time,
+                                                                   separate_time / fused_time))
+
+    print("{0:<18}{1:>8}{2:>12.1f}{3:>12.1f}{4:>9.1f}x".format("all", lines_total,
+                                                               separate_total / lines_total,
+                                                               fused_total / lines_total,
+                                                               separate_total / fused_total))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# coding: utf-8
+#
+# This file is part of gitinspector.
+#
+# gitinspector is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# gitinspector is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark comparing the former scans of the responsibilities queries
+# to the indexes of Changes and Blame, on synthetic histories growing
+# up to AUTHORS authors and FILES files. The former scans being
+# quadratic, they are only timed on the smaller histories. Run it from
+# the root of the repository with:
+#
+#   python -m benchmarks.responsibilities [AUTHORS [FILES]]
+
+import argparse
+import random
+import sys
+import time
+
+from gitinspector import localization
+localization.init_null()
+
+from gitinspector.blame import Blame, BlameEntry
+from gitinspector.changes import Changes, Commit
+
+# The former scans are skipped on histories with more blames than this
+FORMER_LIMIT = 50000
+AUTHORS_PER_FILE = 2
+
+
+def history(authors, files):
+    """Returns the Changes and the Blame of a synthetic history, where
+    each file is modified and blamed on AUTHORS_PER_FILE authors."""
+    config = argparse.Namespace(aliases={}, merge_authors=False)
+    random.seed(0)
+    changes = Changes.empty()
+    blame = Blame.empty()
+    for f in range(files):
+        for a in random.sample(range(authors), AUTHORS_PER_FILE):
+            committer = ("Author %d" % a, "author%d@example.com" % a)
+            commit = Commit([len(changes.__commits__), "2001-09-09",
+                             "%040x" % len(changes.__commits__)] + list(committer),
+                            config, changes.store)
+            commit.add_filediff("src/file%d.c" % f, random.randrange(100), random.randrange(10))
+            changes.__commits__.append(commit)
+            entry = BlameEntry()
+            entry.rows = random.randrange(1, 100)
+            blame.__blames__[(committer, "src/file%d.c" % f)] = entry
+    return changes, blame
+
+
+def former(changes, blame):
+    """The former scans over all the commits and all the blames."""
+    commits = changes.all_commits()
+    wrk = [((c.author, c.email), sum([f.insertions + f.deletions for f in c.filediffs]))
+           for c in commits]
+    aut = set([k[0] for k in wrk])
+    authors = sorted(aut, key=lambda a: -sum([w for (b,w) in wrk if b == a]))
+
+    blames = blame.all_blames()
+    wrk = [(k[0], v.rows) for (k, v) in blames.items()]
+    aut = set([k[0] for k in wrk])
+    committers = sorted(aut, key=lambda a: -sum([w for (b, w) in wrk if b == a]))
+    responsibilities = []
+    for committer in committers:
+        author_blames = {}
+        for i in blames.items():
+            if committer == i[0][0]:
+                total_rows = i[1].rows - i[1].comments
+                if total_rows > 0:
+                    author_blames[i[0][1]] = total_rows
+        responsibilities.append(sorted(author_blames.items()))
+    return authors, committers, responsibilities
+
+
+def indexed(changes, blame):
+    """The queries of the responsibilities and activity outputs."""
+    authors = changes.authors_by_responsibilities()
+    committers = blame.committers_by_responsibilities()
+    responsibilities = [ blame.get_responsibilities(c) for c in committers ]
+    return authors, committers, responsibilities
+
+
+def timed(function, changes, blame):
+    changes.__lookup__ = blame.__lookup__ = None
+    start = time.perf_counter()
+    result = function(changes, blame)
+    return time.perf_counter() - start, result
+
+
+def main(authors, files):
+    print("{0:>8}{1:>10}{2:>10}{3:>12}{4:>12}".format("authors", "files", "blames",
+                                                      "former", "indexed"))
+    for scale in (32, 16, 8, 4, 2, 1):
+        changes, blame = history(max(authors // scale, AUTHORS_PER_FILE), files // scale)
+        (indexed_time, result) = timed(indexed, changes, blame)
+        former_time = "-"
+        if len(blame.all_blames()) <= FORMER_LIMIT:
+            (elapsed, reference) = timed(former, changes, blame)
+            # The order of the authors with the same amount of work is arbitrary
+            assert [sorted(r) for r in reference] == [sorted(r) for r in result]
+            former_time = "{0:.2f}s".format(elapsed)
+        print("{0:>8}{1:>10}{2:>10}{3:>12}{4:>11.2f}s".format(
+            len(set(k[0] for k in blame.all_blames())), files // scale, len(blame.all_blames()),
+            former_time, indexed_time))
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [5000, 100000][len(args):]))
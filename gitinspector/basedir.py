@@ -29,45 +29,38 @@ def get_basedir():
     return os.path.dirname(os.path.realpath(__file__))
 
 def get_basedir_git(path=None):
-    previous_directory = None
-
-    if path is not None:
-        previous_directory = os.getcwd()
-        try:
-            os.chdir(path)
-        except FileNotFoundError:
-            error("%s: No such file or directory" % (path))
+    # git is run in `path` rather than changing the current directory
+    if path is not None and not os.path.isdir(path):
+        error("%s: No such file or directory" % (path))
 
     # Test if the repository is bare
     with open(os.devnull, "w") as stderr:
         bare_command = subprocess.Popen(["git", "rev-parse", "--is-bare-repository"],
-                                        bufsize=1, stdout=subprocess.PIPE, stderr=stderr)
+                                        bufsize=1, cwd=path, stdout=subprocess.PIPE, stderr=stderr)
 
         isbare = bare_command.stdout.readlines()
         bare_command.wait()
         bare_command.stdout.close()
 
     if bare_command.returncode != 0:
-        error(_("%s: Unable to process git repository." % os.getcwd()))
+        error(_("%s: Unable to process git repository." % os.path.abspath(path or os.curdir)))
 
     isbare = (isbare[0].decode("utf-8", "replace").strip() == "true")
     absolute_path = None
 
     if isbare:
-        absolute_command = subprocess.Popen(["git", "rev-parse", "--git-dir"],
-                                            bufsize=1, stdout=subprocess.PIPE)
+        absolute_command = subprocess.Popen(["git", "rev-parse", "--absolute-git-dir"],
+                                            bufsize=1, cwd=path, stdout=subprocess.PIPE)
     else:
         absolute_command = subprocess.Popen(["git", "rev-parse", "--show-toplevel"],
-                                            bufsize=1, stdout=subprocess.PIPE)
+                                            bufsize=1, cwd=path, stdout=subprocess.PIPE)
 
     absolute_path = absolute_command.stdout.readlines()
     absolute_command.wait()
     absolute_command.stdout.close()
 
     if not absolute_path:
-        error(_("%s: Unable to determine git repository absolute path." % os.getcwd()))
-
-    if path is not None:
-        os.chdir(previous_directory)
+        error(_("%s: Unable to determine git repository absolute path." %
+                os.path.abspath(path or os.curdir)))
 
     return absolute_path[0].decode("utf-8", "replace").strip()
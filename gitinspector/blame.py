@@ -17,18 +17,26 @@
 # You should have received a copy of the GNU General Public License
 # along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
 import datetime
-import multiprocessing
 import re
-import threading
+from array import array
+from collections import namedtuple
 
+from .cache import Cache
 from .changes import Commit, FileDiff, FileType
-from .filtering import Filters, is_filtered, is_acceptable_file_name
-from . import comment, format, git_utils, interval, terminal
+from .filtering import Filters, Filtering
+from . import comment, git_utils, terminal
 
-NUM_THREADS = multiprocessing.cpu_count()
 AVG_DAYS_PER_MONTH = 30.4167
 
+# The version of the blames stored in the cache
+CACHE_FORMAT = "blames-2"
+
+# The engines available to run the blame tasks: a pool of threads, or a
+# pool of processes that parse the blames outside of the GIL.
+BLAME_ENGINES = ["thread", "process"]
+
 
 class BlameEntry(object):
     """A simple record class that stores informations about a blame. All
@@ -43,110 +51,183 @@ class BlameEntry(object):
             format(self.rows, self.skew, self.comments)
 
 
-__thread_lock__ = threading.BoundedSemaphore(NUM_THREADS)
-__blame_lock__ = threading.Lock()
+__revision_pattern__ = re.compile(rb"([0-9a-f]{40}) ")
 
 
-class BlameThread(threading.Thread):
-    """A class that launches a thread counting the blames for a given
-    file. The class is supposed to be somewhat thread-safe, and can be
-    applied a multiple number of times for the same file if needed.
+class BlameTask(object):
+    """A class counting the blames for a given file, meant to be run
+    by a worker of the pool created in Blame. The task only fills its
+    own dictionary, that is returned by `run` and merged into the
+    blames by the main thread, so that no lock is needed. It only
+    keeps what it needs from the changes, so that it can be sent to
+    another process. When a `cache` is given, the rows counted for
+    each commit are stored under `cache_key`, and read from there
+    instead of running git blame when the file is met again. The
+    commits are filtered by `filtering`, that is installed by the
+    process when the task is sent to another one.
     """
-    blamechunk_author = None
-    blamechunk_email = None
-    blamechunk_is_last = False
-    blamechunk_is_prior = False
-    blamechunk_revision = None
-    blamechunk_time = None
-
-    def __init__(self, config, changes, blames, branch, filename):
-        __thread_lock__.acquire() # Lock controlling the number of threads running
-        threading.Thread.__init__(self)
-
+    def __init__(self, config, changes, branch, filename, filtering=None,
+                 cache=None, cache_key=None):
         self.config = config
+        self.filtering = filtering
         self.branch = branch
         self.useweeks = config.weeks
-        self.changes = changes
+        self.revision = changes.last_revision
+        self.location = changes.location
+        self.first_commit_date = changes.first_commit_date
+        self.last_commit_date = changes.last_commit_date
         self.extension = FileDiff.get_extension(filename)
-        self.blames = blames
+        self.blames = {}
         self.filename = filename
-
-        self.is_inside_comment = False
-
-    def __clear_blamechunk_info__(self):
-        self.blamechunk_email = None
-        self.blamechunk_is_last = False
-        self.blamechunk_is_prior = False # Checks blame's sha to be a boundary commit
-        self.blamechunk_revision = None
-        self.blamechunk_time = None
-
-    def __handle_blamechunk_content__(self, content):
-        author = None
-        (comments, self.is_inside_comment) = \
-            comment.handle_comment_block(self.is_inside_comment,
-                                         self.extension, content)
-
-        if self.blamechunk_is_prior \
+        self.cache = cache
+        self.cache_key = cache_key
+
+    def __blame_target__(self, commit):
+        """Returns the pair ((author, email), skew) to which the rows of
+        `commit` are blamed, or None if they are not counted. `commit`
+        holds the metadata read in the header of the commit.
+        """
+        time = datetime.date.fromtimestamp(commit.get("author-time", 0))
+        if commit.get("boundary", False) \
            and self.config.since \
-           and self.blamechunk_time < self.config.since.date():
-            return
-        (author, email) = Commit.get_alias(self.blamechunk_author,
-                                           self.blamechunk_email,
+           and time < self.config.since.date():
+            return None
+        (author, email) = Commit.get_alias(commit.get("author"),
+                                           commit.get("author-mail"),
                                            self.config)
 
-        if not is_filtered(author, Filters.AUTHOR) and \
-           not is_filtered(self.blamechunk_email, Filters.EMAIL) and \
-           not is_filtered(self.blamechunk_revision, Filters.REVISION):
-
-            __blame_lock__.acquire() # Global lock used to protect calls from here...
-
-            if (author, email) not in self.changes.committers:
-                self.changes.committers[(author, email)] = { "color" : "#aaaaaa",
-                                                             "committer" : False }
-
-            if self.blames.get(((author, email), self.filename), None) is None:
-                self.blames[((author, email), self.filename)] = BlameEntry()
+        if self.filtering.is_filtered(author, Filters.AUTHOR) or \
+           self.filtering.is_filtered(commit.get("author-mail"), Filters.EMAIL) or \
+           self.filtering.is_filtered(commit["revision"], Filters.REVISION):
+            return None
+
+        skew = None
+        if (time - self.first_commit_date).days > 0:
+            skew = ((self.last_commit_date - time).days /
+                    (7.0 if self.useweeks else AVG_DAYS_PER_MONTH))
+        return ((author, email), skew)
+
+    def __read_blames__(self):
+        """Returns a list of triples (commit, rows, comments) counting
+        the rows and the comments blamed to each commit of the file,
+        `commit` holding the metadata read in its header.
+        """
+        commits = {} # The metadata and the counters of the commits met so far
+        commit = None
+        is_inside_comment = False
+
+        # The porcelain format only writes the header of a commit the
+        # first time it is met: the rows are thus counted by commit, and
+        # the aliases, the filters and the dates are applied afterwards,
+        # once per commit. The rows are parsed as raw bytes, and only the
+        # fields that are kept (the author, its email and the blamed
+        # content) are decoded.
+        for row in git_utils.blames(self.revision, self.filename, self.config,
+                                    self.location):
+            if row.startswith(b"\t"):
+                (comments, is_inside_comment) = \
+                    comment.handle_comment_block(is_inside_comment, self.extension,
+                                                 git_utils.decode(row).strip())
+                commit[1] += 1
+                commit[2] += comments
+                continue
+
+            revision = __revision_pattern__.match(row)
+            if revision is not None:
+                revision = git_utils.decode(revision.group(1))
+                commit = commits.setdefault(revision, [{ "revision": revision }, 0, 0])
+            elif row.startswith(b"boundary"):
+                commit[0]["boundary"] = True
+            elif row.startswith(b"author "):
+                commit[0]["author"] = git_utils.decode(row[7:]).strip()
+            elif row.startswith(b"author-mail "):
+                commit[0]["author-mail"] = git_utils.decode(row[12:]).strip().lstrip("<").rstrip(">")
+            elif row.startswith(b"author-time "):
+                commit[0]["author-time"] = int(row[12:])
+
+        return [ tuple(c) for c in commits.values() ]
 
-            self.blames[((author, email), self.filename)].comments += comments
-            self.blames[((author, email), self.filename)].rows += 1
+    def run(self):
+        """Returns the BlameEntry objects of the file, in a hash
+        ((author, email), file) -> BlameEntry.
+        """
+        use_cache = self.cache is not None and self.cache_key is not None
+        counters = self.cache.get("blames", self.cache_key) if use_cache else None
+        if counters is None:
+            counters = self.__read_blames__()
+            if use_cache:
+                self.cache.put("blames", self.cache_key, counters)
+
+        for (commit, rows, comments) in counters:
+            target = self.__blame_target__(commit)
+            if target is None:
+                continue
+
+            (committer, skew) = target
+            entry = self.blames.get((committer, self.filename), None)
+            if entry is None:
+                entry = self.blames[(committer, self.filename)] = BlameEntry()
+
+            entry.comments += comments
+            entry.rows += rows
+            if skew is not None:
+                entry.skew += rows * skew
+
+        return self.blames
+
+
+# The filters whose filtered items may be found while blaming
+__blame_filters__ = [Filters.AUTHOR, Filters.EMAIL, Filters.REVISION]
+
+# The filtering of the tasks run by a process of the pool, installed
+# once by __init_blame_process__ rather than sent with every task
+__process_filtering__ = None
+
+def __init_blame_process__(filters):
+    """Initializes a process of the pool with the filters of the main
+    process.
+    """
+    global __process_filtering__
+    __process_filtering__ = Filtering()
+    __process_filtering__.set_filters(filters)
+
+def __run_blame_process__(task):
+    """Runs `task` in a process of the pool. The blames are returned
+    packed as a list of committers along with three arrays holding
+    their rows, comments and skews, together with the items filtered
+    while blaming.
+    """
+    task.filtering = __process_filtering__
+    filtered = { f: set(task.filtering.get_filtered(f)) for f in __blame_filters__ }
+    blames = task.run()
+    entries = list(blames.values())
+    return ([ committer for (committer, _file) in blames ],
+            array("L", [ e.rows for e in entries ]),
+            array("L", [ e.comments for e in entries ]),
+            array("d", [ e.skew for e in entries ]),
+            { f: task.filtering.get_filtered(f) - filtered[f] for f in __blame_filters__ })
+
+def __unpack_blames__(filename, packed, filtering):
+    """Returns the blames of `filename` packed by __run_blame_process__,
+    and records the items filtered by the process in `filtering`.
+    """
+    (committers, rows, comments, skews, filtered) = packed
+    for f, strings in filtered.items():
+        filtering.add_filtered(f, strings)
 
-            if (self.blamechunk_time - self.changes.first_commit_date).days > 0:
-                new_skew = ((self.changes.last_commit_date - self.blamechunk_time).days /
-                            (7.0 if self.useweeks else AVG_DAYS_PER_MONTH))
-                self.blames[((author, email), self.filename)].skew += new_skew
+    blames = {}
+    for (committer, r, c, s) in zip(committers, rows, comments, skews):
+        entry = BlameEntry()
+        (entry.rows, entry.comments, entry.skew) = (r, c, s)
+        blames[(committer, filename)] = entry
+    return blames
 
-            __blame_lock__.release() # ...to here.
 
-    def run(self):
-        rows = git_utils.blames(self.changes.last_commit().sha,
-                                self.filename, self.config)
-        self.__clear_blamechunk_info__()
-
-        #pylint: disable=W0201
-        for row in rows:
-            row = row.decode("utf-8", "replace").strip()
-            keyval = row.split(" ", 2) # array of strings
-
-            if self.blamechunk_is_last:
-                self.__handle_blamechunk_content__(row)
-                self.__clear_blamechunk_info__()
-            elif keyval[0] == "boundary":
-                self.blamechunk_is_prior = True
-            elif keyval[0] == "author":
-                self.blamechunk_author = " ".join(keyval[1:])
-            elif keyval[0] == "author-mail":
-                self.blamechunk_email = keyval[1].lstrip("<").rstrip(">")
-            elif keyval[0] == "author-time":
-                self.blamechunk_time = datetime.date.fromtimestamp(int(keyval[1]))
-            elif keyval[0] == "filename":
-                self.blamechunk_is_last = True
-            elif Blame.is_revision(keyval[0]):
-                self.blamechunk_revision = keyval[0]
-
-        __thread_lock__.release() # Lock controlling the number of threads running
+PROGRESS_TEXT = _("Checking how many rows belong to each author (2 of 2): {0:.0f}%")
 
 
-PROGRESS_TEXT = _("Checking how many rows belong to each author (2 of 2): {0:.0f}%")
+# The lookup tables of Blame, built once all the blames are read
+BlameIndex = namedtuple("BlameIndex", ["committer_blames", "file_blames", "committers_by_rows"])
 
 
 class Blame(object):
@@ -157,10 +238,12 @@ class Blame(object):
     def empty(cls):
         blame = Blame.__new__(Blame)
         blame.__blames__ = {}
+        blame.__lookup__ = None
         return blame
 
-    def __init__(self, repo, changes, config):
+    def __init__(self, repo, changes, config, context):
         self.__blames__ = {}
+        self.__lookup__ = None
         self.config = config
 
         if self.config.branch == "--all":
@@ -172,19 +255,15 @@ class Blame(object):
             times = {} # Associates files to time
             for b in branches:
                 # for f in git_utils.files(b, config):
-                for f in changes.files:
-                    if f in lines:
-                        if not(f in times):
-                            times[f] = git_utils.last_commit(lines[f], f)
-                        new_time = git_utils.last_commit(b, f)
-                        if new_time > times[f]:
-                            times[f] = new_time
-                            lines[f] = b
-                    else:
+                last_commits = git_utils.last_commits(b, config, changes.location)
+                for f in sorted(changes.files):
+                    new_time = last_commits.get(f, (0, None))[0]
+                    if not(f in lines) or new_time > times[f]:
+                        times[f] = new_time
                         lines[f] = b
         else:
             lines = {l: self.config.branch
-                     for l in git_utils.files(changes.last_commit().sha, config)}
+                     for l in git_utils.files(changes.last_revision, config, changes.location)}
 
         if lines:
             progress_text = _(PROGRESS_TEXT)
@@ -192,31 +271,66 @@ class Blame(object):
             if repo is not None:
                 progress_text = "[%s] " % repo.name + progress_text
 
-            cpt = 0
-            for filename, branch in lines.items():
-                cpt += 1
+            filtering = context.filtering
+            filenames = [ f for f in lines if filtering.is_acceptable_file_name(f) ]
+
+            # The blames of a file only depend on its contents and on the
+            # last commit modifying it, that are part of the cache keys
+            cache = Cache.create(config)
+            cache_keys = {}
+            if cache is not None:
+                blobs = git_utils.blobs(changes.last_revision, config, changes.location)
+                if config.branch == "--all" or config.prune or context.interval.has_interval():
+                    # The changes do not hold every commit up to the revision
+                    last_commits = { f: sha for (f, (_, sha)) in
+                                     git_utils.last_commits(changes.last_revision, config,
+                                                            changes.location).items() }
+                else:
+                    last_commits = changes.last_commits
+                options = ("-w" if config.ignore_space else "",
+                           "-C -C -M" if config.hard else "")
+                for f in filenames:
+                    if f in blobs and f in last_commits:
+                        cache_keys[f] = (CACHE_FORMAT, f, blobs[f], last_commits[f]) + options
+
+            if config.blame_engine == "process":
+                executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=config.jobs, initializer=__init_blame_process__,
+                    initargs=(filtering.get_filters(),))
+                (run, task_filtering) = (__run_blame_process__, None)
+            else:
+                executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.jobs)
+                (run, task_filtering) = (BlameTask.run, filtering)
 
-                if is_acceptable_file_name(filename):
-                    thread = BlameThread(config, changes, self.__blames__,
-                                         branch, filename)
-                    thread.daemon = True
-                    thread.start()
+            with executor:
+                tasks = [ executor.submit(run, BlameTask(config, changes, lines[f], f, task_filtering,
+                                                         cache, cache_keys.get(f)))
+                          for f in filenames ]
 
-                    if config.progress and format.is_interactive_format():
-                        terminal.output_progress(progress_text, cpt, len(lines))
+                # The results are merged in the order of submission, so
+                # that the committers are always added in the same order.
+                for cpt, (f, task) in enumerate(zip(filenames, tasks), 1):
+                    blames = task.result()
+                    if config.blame_engine == "process":
+                        blames = __unpack_blames__(f, blames, filtering)
 
-            # Make sure all threads have completed.
-            for i in range(0, NUM_THREADS):
-                __thread_lock__.acquire()
+                    for (committer, filename), entry in blames.items():
+                        if committer not in changes.committers:
+                            changes.committers[committer] = { "color" : "#aaaaaa",
+                                                              "committer" : False }
+                        self.__blames__[(committer, filename)] = entry
 
-            # We also have to release them for future use.
-            for i in range(0, NUM_THREADS):
-                __thread_lock__.release()
+                    if config.progress and context.is_interactive_format():
+                        terminal.output_progress(progress_text, cpt, len(tasks))
+
+            if cache is not None:
+                cache.evict()
 
     def __iadd__(self, other):
         """Concatenate lists of blames"""
         try:
             self.__blames__.update(other.__blames__)
+            self.__lookup__ = None
             return self
         except AttributeError:
             return other
@@ -240,8 +354,9 @@ class Blame(object):
 
     @staticmethod
     def get_stability(author, blamed_rows, changes):
-        if author in changes.get_authorinfo_list():
-            author_insertions = changes.get_authorinfo_list()[author].insertions
+        authorinfo = changes.get_authorinfo_list().get(author)
+        if authorinfo is not None:
+            author_insertions = authorinfo.insertions
             return 100 if author_insertions == 0 else 100.0 * blamed_rows / author_insertions
         return 100
 
@@ -249,13 +364,29 @@ class Blame(object):
         """Returns a list of all the BlameEntry objects"""
         return self.__blames__
 
+    def __get_lookup__(self):
+        """Returns the index of __blames__, built once on the first query:
+        the entries of each committer and of each file, and the
+        committers by decreasing number of rows."""
+        if self.__lookup__ is None:
+            committer_blames = {}
+            file_blames = {}
+            rows = {}
+            for (committer, file), blame in self.__blames__.items():
+                committer_blames.setdefault(committer, []).append((file, blame))
+                file_blames.setdefault(file, []).append((committer, blame))
+                rows[committer] = rows.get(committer, 0) + blame.rows
+            self.__lookup__ = BlameIndex(committer_blames, file_blames,
+                                         sorted(rows, key=lambda c: -rows[c]))
+        return self.__lookup__
+
     def blames_for_file(self, file):
         """Returns a list of pairs ((author,email),num) that counts the blames
         for a given file
 
         Ex. : [(('Frodo Baggins', 'frodo.baggins@shire.net'), 8)]"""
-        return [(c[0], self.__blames__[c].rows)
-                for c in self.__blames__ if c[1] == file]
+        return [(committer, blame.rows)
+                for (committer, blame) in self.__get_lookup__().file_blames.get(file, [])]
 
     def get_summed_blames(self):
         """Returns a hash where keys are (author,email) and values are
@@ -293,11 +424,7 @@ class Blame(object):
     def committers_by_responsibilities(self):
         """Sorts the (author,email) in __blames__ by decreasing order of
         responsibility."""
-        wrk = [(k[0], v.rows) for (k, v) in self.__blames__.items()]
-        aut = set([k[0] for k in wrk])
-        res = sorted(aut,
-                     key=lambda a: -sum([w for (b, w) in wrk if b == a]))
-        return res
+        return list(self.__get_lookup__().committers_by_rows)
 
     def get_responsibilities(self, committer):
         """Returns the list of blames of a given (author,email) where each
@@ -306,10 +433,9 @@ class Blame(object):
         Ex. : [('Makefile',20), ('include/trie.h',5), ('src/Makefile',22)]"""
         author_blames = {}
 
-        for i in self.__blames__.items():
-            if committer == i[0][0]:
-                total_rows = i[1].rows - i[1].comments
-                if total_rows > 0:
-                    author_blames[i[0][1]] = total_rows
+        for (file, blame) in self.__get_lookup__().committer_blames.get(committer, []):
+            total_rows = blame.rows - blame.comments
+            if total_rows > 0:
+                author_blames[file] = total_rows
 
         return sorted(author_blames.items())
@@ -0,0 +1,207 @@
+# coding: utf-8
+#
+# Copyright © 2012-2017 Ejwa Software. All rights reserved.
+#
+# This file is part of gitinspector.
+#
+# gitinspector is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# gitinspector is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Maximum size of the cache on disk, in bytes
+CACHE_SIZE = 256 * 1024 * 1024
+
+# Maximum number of items in each part of a stream
+STREAM_PART_SIZE = 4096
+
+
+def default_directory():
+    """Returns the directory where the cache is stored by default,
+    following the XDG conventions.
+    """
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(root, "gitinspector")
+
+
+class Cache(object):
+    """A persistent cache storing picklable values on disk, one file per
+    key, the keys being tuples of strings. The entries are grouped by
+    namespace, and the least recently used ones are evicted when the
+    cache grows bigger than `max_size` bytes. The cache never fails: an
+    entry that cannot be read or written is simply missing (except for
+    the streams, cf. get_stream). It can be shared by several threads
+    or processes.
+    """
+    def __init__(self, directory, max_size=CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def create(config):
+        """Returns the cache selected by the configuration, or None if
+        the cache is disabled.
+        """
+        if config.no_cache:
+            return None
+        return Cache(config.cache_dir or default_directory())
+
+    def __path__(self, namespace, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, namespace, digest[0:2], digest)
+
+    def get(self, namespace, key):
+        """Returns the value associated to `key`, or None if there is no
+        such value in the cache.
+        """
+        path = self.__path__(namespace, key)
+        try:
+            with open(path, "rb") as entry:
+                (entry_key, value) = pickle.load(entry)
+            os.utime(path) # Marks the entry as recently used
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        return value if entry_key == key else None
+
+    def __open_temporary__(self, namespace, key):
+        """
+        Returns an opened temporary file, next to the entry of `key`,
+        along with the paths of the temporary file and of the entry.
+        """
+        path = self.__path__(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        (handle, temporary) = tempfile.mkstemp(dir=os.path.dirname(path))
+        return (os.fdopen(handle, "wb"), temporary, path)
+
+    @staticmethod
+    def __discard__(temporary):
+        (entry, temporary_path, _path) = temporary
+        try:
+            entry.close()
+            os.remove(temporary_path)
+        except OSError:
+            pass
+
+    def put(self, namespace, key, value):
+        """Associates `value` to `key`. The entry is written to a
+        temporary file that is then renamed, so that a concurrent reader
+        never sees a partial entry.
+        """
+        try:
+            temporary = self.__open_temporary__(namespace, key)
+            try:
+                with temporary[0] as entry:
+                    pickle.dump((key, value), entry, pickle.HIGHEST_PROTOCOL)
+                os.replace(temporary[1], temporary[2])
+            except BaseException:
+                self.__discard__(temporary)
+                raise
+        except OSError:
+            pass
+
+    def put_stream(self, namespace, key, items, part_size=STREAM_PART_SIZE):
+        """
+        Generates the `items`, while storing them in the parts key + (0,),
+        key + (1,)... of at most `part_size` items each, so that no entry
+        grows with the length of the stream. Each part is written to a
+        temporary file renamed once it is complete. Returns the number of
+        parts, or None if the stream could not be stored.
+        """
+        (parts, count, temporary, stored) = (0, 0, None, True)
+        try:
+            for item in items:
+                if stored:
+                    try:
+                        if temporary is None:
+                            temporary = self.__open_temporary__(namespace, key + (parts,))
+                            pickle.dump(key + (parts,), temporary[0], pickle.HIGHEST_PROTOCOL)
+                        pickle.dump(item, temporary[0], pickle.HIGHEST_PROTOCOL)
+                        count += 1
+                        if count == part_size:
+                            (temporary, parts, count) = (self.__close_part__(temporary), parts + 1, 0)
+                    except OSError:
+                        stored = False
+                yield item
+            if stored and temporary is not None:
+                try:
+                    (temporary, parts) = (self.__close_part__(temporary), parts + 1)
+                except OSError:
+                    stored = False
+        finally:
+            if temporary is not None:
+                self.__discard__(temporary)
+        return parts if stored else None
+
+    def __close_part__(self, temporary):
+        """Ends a part of a stream, and moves it to its entry."""
+        pickle.dump(None, temporary[0], pickle.HIGHEST_PROTOCOL)
+        temporary[0].close()
+        os.replace(temporary[1], temporary[2])
+        return None
+
+    def has_stream(self, namespace, key, parts):
+        """
+        Returns True iff the `parts` of the stream stored by put_stream
+        are all in the cache, marking them as recently used so that they
+        are evicted last.
+        """
+        try:
+            for number in range(parts):
+                os.utime(self.__path__(namespace, key + (number,)))
+        except OSError:
+            return False
+        return True
+
+    def get_stream(self, namespace, key, parts):
+        """
+        Generates the items of the stream stored by put_stream, reading
+        one item at a time. Unlike get, it raises an error (OSError,
+        pickle.UnpicklingError...) if a part vanishes or is corrupted,
+        since some items may have been generated already: has_stream
+        tells beforehand whether the stream is complete.
+        """
+        for number in range(parts):
+            with open(self.__path__(namespace, key + (number,)), "rb") as entry:
+                if pickle.load(entry) != key + (number,):
+                    raise pickle.UnpicklingError("unexpected key in the cache")
+                item = pickle.load(entry)
+                while item is not None:
+                    yield item
+                    item = pickle.load(entry)
+
+    def evict(self):
+        """Removes the least recently used entries, until the cache fits
+        in its maximum size.
+        """
+        entries = []
+        for (directory, _dirs, files) in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(e[1] for e in entries)
+        for (_mtime, entry_size, path) in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
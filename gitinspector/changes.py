@@ -17,13 +17,16 @@
 # You should have received a copy of the GNU General Public License
 # along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
 
-import bisect
-import copy
 import datetime
+import heapq
 import os
-import re
-from .filtering import Filters, is_filtered, is_acceptable_file_name
-from . import format, git_utils, interval
+from collections import namedtuple
+from array import array
+from operator import attrgetter
+from types import MappingProxyType
+from .filtering import Filters, Filtering
+from . import format, git_utils
+from .cache import Cache
 from enum import Enum, auto
 
 
@@ -114,7 +117,8 @@ class FileType(Enum):
 
 class AuthorColors(object):
     """
-    A class providing different colors for the authors
+    A class providing different colors for the authors, each instance
+    giving them in turn
     """
     colors =  [
         "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
@@ -124,63 +128,167 @@ class AuthorColors(object):
         "#b41f77", "#0eff7f", "#2c2ca0", "#28d627", "#bd9467",
         "#4b8c56", "#c2e377", "#22bcbd", "#cf17be",
     ]
-    index = -1
 
-    @staticmethod
-    def get_new_color():
-        AuthorColors.index += 1
-        return AuthorColors.colors[AuthorColors.index % len(AuthorColors.colors)]
+    def __init__(self):
+        self.index = -1
 
+    def get_new_color(self):
+        self.index += 1
+        return AuthorColors.colors[self.index % len(AuthorColors.colors)]
 
-class FileDiff(object):
-    def __init__(self, name, line):
-        commit_line = line.split("|")
 
-        if commit_line.__len__() == 2:
-            self.name = name
-            if is_acceptable_file_name(self.name):
-                self.type = FileType.create(self.name)
+class ChangeStore(object):
+    """
+    The compact storage of the commits read in a run: the authors, the
+    emails, the dates and the paths are interned into integer ids, and
+    the commits and their file diffs are stored column by column in
+    arrays. Commit and FileDiff are thin views on these columns. The
+    types of the files are given according to `filtering`.
+    """
+    def __init__(self, filtering=None):
+        self.filtering = Filtering() if filtering is None else filtering
+        self.symbols = {}
+        self.strings = []
+        # The columns of the commits
+        self.timestamps = array("q")
+        self.shas = []
+        self.authors = array("L")
+        self.emails = array("L")
+        self.dates = array("L")
+        self.commit_types = array("B")
+        self.first_diffs = array("L")
+        # The columns of the file diffs
+        self.commits = array("L")
+        self.paths = array("L")
+        self.insertions = array("L")
+        self.deletions = array("L")
+        self.file_types = array("B")
+        self.__path_types__ = {}
+
+    def intern(self, string):
+        """Returns the id of `string` in the symbol table."""
+        symbol = self.symbols.get(string)
+        if symbol is None:
+            symbol = self.symbols[string] = len(self.strings)
+            self.strings.append(string)
+        return symbol
+
+    def add_commit(self, timestamp, date, sha, author, email):
+        """Adds a commit without file diffs, and returns its index."""
+        self.timestamps.append(timestamp)
+        self.shas.append(sha)
+        self.authors.append(self.intern(author))
+        self.emails.append(self.intern(email))
+        self.dates.append(self.intern(date))
+        self.commit_types.append(0)
+        self.first_diffs.append(len(self.paths))
+        return len(self.shas) - 1
+
+    def add_filediff(self, commit, name, insertions, deletions):
+        """Adds a file diff to the last commit added, and returns its
+        index."""
+        if commit != len(self.shas) - 1:
+            raise ValueError("File diffs can only be added to the last commit of the store")
+        path = self.intern(name)
+        file_type = self.__path_types__.get(path)
+        if file_type is None:
+            if self.filtering.is_acceptable_file_name(name):
+                file_type = FileType.create(name).value
             else:
-                self.type = FileType.OTHER
-            self.insertions = commit_line[1].count("+")
-            self.deletions = commit_line[1].count("-")
+                file_type = FileType.OTHER.value
+            self.__path_types__[path] = file_type
+        self.commits.append(commit)
+        self.paths.append(path)
+        self.insertions.append(insertions)
+        self.deletions.append(deletions)
+        self.file_types.append(file_type)
+        return len(self.paths) - 1
+
+    def diffs_range(self, commit):
+        """Returns the range of the indexes of the file diffs of
+        `commit`."""
+        if commit + 1 < len(self.first_diffs):
+            return range(self.first_diffs[commit], self.first_diffs[commit + 1])
+        return range(self.first_diffs[commit], len(self.paths))
+
+
+class FileDiff(object):
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def name(self):
+        return self.store.strings[self.store.paths[self.index]]
+
+    @property
+    def insertions(self):
+        return self.store.insertions[self.index]
+
+    @property
+    def deletions(self):
+        return self.store.deletions[self.index]
+
+    @property
+    def type(self):
+        return FileType(self.store.file_types[self.index])
 
     def __repr__(self):
         return "FileDiff(name: \033[93m{0}\033[0m, ins: \033[92m{1}\033[0m, del: \033[91m{2}\033[0m)".\
             format(self.name, self.insertions, self.deletions)
 
-    @staticmethod
-    def is_filediff_line(string):
-        pattern = re.compile("^[^\|]+\|[ ]*(Bin[ ].*|[0-9]+[ ]*[+-]*)$")
-        return pattern.match(string) is not None
-
     @staticmethod
     def get_extension(string):
         string = string.split("|")[0].strip().strip("{}").strip("\"").strip("'")
         return os.path.splitext(string)[1][1:]
 
-    @staticmethod
-    def get_filename(string):
-        file_name = string.split("|")[0].strip()
-        file_name = re.sub(r"^(.*)\{([^\}]*) => ([^\}]*)\}(.*)$", r"\1\3\4", file_name)
-        file_name = re.sub(r"^(.*) => (.*)$", r"\2", file_name)
-        file_name = file_name.strip("{}").strip("\"").strip("'")
-        return file_name
+
+# The commit types, indexed by their code in ChangeStore.commit_types
+__commit_types__ = [ None ] + list(CommitType)
 
 
 class Commit(object):
-    def __init__(self, string, config):
-        self.filediffs = []
-        self.config = config
-        commit_line = string.split("|")
+    __slots__ = ("store", "index")
+
+    def __init__(self, header, config, store=None):
+        (timestamp, date, sha, author, email) = header
+        (author, email) = Commit.get_alias(author.strip(), email.strip(), config)
+        self.store = ChangeStore() if store is None else store
+        self.index = self.store.add_commit(int(timestamp), date, sha, author, email)
+
+    @property
+    def timestamp(self):
+        return self.store.timestamps[self.index]
+
+    @property
+    def date(self):
+        return self.store.strings[self.store.dates[self.index]]
 
-        if commit_line.__len__() == 5:
-            self.timestamp = commit_line[0]
-            self.date = commit_line[1]
-            self.sha = commit_line[2]
-            author = commit_line[3].strip()
-            email = commit_line[4].strip()
-            (self.author, self.email) = Commit.get_alias(author, email, self.config)
+    @property
+    def sha(self):
+        return self.store.shas[self.index]
+
+    @property
+    def author(self):
+        return self.store.strings[self.store.authors[self.index]]
+
+    @property
+    def email(self):
+        return self.store.strings[self.store.emails[self.index]]
+
+    @property
+    def type(self):
+        return __commit_types__[self.store.commit_types[self.index]]
+
+    @type.setter
+    def type(self, commit_type):
+        self.store.commit_types[self.index] = __commit_types__.index(commit_type)
+
+    @property
+    def filediffs(self):
+        return [ FileDiff(self.store, i) for i in self.store.diffs_range(self.index) ]
 
     def __lt__(self, other): # only used for sorting; we just consider the timestamp.
         return self.timestamp.__lt__(other.timestamp)
@@ -193,48 +301,45 @@ class Commit(object):
             return "Commit(sha: {0}, author: {1} <{2}>, diffs: {3})".\
                 format(self.sha[0:8], self.author, self.email, self.filediffs)
 
-    def add_filediff(self, filediff):
-        self.filediffs.append(filediff)
+    def add_filediff(self, name, insertions, deletions):
+        self.store.add_filediff(self.index, name, insertions, deletions)
 
     def get_filediffs(self):
         return self.filediffs
 
     @staticmethod
-    def handle_diff_chunk(config, changes, commits, chunk):
-        commit_line = chunk.pop(0).strip().\
-            decode("unicode_escape", "ignore").\
-            encode("latin-1", "replace").\
-            decode("utf-8", "replace")
-        (author, email) = Commit.get_author_and_email(config, changes, commit_line)
-        if (author, email) not in changes.committers:
-            changes.committers[(author, email)] = {
-                "color": AuthorColors.get_new_color() }
-        found_valid_extension = False
-        commit = Commit(commit_line, config)
-        has_been_filtered = (is_filtered(commit.author, Filters.AUTHOR) or \
-                             is_filtered(commit.email,  Filters.EMAIL) or \
-                             is_filtered(commit.sha,    Filters.REVISION) or \
-                             is_filtered(commit.sha,    Filters.MESSAGE))
+    def handle_diff_chunk(config, context, changes, commits, chunk):
+        header = [ git_utils.decode(f) for f in chunk[0] ]
+        message = header.pop()
+        commit = Commit(header, config, changes.store)
+        filtering = context.filtering
+        if filtering.has_filters(Filters.MESSAGE):
+            filtering.add_message(commit.sha, message)
+        if (commit.author, commit.email) not in changes.committers:
+            changes.committers[(commit.author, commit.email)] = {
+                "color": context.colors.get_new_color() }
+        has_been_filtered = (filtering.is_filtered(commit.author, Filters.AUTHOR) or \
+                             filtering.is_filtered(commit.email,  Filters.EMAIL) or \
+                             filtering.is_filtered(commit.sha,    Filters.REVISION) or \
+                             filtering.is_filtered(commit.sha,    Filters.MESSAGE, changes.location))
+
+        file_names = [ git_utils.decode(path) for (_, _, path) in chunk[1:] ]
+        # The last commit modifying each file, filtered or not, is part of
+        # the cache keys of the blames
+        for file_name in file_names:
+            changes.last_commits[file_name] = commit.sha
 
         if has_been_filtered:
             commit.type = CommitType.FILTERED
-        elif not chunk: # Chunk is [], it is a pure merge
+        elif len(chunk) == 1: # Chunk only holds the header, it is a pure merge
             commit.type = CommitType.MERGE
         else:
-            commit.type = CommitType.FILTERED # if all files are filtered
-            for line in chunk:
-                line = line.strip().\
-                    decode("unicode_escape", "ignore").\
-                    encode("latin-1", "replace").\
-                    decode("utf-8", "replace")
-                if FileDiff.is_filediff_line(line):
-                    file_name = FileDiff.get_filename(line)
-                    changes.files.add(file_name)
-                    filediff = FileDiff(file_name, line)
-                    commit.add_filediff(filediff)
-                    commit.type = CommitType.CODE
-
-        bisect.insort(commits, commit)
+            commit.type = CommitType.CODE
+            for (file_name, (insertions, deletions, _)) in zip(file_names, chunk[1:]):
+                changes.files.add(file_name)
+                commit.add_filediff(file_name, insertions, deletions)
+
+        commits.append(commit)
 
     @staticmethod
     def get_alias(author, email, config):
@@ -246,19 +351,16 @@ class Commit(object):
                 config.aliases[email] = "{0} <{1}>".format(author, email)
             return (author, email)
 
-    @staticmethod
-    def get_author_and_email(config, changes, string):
-        commit_line = string.split("|")
-        try:
-            author = commit_line[3].strip()
-            email = commit_line[4].strip()
-            (real_author, real_email) = Commit.get_alias(author, email, config)
-            return (real_author, real_email)
-        except IndexError:
-            return "Unknown Author"
-
 
 class AuthorInfo(object):
+    """
+    The insertions, deletions and commits of an author, along with the
+    changes by file type. The AuthorInfos returned by Changes are
+    frozen and shared between the callers: copy() returns a mutable
+    copy.
+    """
+    __slots__ = ("insertions", "deletions", "commits", "types", "frozen")
+
     def __init__(self):
         # self.email = None
         self.insertions = 0
@@ -266,10 +368,36 @@ class AuthorInfo(object):
         self.commits = 0
         self.types = { FileType.OTHER: set() }
 
+    def __setattr__(self, name, value):
+        if getattr(self, "frozen", False):
+            raise AttributeError("AuthorInfo is read-only, modify a copy() instead")
+        object.__setattr__(self, name, value)
+
     def __repr__(self):
         return "Info(ins: \033[92m{0}\033[0m, del: \033[91m{1}\033[0m, commits: {2})".\
             format(self.insertions, self.deletions, self.commits)
 
+    def freeze(self):
+        self.types = MappingProxyType({ k: frozenset(v) if k == FileType.OTHER else v
+                                        for (k, v) in self.types.items() })
+        self.frozen = True
+
+    def copy(self):
+        info = AuthorInfo()
+        info.insertions = self.insertions
+        info.deletions = self.deletions
+        info.commits = self.commits
+        info.types = { k: set(v) if k == FileType.OTHER else v
+                       for (k, v) in self.types.items() }
+        return info
+
+
+# The lookup tables of Changes, built once all the commits are read
+ChangesIndex = namedtuple("ChangesIndex", ["author_commits", "file_diffs", "authors_by_work"])
+
+
+# The version of the chunks stored in the cache
+CACHE_FORMAT = "changes-2"
 
 PROGRESS_TEXT = _("Fetching and calculating primary statistics (1 of 2): {0:.0f}%")
 
@@ -284,34 +412,71 @@ class Changes(object):
         changes.authors_dateinfo = {}
         changes.committers = {}
         changes.files = set()
+        changes.last_commits = {}
+        changes.last_revision = None
+        changes.ref = "HEAD"
+        changes.location = None
+        changes.store = ChangeStore()
+        changes.__lookup__ = None
         return changes
 
-    def __init__(self, repo, config):
+    def __init__(self, repo, config, context, location=None):
         self.__commits__ = []
         self.authors = {}
         self.authors_dateinfo = {}
         self.committers = {}
         self.files = set()
+        self.last_commits = {}    # The SHA of the last commit modifying each file
+        self.last_revision = None # The revision on which the blames are computed
+        self.ref = "HEAD"         # The revision on which the metrics are computed
+        self.location = location  # The repository, the current directory if None
+        self.store = ChangeStore(context.filtering)
+        self.__lookup__ = None
         self.config = config
-
-        interval.set_ref("HEAD")
+        (filtering, interval) = (context.filtering, context.interval)
 
         progress_text = _(PROGRESS_TEXT)
         if repo is not None:
             progress_text = "[%s] " % repo.name + progress_text
 
-        chunks =  git_utils.commit_chunks(self.config.branch, \
-                                          interval.get_since(), interval.get_until(), \
-                                          self.config)
+        options = []
+        if self.config.prune:
+            # Let git drop the filtered commits, the dropped messages still
+            # filtering the revisions in the blames. The files are still
+            # filtered here: git would no longer see the renames between an
+            # accepted and a filtered path, but a deletion or an addition.
+            renamed_authors = self.config.aliases or self.config.merge_authors or \
+                git_utils.has_mailmap(location)
+            options, grep_options = filtering.get_git_log_options(git_utils.has_perl_regexp(location),
+                                                                  renamed_authors)
+            # The most recent commit may have been dropped by git
+            self.last_revision = next(iter(git_utils.commits(self.config.branch,
+                                                             interval.get_since(),
+                                                             interval.get_until(),
+                                                             ["--max-count=1"], location)), None)
+            if self.last_revision is not None:
+                self.last_revision = git_utils.decode(self.last_revision)
+            if grep_options:
+                filtering.add_filtered(Filters.REVISION,
+                    [ git_utils.decode(sha) for sha in
+                      git_utils.commits(self.config.branch, interval.get_since(),
+                                        interval.get_until(), grep_options, location) ])
 
         commits = []
-        for chunk in chunks:
-            Commit.handle_diff_chunk(self.config, self, commits, chunk)
+        for chunk in self.__chunks__(interval, filtering, options):
+            Commit.handle_diff_chunk(self.config, context, self, commits, chunk)
+
+        # git log --reverse already yields the commits by increasing
+        # timestamps, except for clock skews: the stable sort is then
+        # linear, and keeps the order of git for equal timestamps.
+        commits.sort(key=attrgetter("timestamp"))
         self.__commits__ = commits
 
         if self.__commits__:
+            if self.last_revision is None:
+                self.last_revision = self.__commits__[-1].sha
             if interval.has_interval(): # or self.config.branch != "master":
-                interval.set_ref(self.__commits__[-1].sha)
+                self.ref = self.last_revision
 
             self.first_commit_date = datetime.date(int(self.__commits__[0].date[0:4]),
                                                    int(self.__commits__[0].date[5:7]),
@@ -320,27 +485,77 @@ class Changes(object):
                                                   int(self.__commits__[-1].date[5:7]),
                                                   int(self.__commits__[-1].date[8:10]))
 
+    def __chunks__(self, interval, filtering, options):
+        """
+        Generates the raw chunks of the commits, as read by
+        git_utils.commit_chunks. The chunks are stored in the cache by
+        ranges of commits, along with an index of the tips at the end of
+        each range: on the next run, the stored ranges are read back one
+        chunk at a time, and only the commits since the last tips are
+        read from git (and stored while they are read as a new range),
+        unless the history has been rewritten in between.
+        """
+        (since, until) = (interval.get_since(), interval.get_until())
+        messages = filtering.has_filters(Filters.MESSAGE)
+        cache = Cache.create(self.config)
+        if cache is None:
+            yield from git_utils.commit_chunks(self.config.branch, since, until,
+                                               self.config, messages, options,
+                                               location=self.location)
+            return
+
+        # The raw chunks do not depend on the filters nor on the aliases
+        key = (CACHE_FORMAT, self.location or os.getcwd(), self.config.branch, since, until, messages,
+               self.config.ignore_space, self.config.hard) + tuple(options)
+        tips = git_utils.tips(self.config.branch, self.location)
+        index = cache.get("changes", key) or []
+        if index and not all(t in tips or any(git_utils.is_ancestor(t, n, self.location) for n in tips)
+                             for t in index[-1][0]):
+            index = [] # Rewritten history
+
+        # Each range holds the commits since the tips of the previous one,
+        # the ranges following an evicted one being read again
+        (ranges, old_tips) = ([], [])
+        for (range_tips, parts) in index:
+            range_key = key + (tuple(old_tips), tuple(range_tips))
+            if not cache.has_stream("changes", range_key, parts):
+                break
+            ranges.append((range_key, parts))
+            old_tips = range_tips
+
+        for (range_key, parts) in ranges:
+            yield from cache.get_stream("changes", range_key, parts)
+        if old_tips != tips:
+            new_chunks = git_utils.commit_chunks(self.config.branch, since, until,
+                                                 self.config, messages, options,
+                                                 old_tips, self.location)
+            parts = yield from cache.put_stream("changes", key + (tuple(old_tips), tuple(tips)),
+                                                new_chunks)
+            if parts is not None:
+                cache.put("changes", key, index[0:len(ranges)] + [(tips, parts)])
+
     def __repr__(self):
         comm_str = "\n".join([ str(s) for s in self.__commits__ ])
         return "Changes(commits: {0})\n{1}".format(len(self.__commits__),
                                                    comm_str)
 
-    def __iadd__(self, other):
-        try:
-            self.authors.update(other.authors)
-            self.authors_dateinfo.update(other.authors_dateinfo)
-            self.committers.update(other.committers)
-
-            for commit in other.__commits__:
-                bisect.insort(self.__commits__, commit)
-            if not self.__commits__ and not other.__commits__:
-                self.__commits__ = []
-
-            self.changes.files.update(other.files)
+    @classmethod
+    def merge(cls, changes_list):
+        """
+        Returns the Changes gathering the commits of all the Changes in
+        `changes_list`, merged by timestamps in a single pass (the
+        commits with equal timestamps keeping the order of the list).
+        """
+        changes = Changes.empty()
+        for other in changes_list:
+            changes.committers.update(other.committers)
+            changes.files.update(other.files)
+        changes.__commits__ = list(heapq.merge(*[ other.__commits__ for other in changes_list ],
+                                               key=attrgetter("timestamp")))
+        return changes
 
-            return self
-        except AttributeError:
-            return other
+    def __iadd__(self, other):
+        return Changes.merge([self, other])
 
     def __update_dict_commit__(self, dict, key, commit):
         """
@@ -377,8 +592,29 @@ class Changes(object):
     def merge_commits(self):
         return [c for c in self.__commits__ if c.type == CommitType.MERGE]
 
+    def __get_lookup__(self):
+        """
+        Returns the index of the commits, built once on the first query:
+        the commits of each author, the diffs of each file, and the
+        authors by decreasing amount of work.
+        """
+        if self.__lookup__ is None:
+            author_commits = {}
+            file_diffs = {}
+            work = {}
+            for c in self.__commits__:
+                author_commits.setdefault(c.author, []).append(c)
+                commit_work = 0
+                for d in c.filediffs:
+                    file_diffs.setdefault(d.name, []).append(d)
+                    commit_work += d.insertions + d.deletions
+                work[(c.author, c.email)] = work.get((c.author, c.email), 0) + commit_work
+            self.__lookup__ = ChangesIndex(author_commits, file_diffs,
+                                          sorted(work, key=lambda a: -work[a]))
+        return self.__lookup__
+
     def commits_for_author(self, author):
-        return [c for c in self.__commits__ if c.author == author]
+        return list(self.__get_lookup__().author_commits.get(author, []))
 
     def first_commit(self):
         return self.__commits__[0]
@@ -387,18 +623,25 @@ class Changes(object):
         return self.__commits__[-1]
 
     def diffs_for_file(self, file):
-        return [d for c in self.__commits__ for d in c.filediffs if d.name == file]
+        return list(self.__get_lookup__().file_diffs.get(file, []))
 
     def get_authorinfo_list(self):
         """
-        Returns a hash associating authors to AuthorInfo objects,
-        technically a number of insertions, deletions and commits.
+        Returns a read-only hash associating authors to frozen AuthorInfo
+        objects, technically a number of insertions, deletions and
+        commits. The hash is computed once and shared between the
+        callers.
         """
         if not self.authors:
+            # Built aside, as several outputs may be rendered concurrently
+            authors = {}
             for i in self.__commits__:
-                self.__update_dict_commit__(self.authors, (i.author, i.email), i)
+                self.__update_dict_commit__(authors, (i.author, i.email), i)
+            for info in authors.values():
+                info.freeze()
+            self.authors = authors
 
-        return copy.deepcopy(self.authors)
+        return MappingProxyType(self.authors)
 
     def get_total_types(self):
         author_list = self.get_authorinfo_list()
@@ -409,26 +652,26 @@ class Changes(object):
 
     def get_authordateinfo_list(self):
         """
-        Returns a hash associating (authors * dates) to AuthorInfo objects.
-        Basically splits the return of get_authorinfo_list() on the dates.
+        Returns a read-only hash associating (authors * dates) to frozen
+        AuthorInfo objects. Basically splits the return of
+        get_authorinfo_list() on the dates.
         """
         if not self.authors_dateinfo:
+            authors_dateinfo = {}
             for i in self.__commits__:
-                self.__update_dict_commit__(self.authors_dateinfo, (i.date, (i.author, i.email)), i)
+                self.__update_dict_commit__(authors_dateinfo, (i.date, (i.author, i.email)), i)
+            for info in authors_dateinfo.values():
+                info.freeze()
+            self.authors_dateinfo = authors_dateinfo
 
-        return copy.deepcopy(self.authors_dateinfo)
+        return MappingProxyType(self.authors_dateinfo)
 
     def authors_by_responsibilities(self):
         """
         Returns a list of authors sorted according to their amount of
         work, namely the sum of their insertions and deletions.
         """
-        wrk = [((c.author, c.email), sum([f.insertions + f.deletions for f in c.filediffs]))
-               for c in self.__commits__]
-        aut = set([k[0] for k in wrk])
-        res = sorted(aut,
-                     key=lambda a: -sum([w for (b,w) in wrk if b == a]))
-        return res
+        return list(self.__get_lookup__().authors_by_work)
 
     def filtered_files(self, author):
         """
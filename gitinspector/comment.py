@@ -79,6 +79,17 @@ def is_comment(extension, string):
 
     return False
 
+def get_comment_markers(extension):
+    """
+    Returns the markers of the comments in the files with the given
+    extension: the beginning and the end of the comment blocks, the
+    beginning of the line comments (None when the language does not have
+    them), and whether the markers of the blocks must begin the lines.
+    """
+    return (__comment_begining__.get(extension, None), __comment_end__.get(extension, None),
+            __comment__.get(extension, None),
+            bool(__comment_markers_must_be_at_begining__.get(extension, None)))
+
 def handle_comment_block(is_inside_comment, extension, content):
     comments = 0
 
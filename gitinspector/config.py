@@ -19,7 +19,8 @@
 
 import ast
 import os
-from . import filtering, format, git_utils, interval
+from . import format, git_utils
+from .blame import BLAME_ENGINES
 
 
 class GitConfig(object):
@@ -51,14 +52,14 @@ class GitConfig(object):
         if var[0]:
             self.run.config.file_types = var[1]
             for f in var[1].split(','):
-                filtering.__add_one_filter__(f)
+                self.run.context.filtering.__add_one_filter__(f)
 
         var = self.__read_git_config_string__("exclude")
         if var[0]:
-            filtering.add_filters(var[1])
+            self.run.context.filtering.add_filters(var[1])
 
         var = self.__read_git_config_string__("format")
-        if var[0] and not format.select(var[1]):
+        if var[0] and not format.is_available(var[1]):
             raise format.InvalidFormatError(_("specified output format not supported."))
 
         var = self.__read_git_config_string__("aliases")
@@ -67,12 +68,34 @@ class GitConfig(object):
 
         if self.__read_git_config_bool__("hard"):
             self.run.config.hard = True
+        var = self.__read_git_config_string__("blame-engine")
+        if var[0] and var[1] in BLAME_ENGINES:
+            self.run.config.blame_engine = var[1]
+
+        var = self.__read_git_config_string__("cache-dir")
+        if var[0]:
+            self.run.config.cache_dir = var[1]
+        if self.__read_git_config_bool__("no-cache"):
+            self.run.config.no_cache = True
+        if self.__read_git_config_bool__("no-blame"):
+            self.run.config.no_blame = True
+
+        var = self.__read_git_config_string__("only")
+        if var[0]:
+            self.run.config.only = var[1].split(",")
+
+        var = self.__read_git_config_string__("jobs")
+        if var[0] and var[1].isdigit() and int(var[1]) > 0:
+            self.run.config.jobs = int(var[1])
+
         if self.__read_git_config_bool__("list-file-types"):
             self.run.config.list_file_types = True
         if self.__read_git_config_bool__("localize-output"):
             self.run.config.localize_output = True
         if self.__read_git_config_bool__("metrics"):
             self.run.config.metrics = True
+        if self.__read_git_config_bool__("prune"):
+            self.run.config.prune = True
         if self.__read_git_config_bool__("responsibilities"):
             self.run.config.responsibilities = True
         if self.__read_git_config_bool__("weeks"):
@@ -80,11 +103,11 @@ class GitConfig(object):
 
         var = self.__read_git_config_string__("since")
         if var[0]:
-            interval.set_since(var[1])
+            self.run.context.interval.set_since(var[1])
 
         var = self.__read_git_config_string__("until")
         if var[0]:
-            interval.set_until(var[1])
+            self.run.context.interval.set_until(var[1])
 
         if self.__read_git_config_bool__("timeline"):
             self.run.config.timeline = True
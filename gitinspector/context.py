@@ -0,0 +1,41 @@
+# coding: utf-8
+#
+# Copyright © 2012-2017 Ejwa Software. All rights reserved.
+#
+# This file is part of gitinspector.
+#
+# gitinspector is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# gitinspector is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
+
+from .changes import AuthorColors
+from .filtering import Filtering
+from .interval import Interval
+from . import format
+
+
+class Context(object):
+    """
+    The state of an analysis: its filters, the bounds on the dates of
+    its commits, its output formats and the colors given to its authors.
+    The context is owned by a Runner, and passed to the objects that
+    compute and output the analysis, so that several analyses can run
+    concurrently in the same process.
+    """
+    def __init__(self, formats=None):
+        self.filtering = Filtering()
+        self.interval = Interval()
+        self.formats = list(formats or [format.DEFAULT_FORMAT])
+        self.colors = AuthorColors()
+
+    def is_interactive_format(self):
+        return format.is_interactive_format(self.formats)
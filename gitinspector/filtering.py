@@ -18,13 +18,11 @@
 # along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
 
 import fnmatch
+import functools
 import re
 from . import git_utils
 from enum import Enum
 
-# TODO: We definitely need to rewrite the 'filtering' module to be part
-# of the Runner context and NOT BEING GLOBAL! (for our own sake!)...
-
 class Filters(Enum):
     """
     An enumeration class representing the different filter types
@@ -36,122 +34,310 @@ class Filters(Enum):
     REVISION = "revision"
     MESSAGE  = "message"
 
-__filters__ = {
-    Filters.FILE_IN:  [set(), set()],
-    Filters.FILE_OUT: [set(), set()],
-    Filters.AUTHOR:   [set(), set()],
-    Filters.EMAIL:    [set(), set()],
-    Filters.REVISION: [set(), set()],
-    Filters.MESSAGE : [set(), None]
-}
-
 class InvalidRegExpError(ValueError):
     def __init__(self, msg):
         super(InvalidRegExpError, self).__init__(msg)
         self.msg = msg
 
-def __add_one_filter__(string,filter_type=Filters.FILE_IN):
+# Characters that have a special meaning in the regular expressions and
+# in the patterns on file names.
+__regexp_specials__ = set(".^$*+?{}[]\\|()")
+__wildcards__ = set("*?[")
+
+# Constructions that match differently when git applies the regular
+# expression to each line of the message, or to the "Name <email>"
+# string of the author: anchors, and inline flags (such as (?m)).
+__regexp_anchors__ = re.compile(r"\^|\$|\\[AZzG]|\(\?")
+
+# Backreferences, whose numbering changes when the regular expressions
+# are joined into a single one.
+__regexp_backreferences__ = re.compile(r"\\[1-9]|\(\?P=")
+
+# Global inline flags (such as (?i)), that would apply to all the joined
+# regular expressions; the scoped ones, such as (?i:...), are left joined.
+__regexp_inline_flags__ = re.compile(r"\(\?[aiLmsux]+\)")
+
+# The number of (filter type, string) pairs whose result is memoised by
+# each Filtering.
+FILTER_CACHE_SIZE = 65536
+
+def __is_file_filter__(filter_type):
+    return filter_type in (Filters.FILE_IN, Filters.FILE_OUT)
+
+def __compile_pattern__(pattern, filter_type):
     """
-    Function that takes a string and records the corresponding filter
-    inside __filters__.
+    Compiles a single pattern of the filters of type 'filter_type', so
+    that the invalid ones are rejected when they are added.
     """
-    for filter in Filters:
-        if string.startswith(filter.value):
-            __filters__[filter][0].add(string[len(filter.value) + 1:])
-            return
-    __filters__[Filters.FILE_IN][0].add(string)
+    try:
+        if __is_file_filter__(filter_type):
+            return re.compile(fnmatch.translate(pattern))
+        return re.compile(pattern)
+    except re.error:
+        raise InvalidRegExpError(_("Invalid regular expression specified"))
 
-def add_filters(string):
+def __compile_patterns__(patterns, filter_type):
     """
-    Add a set of filters, separated by commas. The syntax corresponds
-    to the --exclude option on the command-line. If KEY is missing
-    somehow, the filter is automatically Filters.FILE_IN".
+    Returns a function testing whether a string matches at least one of
+    the 'patterns'. The patterns on file names of the form "*.ext" are
+    looked up in a table of extensions, and the other ones are joined
+    into a single regular expression, except for those that can not be
+    joined safely (backreferences, global inline flags).
     """
-    rules = string.split(",")
-    filter_names = [filter.value for filter in Filters]
-    for rule in rules:
-        split_rule = rule.split(":")
-        if (len(split_rule) == 1):
-            __add_one_filter__(rule)
-        else:
-            filter_name = split_rule[0]
-            if not(filter_name in filter_names):
-                raise ("Invalid filter : %s"%filter_name)
+    extensions = set()
+    regexps = []
+    for pattern in sorted(patterns):
+        if __is_file_filter__(filter_type):
+            if pattern.startswith("*.") and not __wildcards__.intersection(pattern[1:]) and \
+               not "." in pattern[2:]:
+                extensions.add(pattern[1:])
             else:
-                __add_one_filter__(rule, Filters(filter_name))
+                regexps.append(fnmatch.translate(pattern))
+        else:
+            regexps.append(pattern)
 
-def clear():
-    for filter in Filters:
-        __filters__[filter] = [set(), set()]
+    def is_joinable(regexp):
+        return __regexp_backreferences__.search(regexp) is None and \
+            __regexp_inline_flags__.search(regexp) is None
 
-def get_filtered(filter_type=Filters.FILE_IN):
-    return __filters__[filter_type][1]
+    compiled = [ re.compile(r) for r in regexps if not is_joinable(r) ]
+    joinable = [ r for r in regexps if is_joinable(r) ]
+    if joinable:
+        try:
+            compiled.insert(0, re.compile("|".join("(?:%s)" % r for r in joinable)))
+        except re.error:
+            compiled[0:0] = [ re.compile(r) for r in joinable ]
 
-def has_filtered():
-    """
-    Returns True iff there is at least one active filter.
-    """
-    for filter in Filters:
-        if __filters__[filter][1]:
+    # The patterns on file names are translated into anchored regular
+    # expressions, the other ones are searched like re.search does.
+    searches = [ (r.match if __is_file_filter__(filter_type) else r.search) for r in compiled ]
+
+    def matches(string):
+        if extensions and string[string.rfind("."):] in extensions:
             return True
-    return False
+        for search in searches:
+            if search(string) is not None:
+                return True
+        return False
+
+    return matches
 
-def is_filtered(string, filter_type):
+class Filtering(object):
     """
-    The function that tests whether 'string' passes the filters
-    defined in __filters__. The test on the string parameter depends
-    on the filter_type. This function should not be used with the
-    filters on file names (cf. is_acceptable_file_name).
+    The filters of an analysis, along with the items they filtered. Each
+    filter type is associated to a pair of sets: the patterns of the
+    filters, and the items they filtered. It is part of the Context of
+    a Runner, so that several analyses do not share their filters.
     """
+    def __init__(self):
+        self.__filters__ = { f: [set(), set()] for f in Filters }
+        # Index associating the SHA of the commits to their messages,
+        # filled while reading the log when there are filters on the
+        # messages.
+        self.__messages__ = {}
+        self.__reset__()
 
-    if (filter_type == Filters("file_in")) or (filter_type == Filters("file_out")):
-        raise "Should not use that filter this way"
+    def __getstate__(self):
+        # The messages are only a cache of what git returns, that is
+        # not worth sending to another process, and the compiled filters
+        # are rebuilt on demand.
+        return { "__filters__": self.__filters__, "__messages__": {} }
 
-    string = string.strip()
-    if not string:
-        return False
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__reset__()
 
-    for regexp in __filters__[filter_type][0]:
-        if filter_type == Filters.MESSAGE:
-            search_for = git_utils.commit_message(string)
+    def __reset__(self):
+        """
+        Drops the compiled filters and the memoised results, whenever the
+        patterns of the filters change.
+        """
+        self.__compiled__ = {}
+        self.__matches__ = functools.lru_cache(maxsize=FILTER_CACHE_SIZE)(self.__match__)
+
+    def __compiled_filter__(self, filter_type):
+        compiled = self.__compiled__.get(filter_type, None)
+        if compiled is None:
+            compiled = __compile_patterns__(self.__filters__[filter_type][0], filter_type)
+            self.__compiled__[filter_type] = compiled
+        return compiled
+
+    def __match__(self, filter_type, string):
+        return self.__compiled_filter__(filter_type)(string)
+
+    def __add_one_filter__(self, string, filter_type=Filters.FILE_IN):
+        """
+        Function that takes a string and records the corresponding filter
+        inside __filters__. Raises InvalidRegExpError if the pattern of
+        the filter is not valid.
+        """
+        for filter in Filters:
+            if string.startswith(filter.value):
+                (filter_type, pattern) = (filter, string[len(filter.value) + 1:])
+                break
         else:
-            search_for = string
+            (filter_type, pattern) = (Filters.FILE_IN, string)
 
-        try:
-            if re.search(regexp, search_for) is not None:
-                if filter_type == Filters.MESSAGE:
-                    __add_one_filter__("revision:" + string) # ??
+        __compile_pattern__(pattern, filter_type)
+        self.__filters__[filter_type][0].add(pattern)
+        self.__reset__()
+
+    def add_filters(self, string):
+        """
+        Add a set of filters, separated by commas. The syntax corresponds
+        to the --exclude option on the command-line. If KEY is missing
+        somehow, the filter is automatically Filters.FILE_IN".
+        """
+        rules = string.split(",")
+        filter_names = [filter.value for filter in Filters]
+        for rule in rules:
+            split_rule = rule.split(":")
+            if (len(split_rule) == 1):
+                self.__add_one_filter__(rule)
+            else:
+                filter_name = split_rule[0]
+                if not(filter_name in filter_names):
+                    raise ("Invalid filter : %s"%filter_name)
                 else:
-                    __filters__[filter_type][1].add(string)
-                return True
-        except:
-            raise InvalidRegExpError(_("Invalid regular expression specified"))
+                    self.__add_one_filter__(rule, Filters(filter_name))
 
-    return False
+    def clear(self):
+        for filter in Filters:
+            self.__filters__[filter] = [set(), set()]
+        self.__messages__.clear()
+        self.__reset__()
 
-def is_acceptable_file_name(string):
-    """
-    The function that tests whether 'string' passes the filters
-    according to the configuration for file names. First, the filename
-    must pass at least one positive check (in FILE_IN), and second, it
-    must not belong to any negative check (in FILE_OUT)
-    """
-    search_for = string.strip()
-    accepted = False
-    for regexp in __filters__[Filters.FILE_IN][0]:
-        try:
-            if fnmatch.fnmatch(search_for, regexp):
-                accepted = True
-                break
-        except:
-            raise InvalidRegExpError(_("Invalid regular expression specified"))
-    if not(accepted):
+    def has_filters(self, filter_type):
+        """
+        Returns True iff at least one filter of type 'filter_type' has
+        been specified.
+        """
+        return bool(self.__filters__[filter_type][0])
+
+    def add_message(self, sha, message):
+        """
+        Records the message of the commit 'sha', so that the filters on
+        the messages do not need to ask git for it.
+        """
+        self.__messages__[sha] = message
+
+    def get_filtered(self, filter_type=Filters.FILE_IN):
+        return self.__filters__[filter_type][1]
+
+    def add_filtered(self, filter_type, strings):
+        """
+        Records the 'strings' as filtered by the filters of type
+        'filter_type', for the items that have been filtered elsewhere
+        (by git or by another process).
+        """
+        self.__filters__[filter_type][1].update(strings)
+
+    def get_filters(self):
+        """
+        Returns the filters along with the items they filtered, so that
+        they can be installed in another process with set_filters.
+        """
+        return self.__filters__
+
+    def set_filters(self, filters):
+        """
+        Installs the filters returned by get_filters in another process.
+        """
+        self.__filters__.update(filters)
+        self.__reset__()
+
+    def has_filtered(self):
+        """
+        Returns True iff there is at least one active filter.
+        """
+        for filter in Filters:
+            if self.__filters__[filter][1]:
+                return True
         return False
-    for regexp in __filters__[Filters.FILE_OUT][0]:
-        try:
-            if fnmatch.fnmatch(search_for, regexp):
-                __filters__[Filters.FILE_OUT][1].add(string)
+
+    def is_filtered(self, string, filter_type, location=None):
+        """
+        The function that tests whether 'string' passes the filters
+        defined in __filters__. The test on the string parameter depends
+        on the filter_type. This function should not be used with the
+        filters on file names (cf. is_acceptable_file_name). The messages
+        that have not been recorded are read from the repository at
+        'location'.
+        """
+
+        if (filter_type == Filters("file_in")) or (filter_type == Filters("file_out")):
+            raise "Should not use that filter this way"
+
+        string = string.strip()
+        if not string:
+            return False
+
+        if filter_type == Filters.REVISION and string in self.__filters__[filter_type][1]:
+            return True # Already filtered, possibly because of its message
+
+        if not self.__filters__[filter_type][0]:
+            return False
+
+        if filter_type == Filters.MESSAGE:
+            # Each commit is only tested once: its message is not memoised
+            search_for = self.__messages__.get(string, None)
+            if search_for is None:
+                search_for = git_utils.commit_message(string, location)
+            if not self.__compiled_filter__(filter_type)(search_for):
                 return False
-        except:
-            raise InvalidRegExpError(_("Invalid regular expression specified"))
-    return True
+            # The revision is filtered everywhere else (blames...)
+            self.__filters__[Filters.REVISION][1].add(string)
+            return True
+
+        if not self.__matches__(filter_type, string):
+            return False
+        self.__filters__[filter_type][1].add(string)
+        return True
+
+    def get_git_log_options(self, perl_regexp, renamed_authors):
+        """
+        Returns the options that let git log drop the commits excluded by
+        the AUTHOR, EMAIL and MESSAGE filters, along with the options
+        selecting the commits dropped because of their message. Only the
+        regular expressions that git matches like the re module are
+        translated, the commits returned by git still going through
+        is_filtered. The filters on the authors require the PCRE support
+        of git, and are not translated when the authors are renamed (by
+        aliases or a mailmap), since git matches the original names.
+        """
+        def translatable(regexp):
+            if perl_regexp:
+                return __regexp_anchors__.search(regexp) is None
+            return not __regexp_specials__.intersection(regexp)
+
+        if perl_regexp and not renamed_authors:
+            authors = [ "[^<]*?(?:%s)[^<]* <" % r
+                        for r in sorted(self.__filters__[Filters.AUTHOR][0]) if translatable(r) ] + \
+                      [ "[^<]*<[^>]*?(?:%s)[^>]*>" % r
+                        for r in sorted(self.__filters__[Filters.EMAIL][0]) if translatable(r) ]
+            if authors:
+                # git can not invert --author, nor combine it safely with
+                # --invert-grep: the messages are left to is_filtered
+                return (["--perl-regexp", "--author=^(?!%s)" % "|".join(authors)], [])
+
+        messages = [ "--grep=" + r for r in sorted(self.__filters__[Filters.MESSAGE][0])
+                     if translatable(r) ]
+        if not messages:
+            return ([], [])
+        messages.insert(0, "--perl-regexp" if perl_regexp else "--fixed-strings")
+        return (messages + ["--invert-grep"], messages)
+
+    def is_acceptable_file_name(self, string):
+        """
+        The function that tests whether 'string' passes the filters
+        according to the configuration for file names. First, the filename
+        must pass at least one positive check (in FILE_IN), and second, it
+        must not belong to any negative check (in FILE_OUT)
+        """
+        search_for = string.strip()
+        if not self.__matches__(Filters.FILE_IN, search_for):
+            return False
+        if self.__matches__(Filters.FILE_OUT, search_for):
+            self.__filters__[Filters.FILE_OUT][1].add(string)
+            return False
+        return True
@@ -18,10 +18,14 @@
 # along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
 
 import base64
+import contextlib
+import json
 import os
 import sys
 import textwrap
+import threading
 import time
+from xml.sax.saxutils import escape, quoteattr
 
 from . import basedir, localization, terminal, version
 
@@ -29,24 +33,124 @@ __available_formats__ = ["html", "htmlembedded", "json", "text", "xml"]
 
 DEFAULT_FORMAT = __available_formats__[3]
 
-__selected_format__ = DEFAULT_FORMAT
+# The extensions of the files written in an output directory
+__extensions__ = {"html": "html", "htmlembedded": "embedded.html", "json": "json",
+                  "text": "txt", "xml": "xml"}
+
+# The format being rendered by the current thread, see rendering()
+__rendering__ = threading.local()
 
 class InvalidFormatError(Exception):
     def __init__(self, msg):
         super(InvalidFormatError, self).__init__(msg)
         self.msg = msg
 
-def select(format):
-    global __selected_format__
-    __selected_format__ = format
-
-    return format in __available_formats__
+def is_available(formats):
+    """
+    Returns True if the formats, given as a list or as a comma separated
+    string, are all available.
+    """
+    if isinstance(formats, str):
+        formats = formats.split(",")
+    return all(f in __available_formats__ for f in formats)
 
 def get_selected():
-    return __selected_format__
+    """
+    Returns the format being rendered by the current thread, or else
+    the default format.
+    """
+    return getattr(__rendering__, "format", DEFAULT_FORMAT)
+
+def is_interactive_format(formats):
+    """
+    Returns True if the format being rendered by the current thread is
+    text, or else, outside of the rendering, if all the `formats` are.
+    """
+    if hasattr(__rendering__, "format"):
+        return __rendering__.format == "text"
+    return all(f == "text" for f in formats)
+
+@contextlib.contextmanager
+def rendering(format):
+    """
+    Renders `format` in the current thread for the duration of the
+    context, so that several formats can be rendered concurrently.
+    """
+    __rendering__.format = format
+    try:
+        yield
+    finally:
+        del __rendering__.format
+
+def get_extension(format):
+    return __extensions__[format]
+
+__json_encoder__ = json.JSONEncoder(ensure_ascii=False)
+
+def __is_scalar__(value):
+    return value is None or isinstance(value, (str, int, float, bool))
 
-def is_interactive_format():
-    return __selected_format__ == "text"
+def __write_json_value__(out, value, depth):
+    """
+    Writes `value` to `out` as JSON, the dicts being objects and the
+    other iterables (lists, generators...) being arrays, so that the
+    records can be produced one at a time.
+    """
+    if __is_scalar__(value):
+        out.write(__json_encoder__.encode(value))
+        return
+
+    if isinstance(value, dict):
+        (opening, closing) = ("{", "}")
+        items = ((__json_encoder__.encode(k) + ": ", v) for (k, v) in value.items())
+    else:
+        (opening, closing) = ("[", "]")
+        items = (("", v) for v in value)
+
+    out.write(opening)
+    separator = "\n"
+    for (prefix, v) in items:
+        out.write(separator + "\t" * (depth + 1) + prefix)
+        __write_json_value__(out, v, depth + 1)
+        separator = ",\n"
+    if separator != "\n":
+        out.write("\n" + "\t" * depth)
+    out.write(closing)
+
+def write_json(out, key, value):
+    """
+    Writes the member `key` of the "gitinspector" JSON object to `out`,
+    its value being written incrementally (see __write_json_value__).
+    """
+    out.write(",\n\t\t" + __json_encoder__.encode(key) + ": ")
+    __write_json_value__(out, value, 2)
+
+def __write_xml_element__(out, tag, value, depth, attributes=None):
+    """
+    Writes the element `tag` to `out`. A dict `value` gives the children
+    of the element by tag, and any other iterable gives its children as
+    (tag, value) or (tag, value, attributes) tuples, so that the records
+    can be produced one at a time.
+    """
+    indent = "\t" * depth
+    start = tag + "".join(" {0}={1}".format(k, quoteattr(str(v)))
+                          for (k, v) in (attributes or {}).items())
+    if __is_scalar__(value):
+        out.write("{0}<{1}>{2}</{3}>\n".format(indent, start, escape(str(value)), tag))
+        return
+
+    out.write("{0}<{1}>\n".format(indent, start))
+    for child in (value.items() if isinstance(value, dict) else value):
+        __write_xml_element__(out, child[0], child[1], depth + 1, *child[2:])
+    out.write("{0}</{1}>\n".format(indent, tag))
+
+def write_xml(out, tag, value, attributes=None):
+    """
+    Writes the element `tag` of the "gitinspector" XML document to
+    `out`, its children being written incrementally (see
+    __write_xml_element__).
+    """
+    __write_xml_element__(out, tag, value, 1, attributes)
 
 def __output_html_template__(name):
     template_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), name)
@@ -69,8 +173,9 @@ def output_header(runner):
     """
     repos = runner.repos
     repos_string = ", ".join([repo.name for repo in repos])
+    selected_format = get_selected()
 
-    if __selected_format__ == "html" or __selected_format__ == "htmlembedded":
+    if selected_format == "html" or selected_format == "htmlembedded":
         base = basedir.get_basedir()
         html_header = __output_html_template__(base + "/templates/header.html")
 
@@ -79,7 +184,7 @@ def output_header(runner):
         logo_file.close()
         logo = base64.b64encode(logo)
 
-        if __selected_format__ == "htmlembedded":
+        if selected_format == "htmlembedded":
             jquery_js = "<script type='application/javascript'>" + \
                 __output_html_template__(base + "/html/jquery.min.js") + "</script>"
             d3_js = "<script type='application/javascript'>" + \
@@ -109,12 +214,11 @@ def output_header(runner):
                       " for git repositories.").format(
                           "<a href=\"https://github.com/renaultd/gitinspector\">gitinspector</a>",
                           version.__version__)
-        cli_text = sys.argv
+        cli_text = list(sys.argv)
         cli_text[0] = "gitinspector.py"
-        if "-o" in cli_text: # remove the output file
+        while "-o" in cli_text: # remove the output files
             ind = cli_text.index("-o")
-            del cli_text[ind]
-            del cli_text[ind]
+            del cli_text[ind:ind + 2]
         for r in runner.config.repositories: # remove the repositories
             if r in cli_text:
                 cli_text.remove(r)
@@ -134,37 +238,27 @@ def output_header(runner):
                                hide_minor_authors=_("Hide minor authors"),
                                show_minor_rows=_("Show rows with minor work"),
                                hide_minor_rows=_("Hide rows with minor work")))
-    elif __selected_format__ == "json":
-        runner.out.writeln("{\n\t\"gitinspector\": {")
-        runner.out.writeln("\t\t\"version\": \"" + version.__version__ + "\",")
+    elif selected_format == "json":
+        runner.out.write("{\n\t\"gitinspector\": {\n\t\t\"version\": " +
+                         __json_encoder__.encode(version.__version__))
 
         if len(repos) <= 1:
-            runner.out.writeln("\t\t\"repository\": \"" + repos_string + "\",")
+            write_json(runner.out, "repository", repos_string)
         else:
-            repos_json = "\t\t\"repositories\": [ "
-
-            for repo in repos:
-                repos_json += "\"" + repo.name + "\", "
+            write_json(runner.out, "repositories", [ repo.name for repo in repos ])
 
-            runner.out.writeln(repos_json[:-2] + " ],")
+        write_json(runner.out, "report_date", time.strftime("%Y/%m/%d"))
 
-        runner.out.writeln("\t\t\"report_date\": \"" + time.strftime("%Y/%m/%d") + "\",")
-
-    elif __selected_format__ == "xml":
+    elif selected_format == "xml":
         runner.out.writeln("<gitinspector>")
-        runner.out.writeln("\t<version>" + version.__version__ + "</version>")
+        write_xml(runner.out, "version", version.__version__)
 
         if len(repos) <= 1:
-            runner.out.writeln("\t<repository>" + repos_string + "</repository>")
+            write_xml(runner.out, "repository", repos_string)
         else:
-            runner.out.writeln("\t<repositories>")
-
-            for repo in repos:
-                runner.out.writeln("\t\t<repository>" + repo.name + "</repository>")
-
-            runner.out.writeln("\t</repositories>")
+            write_xml(runner.out, "repositories", [ ("repository", repo.name) for repo in repos ])
 
-        runner.out.writeln("\t<report-date>" + time.strftime("%Y/%m/%d") + "</report-date>")
+        write_xml(runner.out, "report-date", time.strftime("%Y/%m/%d"))
     else:
         repos_name = (repos_string if runner.config.branch == "master"
                      else "%s (branch %s)"%(repos_string, runner.config.branch))
@@ -179,11 +273,12 @@ def output_footer(runner):
     """
     The function responsible for outputting a footer to the output.
     """
-    if __selected_format__ == "html" or __selected_format__ == "htmlembedded":
+    selected_format = get_selected()
+    if selected_format == "html" or selected_format == "htmlembedded":
         base = basedir.get_basedir()
         html_footer = __output_html_template__(base + "/templates/footer.html")
         runner.out.writeln(html_footer)
-    elif __selected_format__ == "json":
+    elif selected_format == "json":
         runner.out.writeln("\n\t}\n}")
-    elif __selected_format__ == "xml":
+    elif selected_format == "xml":
         runner.out.writeln("</gitinspector>")
@@ -17,14 +17,19 @@
 # You should have received a copy of the GNU General Public License
 # along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
 
-import itertools
+import os
 import subprocess
+from shlex import quote
 
+# Every helper runs git in the repository at `location`, the current
+# directory by default, so that no process-global os.chdir is needed
+# and several repositories can be read at the same time.
 
-def local_branches():
+
+def local_branches(location=None):
     """Returns the list of branches appearing as local references.
     """
-    branch_p = subprocess.Popen(["git", "branch", "--format=%(refname)"], bufsize=1,
+    branch_p = subprocess.Popen(["git", "branch", "--format=%(refname)"], bufsize=1, cwd=location,
                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
     branches = branch_p.communicate()[0].splitlines()
     branches = [ b.decode("utf-8", "replace") for b in branches ]
@@ -34,53 +39,132 @@ def local_branches():
     return branches
 
 
-def last_commit(branch, file):
-    """Returns the date for the last commit on a file in a branch, in the
-       Unix format, 0 if the file does not belong to the branch.
+def last_commits(branch, config, location=None):
+    """Returns a hash associating each file appearing in the history
+    of a branch to the pair (date, SHA) of the last commit on this file
+    in the branch, the date being in the Unix format. The commits of all
+    the files are gathered with a single walk of the history of the
+    branch.
     """
-    log_p = subprocess.Popen(["git", "log", "-1", "--format=%at", branch, file], bufsize=1,
-                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    date_s = log_p.communicate()[0].strip().decode("utf-8")
+    log_command = ["git", "log", "--name-only", "--no-renames", "-c", "-z",
+                   "--format=%x00%x01%at %H", branch, "--"]
+
+    if config.debug_mode:
+        print(" ".join(log_command))
+
+    log_p = subprocess.Popen(log_command, cwd=location, stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL)
+    commits = {}
+    commit = (0, None)
     try:
-        date = int(date_s)
-    except ValueError:
-        date = 0
-    log_p.wait()
-    log_p.stdout.close()
-    return date
+        # Each commit is written as a field holding its date and its SHA
+        # preceded by \x01, followed by the files it modifies (with
+        # respect to all its parents for merges), the most recent commits
+        # coming first.
+        for field in __nul_fields__(log_p.stdout):
+            field = field.lstrip(b"\n")
+            if not field:
+                continue
+            header = field[1:].split(b" ")
+            if field[0] == 1 and len(header) == 2 and header[0].isdigit():
+                commit = (int(header[0]), decode(header[1]))
+            else:
+                commits.setdefault(decode(field), commit)
+    finally:
+        log_p.stdout.close()
+        log_p.wait()
+    return commits
 
 
-def sanitize_filename(file):
-    file = file.strip().decode("unicode_escape", "ignore")
-    file = file.encode("latin-1", "replace")
-    file = file.decode("utf-8", "replace").strip("\"").strip("'").strip()
-    return file
+def decode(field):
+    """Returns the string held by a raw field (bytes or any other buffer,
+    such as a memoryview slice) read from the output of git. Paths are
+    always read from NUL-terminated outputs (or with core.quotepath
+    turned off), so that no field ever needs to be unquoted, and only
+    the fields that are kept are decoded.
+    """
+    return str(field, "utf-8", "replace")
 
 
-def files(branch, config):
-    """Returns the list of the files appearing in the given branch.
+def files(branch, config, location=None):
+    """Returns the list of the files appearing in the given branch,
+    or an empty list if the branch cannot be read.
     """
-    ls_command = ["git", "ls-tree", "--name-only", "-r", branch]
+    ls_command = ["git", "ls-tree", "--name-only", "-r", "-z", branch]
 
     if config.debug_mode:
         print(" ".join(ls_command))
 
-    ls_tree_p = subprocess.Popen(ls_command, bufsize=1,
-                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    lines = ls_tree_p.communicate()[0].splitlines()
-    lines = [ sanitize_filename(l) for l in lines ]
-    ls_tree_p.wait()
+    ls_tree_p = subprocess.Popen(ls_command, cwd=location, stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL)
+    paths = ls_tree_p.communicate()[0]
     ls_tree_p.stdout.close()
-    return lines
+    if ls_tree_p.returncode != 0:
+        return []
+    return [ decode(p) for p in paths.split(b"\0") if p ]
+
+
+def blobs(revision, config, location=None):
+    """Returns a hash associating each file of the given revision to the
+    SHA of its blob, or an empty hash if the revision cannot be read.
+    """
+    ls_command = ["git", "ls-tree", "-r", "-z", revision]
+
+    if config.debug_mode:
+        print(" ".join(ls_command))
+
+    ls_tree_p = subprocess.Popen(ls_command, cwd=location, stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL)
+    entries = ls_tree_p.communicate()[0]
+    ls_tree_p.stdout.close()
+    if ls_tree_p.returncode != 0:
+        return {}
+
+    # Each entry is written as "mode type sha\tpath"
+    blobs = {}
+    for entry in entries.split(b"\0"):
+        if entry:
+            (info, path) = entry.split(b"\t", 1)
+            blobs[decode(path)] = decode(info.split(b" ")[2])
+    return blobs
 
 
-def commits(branch, since, until):
+def blob_sizes(revision, config, location=None):
+    """Returns a hash associating each file of the given revision to the
+    size of its blob in bytes, or an empty hash if the revision cannot be
+    read.
+    """
+    ls_command = ["git", "ls-tree", "-r", "-l", "-z", revision]
+
+    if config.debug_mode:
+        print(" ".join(ls_command))
+
+    ls_tree_p = subprocess.Popen(ls_command, cwd=location, stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL)
+    entries = ls_tree_p.communicate()[0]
+    ls_tree_p.stdout.close()
+    if ls_tree_p.returncode != 0:
+        return {}
+
+    # Each entry is written as "mode type sha size\tpath", the size of
+    # the submodules being "-"
+    sizes = {}
+    for entry in entries.split(b"\0"):
+        if entry:
+            (info, path) = entry.split(b"\t", 1)
+            size = info.split()[3]
+            if size.isdigit():
+                sizes[decode(path)] = int(size)
+    return sizes
+
+
+def commits(branch, since, until, options=(), location=None):
     """Returns a list of SHA for the commits in the given branch, for the
-    given duration.
+    given duration, possibly restricted by some rev-list `options`.
     """
     git_command = filter(None, ["git", "rev-list", "--reverse", # "--no-merges", # For oavsa
-                                since, until, branch])
-    git_rev_list_p = subprocess.Popen(git_command, bufsize=1,
+                                since, until] + list(options) + [branch])
+    git_rev_list_p = subprocess.Popen(git_command, bufsize=1, cwd=location,
                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
     lines = git_rev_list_p.communicate()[0].splitlines()
     git_rev_list_p.wait()
@@ -88,68 +172,222 @@ def commits(branch, since, until):
     return lines
 
 
-def commit_chunks(hashes, since, until, config):
-    """Returns a list of commits containing the commit data with the
-    filediffs. Returned is a list of chunks, each chunk being one
-    commit represented by a list of lines. The return of this function
-    is intended to be handled by Commit.handle_diff_chunk.
+# Number of NUL-terminated fields in the header of each commit, as
+# written by the pretty format of commit_chunks.
+COMMIT_HEADER_FIELDS = 6
+
+
+def __nul_fields__(stream, size=65536):
+    """Generates the NUL-terminated fields read from a binary stream,
+    reading it by blocks of at most `size` bytes.
+    """
+    pending = b""
+    while True:
+        block = stream.read1(size)
+        if not block:
+            break
+        fields = (pending + block).split(b"\0")
+        pending = fields.pop()
+        yield from fields
+    if pending:
+        yield pending
+
+
+def __numstat_value__(string):
+    """Returns the number of lines counted by --numstat, binary files
+    being reported by git as '-'.
     """
+    return 0 if string == b"-" else int(string)
+
+
+def parse_numstat_log(stream):
+    """Generates the commits read from the output of a `git log
+    --numstat -z` whose pretty format is made of COMMIT_HEADER_FIELDS
+    NUL-terminated fields. Each commit is yielded as a chunk, a list
+    whose first element is the list of the raw header fields, and whose
+    other elements are (insertions, deletions, path) triples, the path
+    being the raw destination path in the case of a rename.
+    """
+    fields = __nul_fields__(stream)
+    chunk = None
+    for field in fields:
+        if chunk is None:
+            if not field: # Separator between two commits
+                continue
+            chunk = [[field] + [next(fields) for _ in range(COMMIT_HEADER_FIELDS - 1)]]
+        elif not field:
+            yield chunk
+            chunk = None
+        else:
+            (insertions, deletions, path) = field.lstrip(b"\n").split(b"\t", 2)
+            if not path: # Renames are written as "ins del \0old\0new"
+                next(fields)
+                path = next(fields)
+            chunk.append((__numstat_value__(insertions),
+                          __numstat_value__(deletions), path))
+    if chunk is not None:
+        yield chunk
+
+
+def commit_chunks(hashes, since, until, config, messages=False,
+                  options=(), excludes=(), location=None):
+    """Generates the commits containing the commit data with the
+    filediffs, as read by parse_numstat_log. The header of each commit
+    holds its timestamp, date, SHA, author, email and, if `messages` is
+    set, its message (the last field being empty otherwise). Each chunk
+    is yielded as soon as git has written it to the pipe, so that at
+    most one commit is held in memory at a time. The chunks are
+    intended to be handled by Commit.handle_diff_chunk. The `options`
+    let git itself skip some commits, and the commits reachable from the
+    `excludes` revisions are left out.
+    """
+    pretty_format = "%ct%x00%cd%x00%H%x00%aN%x00%aE%x00" + \
+        ("%B%x00" if messages else "%x00")
     git_command = list(filter(None,
-                         ["git", "log", "--reverse",
-                          "--pretty='---%n%ct|%cd|%H|%aN|%aE'",
-                          "--stat=100000,8192"] +
+                         ["git", "-c", "core.quotepath=off",
+                          "log", "--reverse", "--numstat", "-z",
+                          "--pretty='format:" + pretty_format + "'"] +
                          (["-w"] if config.ignore_space else []) +
                          [since, until, "--date=short"] +
                          (["-C", "-C", "-M"] if config.hard else []) +
-                         [hashes]))
+                         [ quote(o) for o in options ] + [hashes] +
+                         (["--not"] + list(excludes) if excludes else [])))
     git_command = " ".join(git_command)
     if config.debug_mode:
         print(git_command)
 
-    git_log_r = subprocess.Popen(git_command,
-                                 bufsize=1, stdout=subprocess.PIPE, shell=True)
-    lines = git_log_r.stdout.readlines()
-    git_log_r.wait()
-    git_log_r.stdout.close()
-    chunks = [ list(g) for (k,g) in itertools.groupby(lines, key=lambda l: l==b'---\n') ]
-    chunks = list(filter(lambda g: g[0] != b'---\n', chunks))
-    return chunks
+    git_log_r = subprocess.Popen(git_command, cwd=location, stdout=subprocess.PIPE, shell=True)
+    try:
+        yield from parse_numstat_log(git_log_r.stdout)
+    finally:
+        git_log_r.stdout.close()
+        git_log_r.wait()
+
+
+def tips(hashes, location=None):
+    """Returns the sorted list of the SHA of the commits pointed to by
+    `hashes` (a revision or --all), or an empty list if they cannot be
+    read.
+    """
+    # git log --all also reads HEAD, which may be detached
+    rev_parse_p = subprocess.Popen(["git", "rev-parse"] +
+                                   (["--all", "HEAD"] if hashes == "--all" else [hashes]),
+                                   cwd=location, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    shas = rev_parse_p.communicate()[0]
+    rev_parse_p.stdout.close()
+    if rev_parse_p.returncode != 0:
+        return []
+    return sorted(set(decode(s) for s in shas.split()))
+
+
+def is_ancestor(ancestor, descendant, location=None):
+    """Returns True iff the commit `ancestor` is reachable from the
+    commit `descendant`.
+    """
+    merge_base_p = subprocess.Popen(["git", "merge-base", "--is-ancestor", ancestor, descendant],
+                                    cwd=location, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return merge_base_p.wait() == 0
+
 
+def has_perl_regexp(location=None):
+    """Returns True iff git has been built with the support of the
+    Perl-compatible regular expressions (--perl-regexp).
+    """
+    git_log_r = subprocess.Popen(["git", "log", "-1", "--perl-regexp",
+                                  "--grep=.", "--format=%H"],
+                                 cwd=location, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return git_log_r.wait() == 0
+
+
+def has_mailmap(location=None):
+    """Returns True iff the authors may be renamed by a mailmap, be it
+    the .mailmap file of the repository or one given in the git config.
+    """
+    if os.path.exists(os.path.join(location or os.curdir, ".mailmap")):
+        return True
+    git_config_r = subprocess.Popen(["git", "config", "--get-regexp", r"^mailmap\."],
+                                    cwd=location, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    settings = git_config_r.communicate()[0]
+    git_config_r.stdout.close()
+    return bool(settings.strip())
+
+
+class BlobReader(object):
+    """A long-lived `git cat-file --batch` process, that reads the
+    contents of many objects without spawning one git process for each
+    of them. It can be used as a context manager, closing the process
+    on exit.
+    """
+    def __init__(self, location=None):
+        self.cat_file_p = subprocess.Popen(["git", "cat-file", "--batch"], cwd=location,
+                                           stdin=subprocess.PIPE, stdout=subprocess.PIPE)
 
-def commit_message(hash):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, ref, path):
+        """Returns the contents of the file `path` in the revision `ref`
+        as a buffer (a memoryview over the bytes of the blob), or None if
+        there is no such blob.
+        """
+        self.cat_file_p.stdin.write((ref + ":" + path).encode("utf-8") + b"\n")
+        self.cat_file_p.stdin.flush()
+
+        # The header is "<sha> <type> <size>", or "<name> missing" (or
+        # "ambiguous"), the name possibly holding spaces
+        header = self.cat_file_p.stdout.readline().rstrip(b"\n")
+        if header.endswith(b" missing") or header.endswith(b" ambiguous"):
+            return None
+        (_sha, object_type, size) = header.split(b" ")
+        size = int(size)
+        contents = self.cat_file_p.stdout.read(size + 1) # Ends with a LF
+        if object_type != b"blob":
+            return None
+        return memoryview(contents)[0:size]
+
+    def close(self):
+        self.cat_file_p.stdin.close()
+        self.cat_file_p.wait()
+        self.cat_file_p.stdout.close()
+
+
+def commit_message(hash, location=None):
     """Returns the commit message of a given hash, as a list of strings"""
     git_command = filter(None, ["git", "show", "-s",
                                 "--pretty=%B", hash])
-    git_show_r = subprocess.Popen(git_command, bufsize=1, stdout=subprocess.PIPE)
+    git_show_r = subprocess.Popen(git_command, bufsize=1, cwd=location, stdout=subprocess.PIPE)
     message = git_show_r.stdout.read() # all lines in one go
     git_show_r.wait()
     git_show_r.stdout.close()
 
-    message = message.strip().decode("unicode_escape", "ignore")
-    message = message.encode("latin-1", "replace")
-    return message.decode("utf-8", "replace")
+    return decode(message.strip())
 
 
-def blames(sha, filename, config):
-    """Returns a list of data representing the blames for a file on a
-    given branch.
+def blames(sha, filename, config, location=None):
+    """Generates the rows of the porcelain blame of a file at a given
+    revision, as soon as git writes them to the pipe. The metadata of
+    each commit only appears the first time the commit is met.
     """
     blame_command = list(filter(None,
-                           ["git", "blame", "--line-porcelain"] +
+                           ["git", "-c", "core.quotepath=off",
+                            "blame", "--porcelain"] +
                            (["-w"] if config.ignore_space else []) +
                            (["-C", "-C", "-M"] if config.hard else []) +
-                           [sha, "--", filename]))
+                           [sha, "--", quote(filename)]))
     blame_command = " ".join(blame_command)
     if config.debug_mode:
         print(blame_command)
 
-    git_blame_cmd = subprocess.Popen(blame_command, bufsize=1, shell=True,
-                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    rows = git_blame_cmd.stdout.readlines()
-    git_blame_cmd.wait()
-    git_blame_cmd.stdout.close()
-    git_blame_cmd.stderr.close()
-    return rows
+    git_blame_cmd = subprocess.Popen(blame_command, shell=True, cwd=location,
+                                     stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        yield from git_blame_cmd.stdout
+    finally:
+        git_blame_cmd.stdout.close()
+        git_blame_cmd.wait()
 
 
 def config(repo, variable, global_only):
@@ -20,21 +20,26 @@
 import argparse
 import ast
 import atexit
+import concurrent.futures
+import copy
 import datetime
 import io
 import os
 import sys
 
-from .blame import Blame
+from .blame import Blame, BLAME_ENGINES
 from .changes import Changes
 from .config import GitConfig
+from .context import Context
 from .git_utils import local_branches
 from .messages import error, warning, debug
 from .metrics import MetricsLogic
 from .repository import Repository
-from . import (basedir, filtering, format, interval,
+from .timeline import TimelineData
+from . import (basedir, cache, filtering, format,
                localization, terminal, version)
 from .output import outputable
+from .output.outputable import Stage
 
 from .format import __available_formats__
 from .filtering import Filters
@@ -58,64 +63,147 @@ DEFAULT_EXTENSIONS = ["*.java", "*.cs", "*.rb",
                      ]
 
 
-class StdoutWriter(io.StringIO):
-    def __init__(self):
-        io.StringIO.__init__(self)
-    def writeln(self, string):
-        self.write(string + "\n")
-    def close(self):
-        print(self.getvalue())
-        io.StringIO.close(self)
+# The size in bytes of the buffer of the writers: the report is written
+# out each time the buffer is filled, instead of being held in memory.
+WRITER_BUFFER_SIZE = 64 * 1024
 
 
 class FileWriter(object):
-    def __init__(self, file):
+    """
+    Writes the report to `file`, either a path or an opened file, as
+    bytes encoded with `encoding` through a buffer of WRITER_BUFFER_SIZE.
+    """
+    def __init__(self, file, encoding="utf-8", errors="strict"):
+        if isinstance(file, str):
+            file = open(file, "wb", buffering=0)
         self.file = file
+        self.encoding = encoding
+        self.errors = errors
+        # Opened text files are written to through their binary stream,
+        # and text streams without one, such as io.StringIO, directly
+        stream = getattr(file, "buffer", file)
+        if isinstance(stream, io.TextIOBase):
+            self.buffer = stream
+            self.encoding = None
+        else:
+            self.buffer = io.BufferedWriter(stream, WRITER_BUFFER_SIZE)
     def write(self, string):
-        self.file.write(string)
+        if self.encoding is None:
+            self.buffer.write(string)
+        else:
+            self.buffer.write(string.encode(self.encoding, self.errors))
     def writeln(self, string):
-        self.file.write(string + "\n")
+        self.write(string + "\n")
     def close(self):
+        self.buffer.flush()
         self.file.close()
 
 
+class StdoutWriter(FileWriter):
+    """
+    Writes the report through to the standard output, so that pipelines
+    can consume it as it is produced.
+    """
+    def __init__(self):
+        sys.stdout.flush()
+        FileWriter.__init__(self, sys.stdout, sys.stdout.encoding, sys.stdout.errors)
+    def close(self):
+        self.writeln("")
+        self.buffer.flush()
+
+
+def __load_repository__(location, repo, config, context, stages):
+    """
+    Returns the changes, the blames and the metrics of the repository at
+    `location`, the stages that are not computed being left empty. `repo`
+    names the repository in the progress messages, if not None.
+    """
+    if config.branch == "--all":
+        config = copy.copy(config)
+        config.branches = local_branches(location)
+
+    changes = Changes(repo, config, context, location)
+    blames = Blame(repo, changes, config, context) if Stage.BLAMES in stages else Blame.empty()
+    metrics = MetricsLogic(config, context, changes.ref, location) \
+        if Stage.METRICS in stages else MetricsLogic.empty()
+    return (changes, blames, metrics)
+
+def __run_load_process__(location, repo, config, context, stages):
+    """
+    Loads a repository in a process of the pool, with a copy of the
+    context of the main process, returning the items filtered while
+    loading along with the results.
+    """
+    filtered = { f: set(context.filtering.get_filtered(f)) for f in Filters }
+    results = __load_repository__(location, repo, config, context, stages)
+    return results + ({ f: context.filtering.get_filtered(f) - filtered[f] for f in Filters },)
+
+def __unpack_load__(packed, context):
+    """
+    Returns the results of __run_load_process__, recording the items
+    filtered by the process in `context`. The colors of the committers
+    are given again, as if the repositories had been loaded one after
+    the other.
+    """
+    (changes, blames, metrics, filtered) = packed
+    for f, strings in filtered.items():
+        context.filtering.add_filtered(f, strings)
+
+    # The committers only met in the blames keep their grey color
+    for committer in changes.committers.values():
+        if "committer" not in committer:
+            committer["color"] = context.colors.get_new_color()
+    return (changes, blames, metrics)
+
+
 class Runner(object):
     def __init__(self, config, writer):
         self.config = config  # Namespace object containing the config
-        self.out = writer     # Buffer for containing the output
+        # The writers of the outputs, one per format in config.format
+        self.outs = writer if isinstance(writer, list) else [writer]
+        self.out = self.outs[0]
+        # The state of the analysis, shared by the objects computing it
+        self.context = Context(config.format)
 
         # Initialize the filters
-        filtering.clear()
         if config.exclude:
             for pat in config.exclude:
-                filtering.add_filters(pat)
+                self.context.filtering.add_filters(pat)
         for f in config.file_types.split(','):
-            filtering.__add_one_filter__(f)
+            self.context.filtering.__add_one_filter__(f)
 
         # Initialize a list of Repository objects
         self.repos = __get_validated_git_repos__(config)
         # We need the repos above to be set before we read the git config.
         GitConfig(self, self.repos[-1].location).read()
-        # Initialize extensions and formats
-        format.select(config.format)
+
+        # Select the outputs, and the stages of the analysis they depend on
+        self.outputs = [ o for o in outputable.Outputable.list()
+                         if o.name is None or
+                         (o.name in config.only if config.only else o.is_enabled(config)) ]
+        self.stages = set(s for o in self.outputs for s in o.stages)
+        if config.no_blame:
+            self.stages.discard(Stage.BLAMES)
+        self.skipped = [ o for o in self.outputs if not set(o.stages) <= self.stages ]
 
         # Initialize bounds on commits dates
-        interval.clear()
         if config.since:
-            interval.set_since(config.since.isoformat())
+            self.context.interval.set_since(config.since.isoformat())
         if config.until:
-            interval.set_until(config.until.isoformat())
+            self.context.interval.set_until(config.until.isoformat())
 
         # The following objects are additive : they begin empty, and
         # then one instance is added to the Runner for each repository
         self.changes = Changes.empty()      # Changes object
         self.blames = Blame.empty()         # Blame object
         self.metrics = MetricsLogic.empty() # Metrics object
+        self.timeline = None                # TimelineData object, computed on all the repositories
 
     def __load__(self):
         """
-        Load a list of repositories `repos`, compute the changes, the
-        blames and possibly the metrics.
+        Load a list of repositories `repos`, compute the changes, and
+        the blames, the metrics and the timeline if the selected outputs
+        depend on them.
         """
         localization.check_compatibility(version.__version__)
 
@@ -124,27 +212,43 @@ class Runner(object):
 
         terminal.skip_escapes(not sys.stdout.isatty())
         terminal.set_stdout_encoding()
-        previous_directory = os.getcwd()
-
-        for repo in self.repos:
-            os.chdir(repo.location)
-
-            # Initialize the branches
-            if self.config.branch == "--all":
-                self.config.branches = local_branches()
-
-            repo = repo if len(self.repos) > 1 else None
-            repo_changes = Changes(repo, self.config)
-            self.blames += Blame(repo, repo_changes, self.config)
-            self.changes += repo_changes
-
-            if self.config.metrics:
-                self.metrics += MetricsLogic()
-
-            if self.config.progress and sys.stdout.isatty() and format.is_interactive_format():
-                terminal.clear_row()
-
-        os.chdir(previous_directory)
+        repos = [ (r.location, r if len(self.repos) > 1 else None) for r in self.repos ]
+
+        # The repositories are loaded in parallel by a pool of processes,
+        # and merged in their order. The jobs are split between the
+        # processes, so that their blame and metrics pools do not
+        # oversubscribe the processors.
+        workers = min(self.config.jobs, len(repos))
+        if workers > 1:
+            config = copy.copy(self.config)
+            config.jobs = max(1, self.config.jobs // workers)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                tasks = [ executor.submit(__run_load_process__, location, repo,
+                                          config, self.context, self.stages)
+                          for (location, repo) in repos ]
+                results = [ __unpack_load__(task.result(), self.context) for task in tasks ]
+        else:
+            results = []
+            for (location, repo) in repos:
+                results.append(__load_repository__(location, repo, self.config,
+                                                   self.context, self.stages))
+                if self.config.progress and sys.stdout.isatty() and \
+                   self.context.is_interactive_format():
+                    terminal.clear_row()
+
+        for (changes, blames, metrics) in results:
+            self.blames += blames
+            self.metrics += metrics
+
+        # End the progress line before the report is written through
+        if Stage.BLAMES in self.stages and self.config.progress and \
+           self.context.is_interactive_format():
+            print("")
+            sys.stdout.flush()
+
+        self.changes = Changes.merge([self.changes] + [ r[0] for r in results ])
+        if Stage.TIMELINE in self.stages:
+            self.timeline = TimelineData(self.changes, self.config.weeks)
 
     def __output__(self):
         """
@@ -153,12 +257,30 @@ class Runner(object):
         if self.config.silent:
             return
 
-        format.output_header(self)
-        for out in outputable.Outputable.list():
-            out(self).output()
-        format.output_footer(self)
+        renders = list(zip(self.config.format, self.outs))
+        if self.config.jobs > 1 and len(renders) > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.config.jobs) as executor:
+                for task in [ executor.submit(self.__render__, f, out) for (f, out) in renders ]:
+                    task.result()
+        else:
+            for (f, out) in renders:
+                self.__render__(f, out)
 
-        self.out.close()
+    def __render__(self, selected_format, out):
+        """
+        Output the results of the run in `selected_format` to the
+        writer `out`, from the results loaded once for all the formats.
+        """
+        runner = copy.copy(self)
+        runner.out = out
+        with format.rendering(selected_format):
+            format.output_header(runner)
+            for output in self.outputs:
+                if output not in self.skipped:
+                    output(runner).output()
+            format.output_footer(runner)
+
+        out.close()
 
     def process(self):
         """
@@ -172,9 +294,9 @@ def __check_python_version__():
     """
     Check for a sufficiently recent python version.
     """
-    if sys.version_info < (3, 6):
+    if sys.version_info < (3, 7):
         python_version = str(sys.version_info[0]) + "." + str(sys.version_info[1])
-        error(_("gitinspector requires Python >=3.6 (version {0} was found).").format(python_version))
+        error(_("gitinspector requires Python >=3.7 (version {0} was found).").format(python_version))
 
 
 def __get_validated_git_repos__(config):
@@ -200,6 +322,22 @@ def __get_validated_git_repos__(config):
     return repos
 
 
+def __get_writers__(config):
+    """
+    Returns the writers of the outputs, one per format in config.format:
+    the standard output, the files given with -o, or files named after
+    the formats in the directory given with -o.
+    """
+    if not config.output:
+        return [StdoutWriter()]
+
+    files = config.output
+    if len(config.output) == 1 and os.path.isdir(config.output[0]):
+        files = [ os.path.join(config.output[0], "gitinspector." + format.get_extension(f))
+                  for f in config.format ]
+    return [ FileWriter(f) for f in files ]
+
+
 def __parse_arguments__(args=None):
     parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
                                      allow_abbrev=False, description=
@@ -221,6 +359,15 @@ def __parse_arguments__(args=None):
     parser.add_argument('-b', '--branch', metavar='BRANCH', help=
                         _("the name of the branch for git to checkout, the default "
                           "being 'master'"), default="--all")
+    parser.add_argument('--blame-engine', metavar='ENGINE', help=
+                        _("define how the files are blamed in parallel; the default engine "
+                          "is 'thread' and the available engines are: ") +
+                        str(BLAME_ENGINES),
+                        default="thread", choices=BLAME_ENGINES)
+    parser.add_argument('--cache-dir', metavar='DIR', help=
+                        _("the directory where the commits and the blames are cached between runs; "
+                          "the default being ") + cache.default_directory(),
+                        default=None)
     parser.add_argument('-d', '--debug-mode', action='store_true', help=
                         _("displays some debug messages"))
     parser.add_argument('-f', '--file-types', metavar='TYPES', help=
@@ -229,11 +376,12 @@ def __parse_arguments__(args=None):
                         str(DEFAULT_EXTENSIONS) + " " +
                         _("Specifying * includes files with no extension, while ** includes all files"),
                         default=",".join(DEFAULT_EXTENSIONS))
-    parser.add_argument('-F', '--format', metavar='FORMAT', help=
-                        _("define in which format output should be generated; the "
-                          "default format is 'text' and the available formats are: ") +
+    parser.add_argument('-F', '--format', metavar='FORMATS', help=
+                        _("a comma separated list of the formats in which the output "
+                          "should be generated; the default format is 'text' and the "
+                          "available formats are: ") +
                         str(__available_formats__),
-                        default="text", choices=__available_formats__)
+                        type=lambda s: s.split(","), default=["text"])
     parser.add_argument('-g', '--grading', action='store_true', help=
                         _("show statistics and information in a way that is formatted "
                           "for grading of student projects; this is the same as supplying "
@@ -241,6 +389,12 @@ def __parse_arguments__(args=None):
     parser.add_argument('-H', '--hard', action='store_true', help=
                         _("track rows and look for duplicates harder;"
                           "this can be quite slow with big repositories"))
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, help=
+                        _("the number of files that are analyzed in parallel, of "
+                          "repositories that are loaded in parallel, and of formats that "
+                          "are rendered in parallel; the default being the number of "
+                          "processors"),
+                        default=os.cpu_count() or 1)
     parser.add_argument('-l', '--list-file-types', action='store_true', help=
                         _("list all the file extensions available in the current branch "
                           "of the repository"))
@@ -249,8 +403,23 @@ def __parse_arguments__(args=None):
                           "system language if a translation is available"))
     parser.add_argument('-m', '--metrics', action='store_true', help=
                         _("include checks for certain metrics during the analysis of commits"))
-    parser.add_argument('-o', '--output', metavar='FILE', help=
-                        _("output the statistics in the given file"))
+    parser.add_argument('--no-blame', action='store_true', help=
+                        _("do not compute the blames, skipping the outputs that depend on them"))
+    parser.add_argument('--no-cache', action='store_true', help=
+                        _("do not read nor store the commits and the blames in the cache"))
+    parser.add_argument('--only', metavar='OUTPUTS', help=
+                        _("a comma separated list of the outputs to generate, only computing "
+                          "what they depend on; the available outputs are: ") +
+                        str(outputable.Outputable.names()),
+                        type=lambda s: s.split(","), default=None)
+    parser.add_argument('-o', '--output', metavar='FILE', action='append', help=
+                        _("output the statistics in the given file, given once per format, "
+                          "or in files named after the formats in the given directory"))
+    parser.add_argument('--prune', action='store_true', help=
+                        _("let git skip the commits excluded by the filters on the authors, "
+                          "the emails and the messages when it is able to; this is faster "
+                          "with big repositories, but the skipped commits no longer appear "
+                          "in the statistics nor in the list of filtered items"))
     parser.add_argument('-r', '--responsibilities', action='store_true', help=
                         _("show which files the different authors seem most responsible for"))
     parser.add_argument('-s', '--since', metavar='DATE',
@@ -285,6 +454,23 @@ def __parse_arguments__(args=None):
     if (unknown):
         error("%s: Unknown option" % unknown[0])
 
+    if options.jobs < 1:
+        error(_("the number of jobs must be a positive integer"))
+
+    for f in options.format:
+        if f not in __available_formats__:
+            error(_("unknown format: {0}").format(f))
+    if options.output:
+        if len(options.output) != len(options.format) and \
+           not (len(options.output) == 1 and os.path.isdir(options.output[0])):
+            error(_("one output file per format or an output directory must be given"))
+    elif len(options.format) > 1 and not options.silent:
+        error(_("several formats need one output file per format or an output directory"))
+
+    for name in options.only or []:
+        if name not in outputable.Outputable.names():
+            error(_("unknown output: {0}").format(name))
+
     options.progress = True  # Display progress messages
 
     if options.grading:
@@ -310,12 +496,7 @@ def main():
             version.output()
             sys.exit(0)
 
-        if options.output is None:
-            writer = StdoutWriter()
-        else:
-            writer = FileWriter(open(options.output,"w+"))
-
-        run = Runner(options, writer)
+        run = Runner(options, __get_writers__(options))
         run.process()
 
     except (filtering.InvalidRegExpError, format.InvalidFormatError) as exception:
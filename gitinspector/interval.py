@@ -19,50 +19,32 @@
 
 from shlex import quote
 
-__since__ = ""
-__until__ = ""
-__ref__ = "HEAD"
 
-# TODO: We definitely need to rewrite the 'interval' module to be part
-# of the Runner context and NOT BEING GLOBAL! (for our own sake!)...
+class Interval(object):
+    """
+    The bounds on the dates of the commits of an analysis, written as
+    options of git. It is part of the Context of a Runner, so that
+    several analyses do not share their bounds.
+    """
+    def __init__(self):
+        self.__since__ = ""
+        self.__until__ = ""
 
+    def has_interval(self):
+        return self.__since__ + self.__until__ != ""
 
-def has_interval():
-    global __since__, __until__
-    return __since__ + __until__ != ""
+    def get_since(self):
+        return self.__since__
 
+    def set_since(self, since):
+        self.__since__ = "--since=" + quote(since)
 
-def get_since():
-    global __since__
-    return __since__
+    def get_until(self):
+        return self.__until__
 
+    def set_until(self, until):
+        self.__until__ = "--until=" + quote(until)
 
-def set_since(since):
-    global __since__
-    __since__ = "--since=" + quote(since)
-
-
-def get_until():
-    global __until__
-    return __until__
-
-
-def set_until(until):
-    global __until__
-    __until__ = "--until=" + quote(until)
-
-
-def get_ref():
-    global __ref__
-    return __ref__
-
-
-def set_ref(ref):
-    global __ref__
-    __ref__ = ref
-
-
-def clear():
-    global __since__, __until__
-    __since__ = ""
-    __until__ = ""
+    def clear(self):
+        self.__since__ = ""
+        self.__until__ = ""
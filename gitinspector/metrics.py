@@ -17,10 +17,12 @@
 # You should have received a copy of the GNU General Public License
 # along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
 import re
-import subprocess
+import time
 from .changes import FileDiff
-from . import comment, filtering, interval
+from .messages import debug
+from . import comment, git_utils
 
 __metric_eloc__ = {
     "java": 500, "c": 500, "cpp": 500, "cs": 500,
@@ -45,6 +47,82 @@ __metric_cc_tokens__ = [
 METRIC_CYCLOMATIC_COMPLEXITY_THRESHOLD = 50
 METRIC_CYCLOMATIC_COMPLEXITY_DENSITY_THRESHOLD = 0.75
 
+# The comment markers and the compiled tokens of each extension, built
+# once by __get_scanner__.
+__scanners__ = {}
+
+def __get_scanner__(extension):
+    """
+    Returns the comment markers of the extension, along with its tokens
+    of the cyclomatic complexity (None when the language is not
+    supported): a single alternation of all the tokens, that rejects most
+    lines in one search, and the searches of the entry and exit tokens,
+    that count the tokens found on the other lines.
+    """
+    scanner = __scanners__.get(extension, None)
+    if scanner is None:
+        tokens = None
+        for i in __metric_cc_tokens__:
+            if extension in i[0]:
+                tokens = (re.compile("|".join("(?:%s)" % t for t in i[1] + i[2]), re.DOTALL).search,
+                          [ re.compile(t, re.DOTALL).search for t in i[1] ],
+                          [ re.compile(t, re.DOTALL).search for t in i[2] ])
+        scanner = (comment.get_comment_markers(extension), tokens)
+        __scanners__[extension] = scanner
+    return scanner
+
+def __measure__(blobs, revision, filename):
+    """
+    Returns the ELOC, the cyclomatic complexity and the cyclomatic
+    complexity density of a file in the given revision, each of them
+    being None when it does not cross its threshold, or None if the file
+    can not be read.
+    """
+    blob = blobs.read(revision, filename)
+    if blob is None:
+        return None
+
+    # The blob is decoded in one go instead of line by line
+    file_r = git_utils.decode(blob).split("\n")
+    if not file_r[-1]:
+        file_r.pop()
+
+    extension = FileDiff.get_extension(filename)
+    (lines, comments, cycc) = MetricsLogic.get_metrics(file_r, extension)
+
+    return (lines if __metric_eloc__.get(extension, None) is not None and
+                     __metric_eloc__[extension] < lines else None,
+            cycc if METRIC_CYCLOMATIC_COMPLEXITY_THRESHOLD < cycc else None,
+            cycc / float(lines) if lines > 0 and
+                                   METRIC_CYCLOMATIC_COMPLEXITY_DENSITY_THRESHOLD < cycc / float(lines) else None)
+
+def __debug_timing__(filename, elapsed):
+    debug("metrics of {0}: {1:.2f} ms".format(filename, 1000 * elapsed))
+
+# The readers of the blobs used by a process of the pool, one for each
+# repository, opened with the first file of the repository measured by
+# the process rather than for every file
+__process_blobs__ = {}
+
+def __run_metrics_process__(location, revision, filename, debug_mode):
+    """Measures a file in a process of the pool. Only the measures that
+    cross their thresholds are returned, along with the time spent on
+    the file in debug mode, or None if there is nothing to report.
+    """
+    blobs = __process_blobs__.get(location, None)
+    if blobs is None:
+        blobs = __process_blobs__[location] = git_utils.BlobReader(location)
+
+    start = time.perf_counter()
+    measures = __measure__(blobs, revision, filename)
+    elapsed = time.perf_counter() - start
+
+    if measures == (None, None, None):
+        measures = None
+    if measures is None and not debug_mode:
+        return None
+    return (measures, elapsed if debug_mode else None)
+
 class MetricsLogic(object):
 
     @classmethod
@@ -55,44 +133,57 @@ class MetricsLogic(object):
         metrics.cyclomatic_complexity_density = {}
         return metrics
 
-    def __init__(self):
+    def __init__(self, config, context, revision="HEAD", location=None):
         self.eloc = {}
         self.cyclomatic_complexity = {}
         self.cyclomatic_complexity_density = {}
 
-        ls_tree_p = subprocess.Popen(["git", "ls-tree", "--name-only", "-r",
-                                      interval.get_ref()], bufsize=1,
-                                     stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        lines = ls_tree_p.communicate()[0].splitlines()
-        ls_tree_p.wait()
-        ls_tree_p.stdout.close()
-
-        if ls_tree_p.returncode == 0:
-            for i in lines:
-                i = i.strip().decode("unicode_escape", "ignore")
-                i = i.encode("latin-1", "replace")
-                i = i.decode("utf-8", "replace").strip("\"").strip("'").strip()
-
-                if filtering.is_acceptable_file_name(FileDiff.get_filename(i)):
-                    file_cmd = subprocess.Popen(["git", "show",
-                                                 interval.get_ref() + ":{0}".format(i.strip())],
-                                                bufsize=1, stdout=subprocess.PIPE)
-                    file_r = file_cmd.stdout.readlines()
-                    file_cmd.wait()
-                    file_cmd.stdout.close()
+        filenames = [ f for f in git_utils.files(revision, config, location)
+                      if context.filtering.is_acceptable_file_name(f) ]
 
-                    extension = FileDiff.get_extension(i)
-                    lines = MetricsLogic.get_eloc(file_r, extension)
-                    cycc = MetricsLogic.get_cyclomatic_complexity(file_r, extension)
+        if config.jobs > 1 and len(filenames) > 1:
+            measures = self.__measure_in_processes__(filenames, config, revision, location)
+        else:
+            measures = {}
+            with git_utils.BlobReader(location) as blobs:
+                for f in filenames:
+                    start = time.perf_counter()
+                    measures[f] = __measure__(blobs, revision, f)
+                    if config.debug_mode:
+                        __debug_timing__(f, time.perf_counter() - start)
 
-                    if __metric_eloc__.get(extension, None) is not None and __metric_eloc__[extension] < lines:
-                        self.eloc[i.strip()] = lines
+        # The measures are recorded in the order of the files in the tree
+        for f in filenames:
+            (eloc, cycc, density) = measures.get(f, None) or (None, None, None)
+            if eloc is not None:
+                self.eloc[f] = eloc
+            if cycc is not None:
+                self.cyclomatic_complexity[f] = cycc
+            if density is not None:
+                self.cyclomatic_complexity_density[f] = density
 
-                    if METRIC_CYCLOMATIC_COMPLEXITY_THRESHOLD < cycc:
-                        self.cyclomatic_complexity[i.strip()] = cycc
+    @staticmethod
+    def __measure_in_processes__(filenames, config, revision, location):
+        """
+        Measures the files in a pool of config.jobs processes, returning
+        the measures that cross their thresholds. The largest files are
+        scheduled first, so that none of them is left running alone at
+        the end.
+        """
+        sizes = git_utils.blob_sizes(revision, config, location)
+        scheduled = sorted(filenames, key=lambda f: sizes.get(f, 0), reverse=True)
 
-                    if lines > 0 and METRIC_CYCLOMATIC_COMPLEXITY_DENSITY_THRESHOLD < cycc / float(lines):
-                        self.cyclomatic_complexity_density[i.strip()] = cycc / float(lines)
+        measures = {}
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(config.jobs, len(filenames))) as executor:
+            tasks = [ executor.submit(__run_metrics_process__, location, revision, f, config.debug_mode)
+                      for f in scheduled ]
+            for (f, task) in zip(scheduled, tasks):
+                result = task.result()
+                if result is not None:
+                    (measures[f], elapsed) = result
+                    if elapsed is not None:
+                        __debug_timing__(f, elapsed)
+        return measures
 
     def __iadd__(self, other):
         try:
@@ -103,6 +194,50 @@ class MetricsLogic(object):
         except AttributeError:
             return other
 
+    @staticmethod
+    def get_metrics(file_r, extension):
+        """
+        Returns the ELOC, the number of comment lines and the cyclomatic
+        complexity (-1 when the language is not supported) of the lines
+        in file_r, computed in a single pass. The lines are counted like
+        get_eloc and get_cyclomatic_complexity do, with the markers and the
+        tokens of the extension compiled once.
+        """
+        ((begining, end, line_comment, at_begining), tokens) = __get_scanner__(extension)
+        if begining is None and line_comment is None and tokens is None:
+            return (len(file_r), 0, -1)
+
+        is_inside_comment = False
+        eloc_counter = 0
+        cc_counter = 0
+
+        for i in file_r:
+            stripped = i.strip()
+            is_a_comment = (begining is not None and stripped.startswith(begining)) or \
+                           (end is not None and stripped.endswith(end)) or \
+                           (line_comment is not None and stripped.startswith(line_comment))
+
+            # Same transitions as comment.handle_comment_block
+            if is_inside_comment:
+                is_inside_comment = not (i.startswith(end) if at_begining else end in i)
+            elif begining is not None:
+                if at_begining:
+                    is_inside_comment = i.startswith(begining) and not i.startswith(end)
+                else:
+                    is_inside_comment = begining in i and not end in i
+
+            if not is_inside_comment and not is_a_comment:
+                eloc_counter += 1
+                if tokens is not None and tokens[0](i) is not None:
+                    for search in tokens[1]:
+                        if search(i) is not None:
+                            cc_counter += 2
+                    for search in tokens[2]:
+                        if search(i) is not None:
+                            cc_counter += 1
+
+        return (eloc_counter, len(file_r) - eloc_counter, cc_counter if tokens is not None else -1)
+
     @staticmethod
     def get_cyclomatic_complexity(file_r, extension):
         is_inside_comment = False
@@ -118,7 +253,6 @@ class MetricsLogic(object):
 
         if entry_tokens or exit_tokens:
             for i in file_r:
-                i = i.decode("utf-8", "replace")
                 (_, is_inside_comment) = comment.handle_comment_block(is_inside_comment, extension, i)
 
                 if not is_inside_comment and not comment.is_comment(extension, i):
@@ -138,7 +272,6 @@ class MetricsLogic(object):
         eloc_counter = 0
 
         for i in file_r:
-            i = i.decode("utf-8", "replace")
             (_, is_inside_comment) = comment.handle_comment_block(is_inside_comment, extension, i)
 
             if not is_inside_comment and not comment.is_comment(extension, i):
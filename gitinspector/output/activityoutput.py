@@ -1,5 +1,5 @@
-from .outputable import Outputable
-from .. import gravatar, timeline
+from .outputable import Outputable, Stage
+from .. import gravatar
 
 import os
 import string
@@ -10,17 +10,24 @@ from ..blame import Blame
 
 class ActivityOutput(Outputable):
     output_order = 120
+    name = "activity"
+    stages = [Stage.CHANGES, Stage.TIMELINE]
+
+    @classmethod
+    def is_enabled(cls, config):
+        return bool(config.timeline)
 
     def __init__(self, runner):
         Outputable.__init__(self)
         self.changes = runner.changes
         self.blames = runner.blames
         self.weeks = runner.config.weeks
-        self.display = bool(runner.changes.all_commits()) and runner.config.timeline
+        self.timeline = runner.timeline
+        self.display = bool(runner.changes.all_commits())
         self.out = runner.out
 
     def output_html(self):
-        data = timeline.TimelineData(self.changes, self.weeks)
+        data = self.timeline
 
         if self.weeks:
             periods = [ [d, datetime.datetime.strptime(d + "-1", "%GW%V-%w")]
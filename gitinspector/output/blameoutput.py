@@ -20,29 +20,26 @@
 import json
 import os
 import string
-import sys
 import textwrap
 
 from .. import format, gravatar, terminal
 from ..blame import Blame
-from .outputable import Outputable
+from .outputable import Outputable, Stage
 
 BLAME_INFO_TEXT = lambda: _("Below are the number of rows from each author that have survived and "
                             "are still intact in the current revision")
 
 class BlameOutput(Outputable):
     output_order = 200
+    name = "blame"
+    stages = [Stage.CHANGES, Stage.BLAMES]
 
     def __init__(self, runner):
-        if runner.config.progress and format.is_interactive_format():
-            print("")
-
         Outputable.__init__(self)
         self.changes = runner.changes
         self.blames = runner.blames
         self.display = bool(self.changes.all_commits())
         self.out = runner.out
-        self.progress = runner.config.progress
 
     def output_html(self):
         blames_list = list(self.blames.get_summed_blames().items())
@@ -87,32 +84,23 @@ class BlameOutput(Outputable):
             ))
 
     def output_json(self):
-        message_json = "\t\t\t\"message\": \"" + BLAME_INFO_TEXT() + "\",\n"
-        blame_json = ""
-
-        for i in sorted(self.blames.get_summed_blames().items()):
-            (author_name, author_email) = i[0]
-
-            name_json = "\t\t\t\t\"name\": \"" + author_name + "\",\n"
-            email_json = "\t\t\t\t\"email\": \"" + author_email + "\",\n"
-            gravatar_json = "\t\t\t\t\"gravatar\": \"" + gravatar.get_url(author_email) + "\",\n"
-            rows_json = "\t\t\t\t\"rows\": " + str(i[1].rows) + ",\n"
-            stability_json = ("\t\t\t\t\"stability\": " + "{0:.1f}".format(Blame.get_stability(i[0], i[1].rows,
-                                                                                               self.changes)) + ",\n")
-            age_json = ("\t\t\t\t\"age\": " + "{0:.1f}".format(float(i[1].skew) / i[1].rows) + ",\n")
-            percentage_in_comments_json = ("\t\t\t\t\"percentage_in_comments\": " +
-                                           "{0:.2f}".format(100.0 * i[1].comments / i[1].rows) + "\n")
-            blame_json += ("{\n" + name_json + email_json + gravatar_json + rows_json + stability_json + age_json +
-                           percentage_in_comments_json + "\t\t\t},")
-        # Removing the last trailing ','
-        blame_json = blame_json[:-1]
-
-        self.out.write(",\n\t\t\"blame\": {\n" + message_json + "\t\t\t\"authors\": [\n\t\t\t" + blame_json + "]\n\t\t}")
+        def authors():
+            for (committer, entry) in sorted(self.blames.get_summed_blames().items()):
+                (author_name, author_email) = committer
+                yield {
+                    "name": author_name,
+                    "email": author_email,
+                    "gravatar": gravatar.get_url(author_email),
+                    "rows": entry.rows,
+                    "stability": round(Blame.get_stability(committer, entry.rows, self.changes), 1),
+                    "age": round(float(entry.skew) / entry.rows, 1),
+                    "percentage_in_comments": round(100.0 * entry.comments / entry.rows, 2),
+                }
+
+        format.write_json(self.out, "blame", { "message": BLAME_INFO_TEXT(),
+                                               "authors": authors() })
 
     def output_text(self):
-        if self.progress and sys.stdout.isatty() and format.is_interactive_format():
-            terminal.clear_row()
-
         self.out.writeln(textwrap.fill(BLAME_INFO_TEXT() + ":", width=terminal.get_size()[0]) + "\n")
         terminal.writeb(self.out,
                         terminal.ljust(_("Author"), 21) + terminal.rjust(_("Rows"), 10) +
@@ -128,23 +116,19 @@ class BlameOutput(Outputable):
             self.out.writeln("{0:.2f}".format(100.0 * i[1].comments / i[1].rows).rjust(20))
 
     def output_xml(self):
-        message_xml = "\t\t<message>" + BLAME_INFO_TEXT() + "</message>\n"
-        blame_xml = ""
-
-        for i in sorted(self.blames.get_summed_blames().items()):
-            (author_name, author_email) = i[0]
-
-            name_xml = "\t\t\t\t<name>" + author_name + "</name>\n"
-            email_xml = "\t\t\t\t<email>" + author_email + "</email>\n"
-            gravatar_xml = "\t\t\t\t<gravatar>" + gravatar.get_url(author_email) + "</gravatar>\n"
-            rows_xml = "\t\t\t\t<rows>" + str(i[1].rows) + "</rows>\n"
-            stability_xml = ("\t\t\t\t<stability>" + "{0:.1f}".format(Blame.get_stability(author_name, i[1].rows,
-                                                                                          self.changes)) + "</stability>\n")
-            age_xml = ("\t\t\t\t<age>" + "{0:.1f}".format(float(i[1].skew) / i[1].rows) + "</age>\n")
-            percentage_in_comments_xml = ("\t\t\t\t<percentage-in-comments>" +
-                                          "{0:.2f}".format(100.0 * i[1].comments / i[1].rows) + "</percentage-in-comments>\n")
-            blame_xml += ("\t\t\t<author>\n" + name_xml + email_xml + gravatar_xml + rows_xml + stability_xml +
-                          age_xml + percentage_in_comments_xml + "\t\t\t</author>\n")
-
-        self.out.writeln("\t<blame>\n" + message_xml + "\t\t<authors>\n" +
-                         blame_xml + "\t\t</authors>\n\t</blame>")
+        def authors():
+            for (committer, entry) in sorted(self.blames.get_summed_blames().items()):
+                (author_name, author_email) = committer
+                yield ("author", {
+                    "name": author_name,
+                    "email": author_email,
+                    "gravatar": gravatar.get_url(author_email),
+                    "rows": entry.rows,
+                    "stability": "{0:.1f}".format(Blame.get_stability(committer, entry.rows,
+                                                                      self.changes)),
+                    "age": "{0:.1f}".format(float(entry.skew) / entry.rows),
+                    "percentage-in-comments": "{0:.2f}".format(100.0 * entry.comments / entry.rows),
+                })
+
+        format.write_xml(self.out, "blame", { "message": BLAME_INFO_TEXT(),
+                                              "authors": authors() })
@@ -31,6 +31,7 @@ NO_COMMITED_FILES_TEXT = lambda: _("No commited files with the specified extensi
 
 class ChangesOutput(Outputable):
     output_order = 100
+    name = "changes"
 
     def __init__(self, runner):
         Outputable.__init__(self)
@@ -66,7 +67,7 @@ class ChangesOutput(Outputable):
                     authortypes[t] = 0
             othertypes = len(self.changes.filtered_files(committer))
             max_other = max(max_other, othertypes)
-            authorinfo.types = "<svg class='changes_svg_types'>{0}</svg>".format(\
+            types = "<svg class='changes_svg_types'>{0}</svg>".format(\
                                     json.dumps({ "relevant" : authortypes,
                                                  "other" :  othertypes }))
 
@@ -78,7 +79,7 @@ class ChangesOutput(Outputable):
                 "commits" : authorinfo.commits,
                 "insertions" : authorinfo.insertions,
                 "deletions" : authorinfo.deletions,
-                "types" : authorinfo.types,
+                "types" : types,
                 "changes" : round(percentage,2),
                 })
 
@@ -100,31 +101,26 @@ class ChangesOutput(Outputable):
             total_changes += authorinfo_list.get(i).deletions
 
         if authorinfo_list:
-            message_json = "\t\t\t\"message\": \"" + HISTORICAL_INFO_TEXT() + "\",\n"
-            changes_json = ""
-
-            for committer in sorted(authorinfo_list):
-                (author_name, author_email) = committer
-                authorinfo = authorinfo_list.get(committer)
-                percentage = 0 if total_changes == 0 else \
-                    (authorinfo.insertions + authorinfo.deletions) / total_changes * 100
-
-                changes_json += "{\n"
-                changes_json += "\t\t\t\t\"name\": \"" + author_name + "\",\n"
-                changes_json += "\t\t\t\t\"email\": \"" + author_email + "\",\n"
-                changes_json += "\t\t\t\t\"gravatar\": \"" + gravatar.get_url(author_email) + "\",\n"
-                changes_json += "\t\t\t\t\"commits\": " + str(authorinfo.commits) + ",\n"
-                changes_json += "\t\t\t\t\"insertions\": " + str(authorinfo.insertions) + ",\n"
-                changes_json += "\t\t\t\t\"deletions\": " + str(authorinfo.deletions) + ",\n"
-                changes_json += "\t\t\t\t\"percentage_of_changes\": " + "{0:.2f}".format(percentage) + "\n"
-                changes_json += "\t\t\t},"
-
-            # Removing the last trailing ','
-            changes_json = changes_json[:-1]
-
-            self.out.write("\t\t\"changes\": {\n" + message_json + "\t\t\t\"authors\": [\n\t\t\t" + changes_json + "]\n\t\t}")
+            def authors():
+                for committer in sorted(authorinfo_list):
+                    (author_name, author_email) = committer
+                    authorinfo = authorinfo_list.get(committer)
+                    percentage = 0 if total_changes == 0 else \
+                        (authorinfo.insertions + authorinfo.deletions) / total_changes * 100
+                    yield {
+                        "name": author_name,
+                        "email": author_email,
+                        "gravatar": gravatar.get_url(author_email),
+                        "commits": authorinfo.commits,
+                        "insertions": authorinfo.insertions,
+                        "deletions": authorinfo.deletions,
+                        "percentage_of_changes": round(percentage, 2),
+                    }
+
+            format.write_json(self.out, "changes", { "message": HISTORICAL_INFO_TEXT(),
+                                                     "authors": authors() })
         else:
-            self.out.writeln("\t\t\"exception\": \"" + NO_COMMITED_FILES_TEXT() + "\"")
+            format.write_json(self.out, "exception", NO_COMMITED_FILES_TEXT())
 
     def output_text(self):
         authorinfo_list = self.changes.get_authorinfo_list()
@@ -165,27 +161,23 @@ class ChangesOutput(Outputable):
             total_changes += authorinfo_list.get(i).deletions
 
         if authorinfo_list:
-            message_xml = "\t\t<message>" + HISTORICAL_INFO_TEXT() + "</message>\n"
-            changes_xml = ""
-
-            for committer in sorted(authorinfo_list):
-                (author_name, author_email) = committer
-                authorinfo = authorinfo_list.get(committer)
-                percentage = 0 if total_changes == 0 else (authorinfo.insertions + authorinfo.deletions) / total_changes * 100
-
-                changes_xml += "\t\t\t<author>\n"
-                changes_xml += "\t\t\t\t<name>" + author_name + "</name>\n"
-                changes_xml += "\t\t\t\t<email>" + author_email + "</email>\n"
-                changes_xml += "\t\t\t\t<gravatar>" + gravatar.get_url(author_email) + "</gravatar>\n"
-                changes_xml += "\t\t\t\t<commits>" + str(authorinfo.commits) + "</commits>\n"
-                changes_xml += "\t\t\t\t<insertions>" + str(authorinfo.insertions) + "</insertions>\n"
-                changes_xml += "\t\t\t\t<deletions>" + str(authorinfo.deletions) + "</deletions>\n"
-                changes_xml += "\t\t\t\t<percentage-of-changes>" + "{0:.2f}".format(percentage) + \
-                               "</percentage-of-changes>\n"
-                changes_xml += "\t\t\t</author>\n"
-
-            self.out.writeln("\t<changes>\n" + message_xml + "\t\t<authors>\n" +
-                             changes_xml + "\t\t</authors>\n\t</changes>")
+            def authors():
+                for committer in sorted(authorinfo_list):
+                    (author_name, author_email) = committer
+                    authorinfo = authorinfo_list.get(committer)
+                    percentage = 0 if total_changes == 0 else \
+                        (authorinfo.insertions + authorinfo.deletions) / total_changes * 100
+                    yield ("author", {
+                        "name": author_name,
+                        "email": author_email,
+                        "gravatar": gravatar.get_url(author_email),
+                        "commits": authorinfo.commits,
+                        "insertions": authorinfo.insertions,
+                        "deletions": authorinfo.deletions,
+                        "percentage-of-changes": "{0:.2f}".format(percentage),
+                    })
+
+            format.write_xml(self.out, "changes", { "message": HISTORICAL_INFO_TEXT(),
+                                                    "authors": authors() })
         else:
-            self.out.writeln("\t<changes>\n\t\t<exception>" + NO_COMMITED_FILES_TEXT() +
-                             "</exception>\n\t</changes>")
+            format.write_xml(self.out, "changes", { "exception": NO_COMMITED_FILES_TEXT() })
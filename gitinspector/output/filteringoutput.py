@@ -22,9 +22,9 @@ import string
 import textwrap
 
 from ..changes import FileType
-from ..filtering import get_filtered, has_filtered, Filters
+from ..filtering import Filters
 from .outputable import Outputable
-from .. import terminal
+from .. import format, terminal
 
 FILTERING_FILE_INFO_TEXT = lambda: _("The following files were excluded from the statistics due to the specified exclusion patterns")
 FILTERING_AUTHOR_INFO_TEXT = lambda: _("The following authors were excluded from the statistics due to the specified exclusion patterns")
@@ -35,11 +35,13 @@ FILTERING_COMMIT_INFO_TEXT = lambda: _("The following commit revisions were excl
 
 class FilteringOutput(Outputable):
     output_order = 600
+    name = "filtering"
 
     def __init__(self, runner):
         Outputable.__init__(self)
         self.display = bool(runner.changes.all_commits())
         self.changes = runner.changes
+        self.filtering = runner.context.filtering
         self.out = runner.out
 
     @staticmethod
@@ -58,7 +60,7 @@ class FilteringOutput(Outputable):
         authorinfo_dict = self.changes.get_authorinfo_list()
         filtered_files = {k:self.changes.filtered_files(k) for k in authorinfo_dict}
         filtered_sizes = [len(s) for s in filtered_files.values()]
-        if has_filtered() or any(filtered_sizes):
+        if self.filtering.has_filtered() or any(filtered_sizes):
             other_files = "<table class='git2'>"
             par = "even"
             for committer, files in filtered_files.items():
@@ -82,45 +84,32 @@ class FilteringOutput(Outputable):
                 self.out.write(src.substitute(
                     other_files=other_files,
                     files_filtering_text=FILTERING_FILE_INFO_TEXT(),
-                    files_filtered=", ".join(get_filtered(Filters.FILE_OUT)),
+                    files_filtered=", ".join(self.filtering.get_filtered(Filters.FILE_OUT)),
                     authors_filtering_text=FILTERING_AUTHOR_INFO_TEXT(),
-                    authors_filtered=", ".join(get_filtered(Filters.AUTHOR)),
+                    authors_filtered=", ".join(self.filtering.get_filtered(Filters.AUTHOR)),
                     emails_filtering_text=FILTERING_EMAIL_INFO_TEXT(),
-                    emails_filtered=", ".join(get_filtered(Filters.EMAIL)),
+                    emails_filtered=", ".join(self.filtering.get_filtered(Filters.EMAIL)),
                     commits_filtering_text=FILTERING_COMMIT_INFO_TEXT(),
-                    commits_filtered=", ".join(get_filtered(Filters.REVISION)),
+                    commits_filtered=", ".join(self.filtering.get_filtered(Filters.REVISION)),
                 ))
 
-    @staticmethod
-    def __output_json_section__(info_string, filtered, container_tagname):
-        if filtered:
-            message_json = "\t\t\t\t\"message\": \"" + info_string + "\",\n"
-            filtering_json = ""
-
-            for i in filtered:
-                filtering_json += "\t\t\t\t\t\"" + i + "\",\n"
-            # Removing the last trailing '\n'
-            filtering_json = filtering_json[:-3]
-
-            return "\n\t\t\t\"{0}\": {{\n".format(container_tagname) + message_json + \
-                "\t\t\t\t\"entries\": [\n" + filtering_json + "\"\n\t\t\t\t]\n\t\t\t},"
-
-        return ""
+    def __sections__(self):
+        """
+        Returns the non empty sections of the filtered items, as
+        (container tag name, info string, filtered items) triples.
+        """
+        filtered = self.filtering.get_filtered
+        sections = [("files", FILTERING_FILE_INFO_TEXT(), filtered(Filters.FILE_OUT)),
+                    ("authors", FILTERING_AUTHOR_INFO_TEXT(), filtered(Filters.AUTHOR)),
+                    ("emails", FILTERING_EMAIL_INFO_TEXT(), filtered(Filters.EMAIL)),
+                    ("revision", FILTERING_COMMIT_INFO_TEXT(), filtered(Filters.REVISION))]
+        return [ s for s in sections if s[2] ]
 
     def output_json(self):
-        if has_filtered():
-            output = ",\n\t\t\"filtering\": {"
-            output += FilteringOutput.__output_json_section__(FILTERING_FILE_INFO_TEXT(),
-                                                              get_filtered(Filters.FILE_OUT), "files")
-            output += FilteringOutput.__output_json_section__(FILTERING_AUTHOR_INFO_TEXT(),
-                                                              get_filtered(Filters.AUTHOR), "authors")
-            output += FilteringOutput.__output_json_section__(FILTERING_EMAIL_INFO_TEXT(),
-                                                              get_filtered(Filters.EMAIL), "emails")
-            output += FilteringOutput.__output_json_section__(FILTERING_COMMIT_INFO_TEXT(),
-                                                              get_filtered(Filters.REVISION), "revision")
-            output = output[:-1]
-            output += "\n\t\t}"
-            self.out.write(output)
+        if self.filtering.has_filtered():
+            format.write_json(self.out, "filtering", {
+                container_tagname: { "message": info_string, "entries": filtered }
+                for (container_tagname, info_string, filtered) in self.__sections__() })
 
     def __output_text_section__(self, info_string, filtered):
         if filtered:
@@ -131,32 +120,15 @@ class FilteringOutput(Outputable):
                 self.out.writeln("...%s" % i[-width+3:] if len(i) > width else i)
 
     def output_text(self):
-        self.__output_text_section__(FILTERING_FILE_INFO_TEXT(), get_filtered(Filters.FILE_OUT))
-        self.__output_text_section__(FILTERING_AUTHOR_INFO_TEXT(), get_filtered(Filters.AUTHOR))
-        self.__output_text_section__(FILTERING_EMAIL_INFO_TEXT(), get_filtered(Filters.EMAIL))
-        self.__output_text_section__(FILTERING_COMMIT_INFO_TEXT(), get_filtered(Filters.REVISION))
-
-    def __output_xml_section__(self, info_string, filtered, container_tagname):
-        if filtered:
-            message_xml = "\t\t\t<message>" + info_string + "</message>\n"
-            filtering_xml = ""
-
-            for i in filtered:
-                filtering_xml += "\t\t\t\t<entry>" + i + "</entry>\n"
-
-            self.out.writeln("\t\t<{0}>".format(container_tagname))
-            self.out.writeln(message_xml + "\t\t\t<entries>\n" + filtering_xml + "\t\t\t</entries>\n")
-            self.out.writeln("\t\t</{0}>".format(container_tagname))
+        filtered = self.filtering.get_filtered
+        self.__output_text_section__(FILTERING_FILE_INFO_TEXT(), filtered(Filters.FILE_OUT))
+        self.__output_text_section__(FILTERING_AUTHOR_INFO_TEXT(), filtered(Filters.AUTHOR))
+        self.__output_text_section__(FILTERING_EMAIL_INFO_TEXT(), filtered(Filters.EMAIL))
+        self.__output_text_section__(FILTERING_COMMIT_INFO_TEXT(), filtered(Filters.REVISION))
 
     def output_xml(self):
-        if has_filtered():
-            self.out.writeln("\t<filtering>")
-            self.__output_xml_section__(FILTERING_FILE_INFO_TEXT(),
-                                        get_filtered(Filters.FILE_OUT), "files")
-            self.__output_xml_section__(FILTERING_AUTHOR_INFO_TEXT(),
-                                        get_filtered(Filters.AUTHOR), "authors")
-            self.__output_xml_section__(FILTERING_EMAIL_INFO_TEXT(),
-                                        get_filtered(Filters.EMAIL), "emails")
-            self.__output_xml_section__(FILTERING_COMMIT_INFO_TEXT(),
-                                        get_filtered(Filters.REVISION), "revision")
-            self.out.writeln("\t</filtering>")
+        if self.filtering.has_filtered():
+            format.write_xml(self.out, "filtering", [
+                (container_tagname, { "message": info_string,
+                                      "entries": [ ("entry", i) for i in filtered ] })
+                for (container_tagname, info_string, filtered) in self.__sections__() ])
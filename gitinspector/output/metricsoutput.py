@@ -22,7 +22,8 @@ import string
 
 from ..changes import FileDiff
 from ..metrics import (__metric_eloc__, METRIC_CYCLOMATIC_COMPLEXITY_THRESHOLD, METRIC_CYCLOMATIC_COMPLEXITY_DENSITY_THRESHOLD)
-from .outputable import Outputable
+from .outputable import Outputable, Stage
+from .. import format
 
 ELOC_INFO_TEXT = lambda: _("The following files are suspiciously big (in order of severity)")
 CYCLOMATIC_COMPLEXITY_TEXT = lambda: _("The following files have an elevated cyclomatic complexity (in order of severity)")
@@ -42,11 +43,17 @@ def __get_metrics_score__(ceiling, value):
 
 class MetricsOutput(Outputable):
     output_order = 400
+    name = "metrics"
+    stages = [Stage.CHANGES, Stage.METRICS]
+
+    @classmethod
+    def is_enabled(cls, config):
+        return bool(config.metrics)
 
     def __init__(self, runner):
         Outputable.__init__(self)
         self.metrics = runner.metrics
-        self.display = bool(runner.changes.all_commits()) and bool(runner.config.metrics)
+        self.display = bool(runner.changes.all_commits())
         self.out = runner.out
 
     def output_text(self):
@@ -120,71 +127,34 @@ class MetricsOutput(Outputable):
                 metrics_comp=metrics_comp_dict,
             ))
 
+    def __violations__(self):
+        """
+        Generates the violations as (type, file name, value) triples,
+        by type and by decreasing value.
+        """
+        for (violation_type, metric) in [("estimated-lines-of-code", self.metrics.eloc),
+                                         ("cyclomatic-complexity", self.metrics.cyclomatic_complexity),
+                                         ("cyclomatic-complexity-density",
+                                          self.metrics.cyclomatic_complexity_density)]:
+            for i in sorted(set([(j, i) for (i, j) in metric.items()]), reverse=True):
+                yield (violation_type, i[1], i[0])
+
     def output_json(self):
         if not self.metrics.eloc and not self.metrics.cyclomatic_complexity and not self.metrics.cyclomatic_complexity_density:
-            self.out.write(",\n\t\t\"metrics\": {\n\t\t\t\"message\": \"" + METRICS_MISSING_INFO_TEXT() +
-                           "\"\n\t\t}")
+            format.write_json(self.out, "metrics", { "message": METRICS_MISSING_INFO_TEXT() })
         else:
-            eloc_json = ""
-
-            if self.metrics.eloc:
-                for i in sorted(set([(j, i) for (i, j) in self.metrics.eloc.items()]), reverse=True):
-                    eloc_json += "{\n\t\t\t\t\"type\": \"estimated-lines-of-code\",\n"
-                    eloc_json += "\t\t\t\t\"file_name\": \"" + i[1] + "\",\n"
-                    eloc_json += "\t\t\t\t\"value\": " + str(i[0]) + "\n"
-                    eloc_json += "\t\t\t},"
-                # Removing the last trailing ','
-                if not self.metrics.cyclomatic_complexity:
-                    eloc_json = eloc_json[:-1]
-
-            if self.metrics.cyclomatic_complexity:
-                for i in sorted(set([(j, i) for (i, j) in self.metrics.cyclomatic_complexity.items()]), reverse=True):
-                    eloc_json += "{\n\t\t\t\t\"type\": \"cyclomatic-complexity\",\n"
-                    eloc_json += "\t\t\t\t\"file_name\": \"" + i[1] + "\",\n"
-                    eloc_json += "\t\t\t\t\"value\": " + str(i[0]) + "\n"
-                    eloc_json += "\t\t\t},"
-                # Removing the last trailing ','
-                if not self.metrics.cyclomatic_complexity_density:
-                    eloc_json = eloc_json[:-1]
-
-            if self.metrics.cyclomatic_complexity_density:
-                for i in sorted(set([(j, i) for (i, j) in self.metrics.cyclomatic_complexity_density.items()]), reverse=True):
-                    eloc_json += "{\n\t\t\t\t\"type\": \"cyclomatic-complexity-density\",\n"
-                    eloc_json += "\t\t\t\t\"file_name\": \"" + i[1] + "\",\n"
-                    eloc_json += "\t\t\t\t\"value\": {0:.3f}\n".format(i[0])
-                    eloc_json += "\t\t\t},"
-                # Removing the last trailing ','
-                eloc_json = eloc_json[:-1]
-
-            self.out.write(",\n\t\t\"metrics\": {\n\t\t\t\"violations\": [\n\t\t\t" + eloc_json +
-                           "]\n\t\t}")
+            violations = ({ "type": violation_type,
+                            "file_name": file_name,
+                            "value": round(value, 3) if isinstance(value, float) else value }
+                          for (violation_type, file_name, value) in self.__violations__())
+            format.write_json(self.out, "metrics", { "violations": violations })
 
     def output_xml(self):
         if not self.metrics.eloc and not self.metrics.cyclomatic_complexity and not self.metrics.cyclomatic_complexity_density:
-            self.out.writeln("\t<metrics>\n\t\t<message>" + METRICS_MISSING_INFO_TEXT() +
-                             "</message>\n\t</metrics>")
+            format.write_xml(self.out, "metrics", { "message": METRICS_MISSING_INFO_TEXT() })
         else:
-            eloc_xml = ""
-
-            if self.metrics.eloc:
-                for i in sorted(set([(j, i) for (i, j) in self.metrics.eloc.items()]), reverse=True):
-                    eloc_xml += "\t\t\t<estimated-lines-of-code>\n"
-                    eloc_xml += "\t\t\t\t<file-name>" + i[1] + "</file-name>\n"
-                    eloc_xml += "\t\t\t\t<value>" + str(i[0]) + "</value>\n"
-                    eloc_xml += "\t\t\t</estimated-lines-of-code>\n"
-
-            if self.metrics.cyclomatic_complexity:
-                for i in sorted(set([(j, i) for (i, j) in self.metrics.cyclomatic_complexity.items()]), reverse=True):
-                    eloc_xml += "\t\t\t<cyclomatic-complexity>\n"
-                    eloc_xml += "\t\t\t\t<file-name>" + i[1] + "</file-name>\n"
-                    eloc_xml += "\t\t\t\t<value>" + str(i[0]) + "</value>\n"
-                    eloc_xml += "\t\t\t</cyclomatic-complexity>\n"
-
-            if self.metrics.cyclomatic_complexity_density:
-                for i in sorted(set([(j, i) for (i, j) in self.metrics.cyclomatic_complexity_density.items()]), reverse=True):
-                    eloc_xml += "\t\t\t<cyclomatic-complexity-density>\n"
-                    eloc_xml += "\t\t\t\t<file-name>" + i[1] + "</file-name>\n"
-                    eloc_xml += "\t\t\t\t<value>{0:.3f}</value>\n".format(i[0])
-                    eloc_xml += "\t\t\t</cyclomatic-complexity-density>\n"
-
-            self.out.writeln("\t<metrics>\n\t\t<violations>\n" + eloc_xml + "\t\t</violations>\n\t</metrics>")
+            violations = ((violation_type, {
+                "file-name": file_name,
+                "value": "{0:.3f}".format(value) if isinstance(value, float) else value })
+                          for (violation_type, file_name, value) in self.__violations__())
+            format.write_xml(self.out, "metrics", { "violations": violations })
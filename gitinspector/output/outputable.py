@@ -20,11 +20,25 @@
 import glob
 import importlib
 import os
+from enum import Enum
 from .. import format
 
 
+class Stage(Enum):
+    """
+    An enumeration class representing the stages of the analysis that
+    the outputs depend on
+    """
+    CHANGES = "changes"
+    BLAMES = "blames"
+    METRICS = "metrics"
+    TIMELINE = "timeline"
+
+
 class Outputable(object):
     outputables = [] # Children classes
+    name = None               # The name given to --only, None if not selectable
+    stages = [Stage.CHANGES]  # The stages of the analysis the output depends on
 
     def __init__(self):
         self.display = False
@@ -40,6 +54,21 @@ class Outputable(object):
         """
         return sorted(Outputable.outputables, key=(lambda c: c.output_order))
 
+    @classmethod
+    def names(cls):
+        """
+        List the names of the outputs that can be selected with --only
+        """
+        return sorted(set(c.name for c in Outputable.outputables if c.name is not None))
+
+    @classmethod
+    def is_enabled(cls, config):
+        """
+        Tests if the output is requested by the options in `config`,
+        when no output is explicitly selected with --only
+        """
+        return True
+
     def output_html(self):
         raise NotImplementedError(_("HTML output not yet supported in") +
                                   " \"" + self.__class__.__name__ + "\".")
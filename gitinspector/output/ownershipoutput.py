@@ -1,4 +1,4 @@
-from .outputable import Outputable
+from .outputable import Outputable, Stage
 
 import os
 import string
@@ -38,6 +38,12 @@ class FileOwnerships(object):
 
 class OwnershipOutput(Outputable):
     output_order = 120
+    name = "ownership"
+    stages = [Stage.CHANGES, Stage.BLAMES]
+
+    @classmethod
+    def is_enabled(cls, config):
+        return any(f in ["html", "htmlembedded"] for f in config.format)
 
     def __init__(self, runner):
         Outputable.__init__(self)
@@ -22,7 +22,7 @@ import string
 import textwrap
 
 from .. import format, gravatar, terminal
-from .outputable import Outputable
+from .outputable import Outputable, Stage
 
 RESPONSIBILITIES_INFO_TEXT = lambda: _("The following responsibilities, by author, were found in the current "
                                        "revision of the repository (comments are excluded from the line count, "
@@ -31,12 +31,18 @@ MOSTLY_RESPONSIBLE_FOR_TEXT = lambda: _("is mostly responsible for")
 
 class ResponsibilitiesOutput(Outputable):
     output_order = 500
+    name = "responsibilities"
+    stages = [Stage.CHANGES, Stage.BLAMES]
+
+    @classmethod
+    def is_enabled(cls, config):
+        return bool(config.responsibilities)
 
     def __init__(self, runner):
         Outputable.__init__(self)
         self.changes = runner.changes
         self.blame = runner.blames
-        self.display = bool(runner.changes.all_commits()) and bool(runner.config.responsibilities)
+        self.display = bool(runner.changes.all_commits())
         self.out = runner.out
 
     def output_text(self):
@@ -97,67 +103,35 @@ class ResponsibilitiesOutput(Outputable):
                 resp_inner_text=resp_xml,
             ))
 
-    def output_json(self):
-        message_json = "\t\t\t\"message\": \"" + RESPONSIBILITIES_INFO_TEXT() + "\",\n"
-        resp_json = ""
-
+    def __responsibilities__(self):
+        """
+        Generates the committers having responsibilities, with their ten
+        main files as (rows, file) pairs.
+        """
         for committer in self.blame.committers_by_responsibilities():
             responsibilities = sorted(((resp[1], resp[0])
                                        for resp in self.blame.get_responsibilities(committer)),
                                       reverse=True)
-
             if responsibilities:
-                (author_name, author_email) = committer
-
-                resp_json += "{\n"
-                resp_json += "\t\t\t\t\"name\": \"" + author_name + "\",\n"
-                resp_json += "\t\t\t\t\"email\": \"" + author_email + "\",\n"
-                resp_json += "\t\t\t\t\"gravatar\": \"" + gravatar.get_url(author_email) + "\",\n"
-                resp_json += "\t\t\t\t\"files\": [\n\t\t\t\t"
-
-                for j, entry in enumerate(responsibilities):
-                    resp_json += "{\n"
-                    resp_json += "\t\t\t\t\t\"name\": \"" + entry[1] + "\",\n"
-                    resp_json += "\t\t\t\t\t\"rows\": " + str(entry[0]) + "\n"
-                    resp_json += "\t\t\t\t},"
-
-                    if j >= 9:
-                        break
+                yield (committer, responsibilities[0:10])
 
-                resp_json = resp_json[:-1]
-                resp_json += "]\n\t\t\t},"
+    def output_json(self):
+        authors = ({ "name": author_name,
+                     "email": author_email,
+                     "gravatar": gravatar.get_url(author_email),
+                     "files": [ { "name": f, "rows": rows } for (rows, f) in responsibilities ] }
+                   for ((author_name, author_email), responsibilities) in self.__responsibilities__())
 
-        resp_json = resp_json[:-1]
-        self.out.write(",\n\t\t\"responsibilities\": {\n" + message_json + "\t\t\t\"authors\": [\n\t\t\t" +
-                       resp_json + "]\n\t\t}")
+        format.write_json(self.out, "responsibilities", { "message": RESPONSIBILITIES_INFO_TEXT(),
+                                                          "authors": authors })
 
     def output_xml(self):
-        message_xml = "\t\t<message>" + RESPONSIBILITIES_INFO_TEXT() + "</message>\n"
-        resp_xml = ""
-
-        for committer in self.blame.committers_by_responsibilities():
-            (author_name, author_email) = committer
-            responsibilities = sorted(((resp[1], resp[0])
-                                       for resp in self.blame.get_responsibilities(committer)),
-                                      reverse=True)
-            if responsibilities:
-                resp_xml += "\t\t\t<author>\n"
-                resp_xml += "\t\t\t\t<name>" + author_name + "</name>\n"
-                resp_xml += "\t\t\t\t<email>" + author_email + "</email>\n"
-                resp_xml += "\t\t\t\t<gravatar>" + gravatar.get_url(author_email) + "</gravatar>\n"
-                resp_xml += "\t\t\t\t<files>\n"
-
-                for j, entry in enumerate(responsibilities):
-                    resp_xml += "\t\t\t\t\t<file>\n"
-                    resp_xml += "\t\t\t\t\t\t<name>" + entry[1] + "</name>\n"
-                    resp_xml += "\t\t\t\t\t\t<rows>" + str(entry[0]) + "</rows>\n"
-                    resp_xml += "\t\t\t\t\t</file>\n"
-
-                    if j >= 9:
-                        break
-
-                resp_xml += "\t\t\t\t</files>\n"
-                resp_xml += "\t\t\t</author>\n"
-
-        self.out.writeln("\t<responsibilities>\n" + message_xml + "\t\t<authors>\n" + resp_xml +
-                         "\t\t</authors>\n\t</responsibilities>")
+        authors = (("author", { "name": author_name,
+                                "email": author_email,
+                                "gravatar": gravatar.get_url(author_email),
+                                "files": [ ("file", { "name": f, "rows": rows })
+                                           for (rows, f) in responsibilities ] })
+                   for ((author_name, author_email), responsibilities) in self.__responsibilities__())
+
+        format.write_xml(self.out, "responsibilities", { "message": RESPONSIBILITIES_INFO_TEXT(),
+                                                         "authors": authors })
@@ -0,0 +1,64 @@
+# coding: utf-8
+#
+# Copyright © 2012-2017 Ejwa Software. All rights reserved.
+#
+# This file is part of gitinspector.
+#
+# gitinspector is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# gitinspector is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
+
+import textwrap
+
+from .outputable import Outputable
+from .. import format, terminal
+
+SKIPPED_INFO_TEXT = lambda: _("The following outputs were skipped, as the analyses they depend on "
+                              "were disabled")
+
+
+class SkippedOutput(Outputable):
+    """
+    Reports the outputs that were requested, but whose stages were
+    not computed by the Runner.
+    """
+    output_order = 700
+    stages = []
+
+    def __init__(self, runner):
+        Outputable.__init__(self)
+        self.skipped = [ (o.name, ", ".join(s.value for s in o.stages if s not in runner.stages))
+                         for o in runner.skipped ]
+        self.display = bool(self.skipped)
+        self.out = runner.out
+
+    def output_html(self):
+        entries = ", ".join("{0} ({1})".format(name, stages) for (name, stages) in self.skipped)
+        self.out.writeln("<div id=\"skipped_div\">\n  <div class=\"box\">\n" +
+                         "    <p>" + SKIPPED_INFO_TEXT() + ": " + entries + ".</p>\n" +
+                         "  </div>\n</div>")
+
+    def output_json(self):
+        format.write_json(self.out, "skipped", {
+            "message": SKIPPED_INFO_TEXT(),
+            "outputs": [ { "name": name, "stages": stages } for (name, stages) in self.skipped ] })
+
+    def output_text(self):
+        self.out.writeln("\n" + textwrap.fill(SKIPPED_INFO_TEXT() + ":", width=terminal.get_size()[0]))
+        for (name, stages) in self.skipped:
+            self.out.writeln("{0} ({1})".format(name, stages))
+
+    def output_xml(self):
+        format.write_xml(self.out, "skipped", {
+            "message": SKIPPED_INFO_TEXT(),
+            "outputs": [ ("output", { "name": name, "stages": stages })
+                         for (name, stages) in self.skipped ] })
@@ -21,8 +21,8 @@ import os
 import string
 import textwrap
 
-from .. import format, gravatar, terminal, timeline
-from .outputable import Outputable
+from .. import format, gravatar, terminal
+from .outputable import Outputable, Stage
 
 MODIFIED_ROWS_TEXT = lambda: _("Modified Rows:")
 TIMELINE_INFO_TEXT = lambda: _("The following history timeline has been gathered from the repository")
@@ -30,13 +30,19 @@ TIMELINE_INFO_TEXT = lambda: _("The following history timeline has been gathered
 
 class TimelineOutput(Outputable):
     output_order = 300
+    name = "timeline"
+    stages = [Stage.CHANGES, Stage.TIMELINE]
+
+    @classmethod
+    def is_enabled(cls, config):
+        return bool(config.timeline) and bool(config.legacy)
 
     def __init__(self, runner):
         Outputable.__init__(self)
         self.changes = runner.changes
         self.useweeks = runner.config.weeks
-        self.display = bool(runner.changes.all_commits()) and \
-            bool(runner.config.timeline) and bool(runner.config.legacy)
+        self.timeline = runner.timeline
+        self.display = bool(runner.changes.all_commits())
         self.out = runner.out
 
     def output_text(self):
@@ -44,7 +50,7 @@ class TimelineOutput(Outputable):
             self.out.writeln("\n" + textwrap.fill(TIMELINE_INFO_TEXT() +
                                                   ":", width=terminal.get_size()[0]))
 
-            timeline_data = timeline.TimelineData(self.changes, self.useweeks)
+            timeline_data = self.timeline
             periods = timeline_data.get_periods()
             names = timeline_data.get_committers()
             (width, _unused) = terminal.get_size()
@@ -57,7 +63,7 @@ class TimelineOutput(Outputable):
         timeline_xml = ""
 
         if self.changes.all_commits():
-            timeline_data = timeline.TimelineData(self.changes, self.useweeks)
+            timeline_data = self.timeline
 
             periods = timeline_data.get_periods()
             names = timeline_data.get_committers()
@@ -77,80 +83,58 @@ class TimelineOutput(Outputable):
                 tim_inner_text=timeline_xml,
             ))
 
-    def output_json(self):
-        if self.changes.all_commits():
-            message_json = "\t\t\t\"message\": \"" + TIMELINE_INFO_TEXT() + "\",\n"
-            timeline_json = ""
-            periods_json = "\t\t\t\"period_length\": \"{0}\",\n".format("week" if self.useweeks else "month")
-            periods_json += "\t\t\t\"periods\": [\n\t\t\t"
-
-            timeline_data = timeline.TimelineData(self.changes, self.useweeks)
-            names = timeline_data.get_committers()
-
-            for period in timeline_data.get_periods():
-                name_json = "\t\t\t\t\"name\": \"" + str(period) + "\",\n"
-                authors_json = "\t\t\t\t\"authors\": [\n\t\t\t\t"
-
-                for name in names:
-                    if timeline_data.is_author_in_period(period, name[0]):
-                        multiplier = timeline_data.get_multiplier(period, 24)
-                        signs = timeline_data.get_author_signs_in_period(name[0], period, multiplier)
-                        signs_str = (signs[1] * "-" + signs[0] * "+")
-
-                        if not signs_str:
-                            signs_str = "."
+    def __periods__(self):
+        """
+        Generates the periods of the timeline, with the work of each
+        author in the period as (author, signs) pairs, and the number of
+        modified rows.
+        """
+        timeline_data = self.timeline
+        names = timeline_data.get_committers()
+
+        for period in timeline_data.get_periods():
+            authors = []
+            for name in names:
+                if timeline_data.is_author_in_period(period, name[0]):
+                    multiplier = timeline_data.get_multiplier(period, 24)
+                    signs = timeline_data.get_author_signs_in_period(name[0], period, multiplier)
+                    signs_str = (signs[1] * "-" + signs[0] * "+")
 
-                        authors_json += "{\n\t\t\t\t\t\"name\": \"" + name[0] + "\",\n"
-                        authors_json += "\t\t\t\t\t\"email\": \"" + name[1] + "\",\n"
-                        authors_json += "\t\t\t\t\t\"gravatar\": \"" + gravatar.get_url(name[1]) + "\",\n"
-                        authors_json += "\t\t\t\t\t\"work\": \"" + signs_str + "\"\n\t\t\t\t},"
-                # Removing the last trailing ','
-                authors_json = authors_json[:-1]
+                    if not signs_str:
+                        signs_str = "."
+                    authors.append((name, signs_str))
 
-                authors_json += "],\n"
-                modified_rows_json = "\t\t\t\t\"modified_rows\": " + \
-                            str(timeline_data.get_total_changes_in_period(period)[2]) + "\n"
-                timeline_json += "{\n" + name_json + authors_json + modified_rows_json + "\t\t\t},"
-            # Removing the last trailing ','
-            timeline_json = timeline_json[:-1]
+            yield (period, authors, timeline_data.get_total_changes_in_period(period)[2])
 
-            self.out.write(",\n\t\t\"timeline\": {\n" + message_json + periods_json + timeline_json +
-                           "]\n\t\t}")
+    def output_json(self):
+        if self.changes.all_commits():
+            periods = ({ "name": str(period),
+                         "authors": [ { "name": name[0],
+                                        "email": name[1],
+                                        "gravatar": gravatar.get_url(name[1]),
+                                        "work": work } for (name, work) in authors ],
+                         "modified_rows": modified_rows }
+                       for (period, authors, modified_rows) in self.__periods__())
+
+            format.write_json(self.out, "timeline", {
+                "message": TIMELINE_INFO_TEXT(),
+                "period_length": "week" if self.useweeks else "month",
+                "periods": periods })
 
     def output_xml(self):
         if self.changes.all_commits():
-            message_xml = "\t\t<message>" + TIMELINE_INFO_TEXT() + "</message>\n"
-            timeline_xml = ""
-            periods_xml = "\t\t<periods length=\"{0}\">\n".format("week" if self.useweeks else "month")
-
-            timeline_data = timeline.TimelineData(self.changes, self.useweeks)
-            names = timeline_data.get_committers()
-
-            for period in timeline_data.get_periods():
-                name_xml = "\t\t\t\t<name>" + str(period) + "</name>\n"
-                authors_xml = "\t\t\t\t<authors>\n"
-
-                for name in names:
-                    if timeline_data.is_author_in_period(period, name[0]):
-                        multiplier = timeline_data.get_multiplier(period, 24)
-                        signs = timeline_data.get_author_signs_in_period(name[0], period, multiplier)
-                        signs_str = (signs[1] * "-" + signs[0] * "+")
-
-                        if not signs_str:
-                            signs_str = "."
-
-                        authors_xml += "\t\t\t\t\t<author>\n\t\t\t\t\t\t<name>" + name[0] + "</name>\n"
-                        authors_xml += "\t\t\t\t\t\t<email>" + name[1] + "</email>\n"
-                        authors_xml += "\t\t\t\t\t\t<gravatar>" + gravatar.get_url(name[1]) + "</gravatar>\n"
-                        authors_xml += "\t\t\t\t\t\t<work>" + signs_str + "</work>\n\t\t\t\t\t</author>\n"
-
-                authors_xml += "\t\t\t\t</authors>\n"
-                modified_rows_xml = "\t\t\t\t<modified_rows>" + \
-                            str(timeline_data.get_total_changes_in_period(period)[2]) + "</modified_rows>\n"
-                timeline_xml += "\t\t\t<period>\n" + name_xml + authors_xml + modified_rows_xml + "\t\t\t</period>\n"
-
-            self.out.writeln("\t<timeline>\n" + message_xml + periods_xml + timeline_xml +
-                             "\t\t</periods>\n\t</timeline>")
+            periods = (("period", { "name": str(period),
+                                    "authors": [ ("author", { "name": name[0],
+                                                              "email": name[1],
+                                                              "gravatar": gravatar.get_url(name[1]),
+                                                              "work": work })
+                                                 for (name, work) in authors ],
+                                    "modified_rows": modified_rows })
+                       for (period, authors, modified_rows) in self.__periods__())
+
+            format.write_xml(self.out, "timeline", [
+                ("message", TIMELINE_INFO_TEXT()),
+                ("periods", periods, { "length": "week" if self.useweeks else "month" }) ])
 
     def __output_row__text__(self, timeline_data, periods, names):
         self.out.write("\n" + terminal.__bold__ + terminal.ljust(_("Author"), 20) + " ")
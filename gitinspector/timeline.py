@@ -38,7 +38,7 @@ class TimelineData(object):
                 key = (i[0][1], i[0][0][0:7])
 
             if self.entries.get(key, None) is None:
-                self.entries[key] = i[1]
+                self.entries[key] = i[1].copy()
             else:
                 self.entries[key].insertions += i[1].insertions
                 self.entries[key].deletions += i[1].deletions
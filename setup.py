@@ -111,6 +111,7 @@ setup(
         keywords = "analysis analyzer git python statistics stats vc vcs timeline",
         url = "https://github.com/ejwa/gitinspector",
         long_description = read("DESCRIPTION.txt"),
+        python_requires = ">=3.7",
         classifiers = [
                 "Development Status :: 4 - Beta",
                 "Environment :: Console",
@@ -119,7 +120,7 @@ setup(
                 "Topic :: Software Development :: Version Control",
                 "Topic :: Utilities"
         ],
-        packages = find_packages(exclude = ['tests']),
+        packages = find_packages(exclude = ['tests', 'benchmarks']),
         package_data = {"": ["html/*", "translations/*"]},
         data_files = [("share/doc/gitinspector", glob("*.txt"))],
         entry_points = {"console_scripts": ["gitinspector = gitinspector.gitinspector:main"]},
@@ -17,4 +17,14 @@
 # You should have received a copy of the GNU General Public License
 # along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
 
-# This file was intentionally left blank.
+import atexit
+import os
+import shutil
+import tempfile
+
+# The runs that keep the cache enabled use a directory of their own,
+# rather than reading and filling the cache of the user. It is removed
+# once all the tests have run.
+__cache_home__ = tempfile.mkdtemp()
+os.environ["XDG_CACHE_HOME"] = __cache_home__
+atexit.register(shutil.rmtree, __cache_home__, True)
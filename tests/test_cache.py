@@ -0,0 +1,90 @@
+# coding: utf-8
+#
+# This file is part of gitinspector.
+#
+# gitinspector is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# gitinspector is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from gitinspector.cache import Cache
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_put(self):
+        cache = Cache(self.directory)
+        self.assertIsNone(cache.get("blames", ("a", "b")))
+        cache.put("blames", ("a", "b"), [({"revision": "a0ba"}, 3, 1)])
+        self.assertEqual(cache.get("blames", ("a", "b")), [({"revision": "a0ba"}, 3, 1)])
+        # The namespaces and the keys are distinct
+        self.assertIsNone(cache.get("changes", ("a", "b")))
+        self.assertIsNone(cache.get("blames", ("a", "c")))
+
+    def test_evict(self):
+        cache = Cache(self.directory, max_size=0)
+        for key in ["a", "b", "c"]:
+            cache.put("blames", (key,), "x" * 1000)
+        size = sum(os.path.getsize(os.path.join(d, f))
+                   for (d, _, files) in os.walk(self.directory) for f in files)
+
+        # Keep the two most recently used entries
+        cache.max_size = size - 1
+        past = time.time() - 60
+        for key in ["a", "b", "c"]:
+            os.utime(cache.__path__("blames", (key,)), (past, past))
+            past += 10
+        cache.get("blames", ("a",))
+        cache.evict()
+        self.assertIsNotNone(cache.get("blames", ("a",)))
+        self.assertIsNone(cache.get("blames", ("b",)))
+        self.assertIsNotNone(cache.get("blames", ("c",)))
+
+    def test_streams(self):
+        cache = Cache(self.directory)
+        items = [ [[b"sha%d" % i], (1, 0, b"path")] for i in range(10) ]
+
+        # The items are stored while they are generated, in bounded parts
+        stream = cache.put_stream("changes", ("a",), iter(items), part_size=4)
+        self.assertFalse(cache.has_stream("changes", ("a",), 1))
+        generated = []
+        try:
+            while True:
+                generated.append(next(stream))
+        except StopIteration as stop:
+            parts = stop.value
+        self.assertEqual((generated, parts), (items, 3))
+        self.assertTrue(cache.has_stream("changes", ("a",), parts))
+        self.assertEqual(list(cache.get_stream("changes", ("a",), parts)), items)
+
+        # A stream that is not generated until the end is not stored
+        stream = cache.put_stream("changes", ("b",), iter(items), part_size=4)
+        self.assertEqual(next(stream), items[0])
+        stream.close()
+        self.assertFalse(cache.has_stream("changes", ("b",), 1))
+        self.assertFalse([ f for (_, _, files) in os.walk(self.directory)
+                           for f in files if f.startswith("tmp") ])
+
+        # A missing part makes the whole stream missing
+        os.remove(cache.__path__("changes", ("a", 1)))
+        self.assertFalse(cache.has_stream("changes", ("a",), parts))
@@ -20,6 +20,7 @@
 import os
 import unittest
 import gitinspector.comment
+from gitinspector.metrics import MetricsLogic
 
 
 # Returns the number of lines in a given `commented_file` with
@@ -54,3 +55,20 @@ class CppFileTest(unittest.TestCase):
     def test(self):
         comment_counter = __test_extension__("/resources/commented_file.cpp", "cpp")
         self.assertEqual(comment_counter, 27)
+
+
+# Test that the single-pass scanner of the metrics counts the same lines
+# as the separate passes
+class MetricsScannerTest(unittest.TestCase):
+    def test(self):
+        base = os.path.dirname(os.path.realpath(__file__))
+        for (commented_file, extension, comments) in [("/resources/commented_file.tex", "tex", 39),
+                                                      ("/resources/commented_file.cpp", "cpp", 27)]:
+            with open(base + commented_file, "r", encoding="utf-8") as f:
+                file_r = f.read().split("\n")
+            for ext in [extension, "py", "c", "cs", "xml", "unknown"]:
+                self.assertEqual(MetricsLogic.get_metrics(file_r, ext),
+                                 (MetricsLogic.get_eloc(file_r, ext),
+                                  len(file_r) - MetricsLogic.get_eloc(file_r, ext),
+                                  MetricsLogic.get_cyclomatic_complexity(file_r, ext)))
+            self.assertEqual(MetricsLogic.get_metrics(file_r, extension)[1], comments)
@@ -0,0 +1,112 @@
+# coding: utf-8
+#
+# This file is part of gitinspector.
+#
+# gitinspector is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# gitinspector is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import re
+import shutil
+import subprocess
+import types
+import unittest
+import zipfile
+
+from gitinspector.gitinspector import __parse_arguments__
+from gitinspector import git_utils
+
+
+# Test the low-level git helpers directly on the basic repository
+class GitUtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        zip_ref = zipfile.ZipFile("tests/resources/basic-repository.zip", 'r')
+        zip_ref.extractall("build/tests")
+        zip_ref.close()
+        self.previous_directory = os.getcwd()
+        os.chdir("build/tests/basic-repository")
+
+    def tearDown(self):
+        os.chdir(self.previous_directory)
+        shutil.rmtree("build/tests/basic-repository")
+
+    def test_commit_chunks(self):
+        opts = __parse_arguments__(args=['--branch', 'master'])
+        chunks = git_utils.commit_chunks("master", "", "", opts)
+
+        # The chunks are produced lazily, one commit at a time
+        self.assertTrue(isinstance(chunks, types.GeneratorType))
+        chunks = list(chunks)
+        self.assertEqual(len(chunks), 4) # 4 commits on master
+        for chunk in chunks:
+            self.assertEqual(len(chunk[0]), git_utils.COMMIT_HEADER_FIELDS)
+        self.assertEqual(chunks[0][1], (1, 0, b"README.txt"))
+
+    def test_parse_numstat_log(self):
+        stream = io.BytesIO(b"1\x002015-10-17\x00a0ba\x00Frodo\x00f@s.n\x00Add\x00"
+                            b"\n8\t0\tREADME\x00-\t-\tlogo.png\x00\x00"
+                            b"2\x002015-10-18\x00e760\x00Bilbo\x00b@s.n\x00Merge\x00\x00"
+                            b"3\x002015-10-19\x001d32\x00Frodo\x00f@s.n\x00\x00"
+                            b"\n2\t1\t\x00README\x00README.md\x00")
+        chunks = list(git_utils.parse_numstat_log(stream))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks[0][0][3], b"Frodo")
+        self.assertEqual(chunks[0][1:], [(8, 0, b"README"), (0, 0, b"logo.png")])
+        self.assertEqual(chunks[1][1:], []) # A merge has no filediffs
+        self.assertEqual(chunks[2][1:], [(2, 1, b"README.md")])
+
+    def test_blob_reader(self):
+        with git_utils.BlobReader() as blobs:
+            readme = blobs.read("master", "README.txt")
+            makefile = blobs.read("master", "Makefile")
+            self.assertEqual(git_utils.decode(readme).count("\n"), 1)    # 1 line long
+            self.assertEqual(git_utils.decode(makefile).count("\n"), 10) # 10 lines long
+            self.assertIsNone(blobs.read("master", "missing.txt"))
+            self.assertIsNone(blobs.read("master", "missing file.txt"))
+            self.assertIsNone(blobs.read("master", "a missing file.txt"))
+            # The process is still usable after a missing object
+            self.assertEqual(bytes(blobs.read("master", "README.txt")), bytes(readme))
+
+    def test_last_commits(self):
+        opts = __parse_arguments__(args=[])
+        for branch in git_utils.local_branches():
+            last_commits = git_utils.last_commits(branch, opts)
+            self.assertTrue(last_commits)
+            for (file, (date, sha)) in last_commits.items():
+                log_p = subprocess.Popen(["git", "log", "-1", "--format=%at %H", branch, "--", file],
+                                         stdout=subprocess.PIPE)
+                self.assertEqual("%d %s" % (date, sha), log_p.communicate()[0].decode().strip())
+
+    def test_blobs(self):
+        opts = __parse_arguments__(args=[])
+        blobs = git_utils.blobs("master", opts)
+        self.assertEqual(sorted(blobs), git_utils.files("master", opts))
+        for (file, sha) in blobs.items():
+            rev_parse_p = subprocess.Popen(["git", "rev-parse", "master:" + file],
+                                           stdout=subprocess.PIPE)
+            self.assertEqual(sha, rev_parse_p.communicate()[0].decode().strip())
+        self.assertEqual(git_utils.blobs("missing", opts), {})
+
+    def test_blames(self):
+        opts = __parse_arguments__(args=['--branch', 'master'])
+        rows = git_utils.blames("master", "Makefile", opts)
+
+        # The rows are streamed, each line of the file being a content
+        # row, while the header of each commit only appears once
+        self.assertTrue(isinstance(rows, types.GeneratorType))
+        rows = list(rows)
+        revisions = set(r.split()[0] for r in rows if re.match(rb"[0-9a-f]{40} ", r))
+        self.assertEqual(len([ r for r in rows if r.startswith(b"\t") ]), 10)
+        self.assertEqual(len([ r for r in rows if r.startswith(b"author ") ]), len(revisions))
@@ -22,6 +22,7 @@ import zipfile
 
 from gitinspector.gitinspector import Runner, __parse_arguments__
 from gitinspector.changes import CommitType
+from gitinspector.filtering import Filters
 
 
 # Test the metrics on the basic repository, a very simple repository
@@ -170,6 +171,22 @@ class MetricsTrieTest(unittest.TestCase):
         self.assertEqual(sam_commits.insertions, 41) # 41 (22+19)
         self.assertEqual(sam_commits.deletions, 0)
 
+    def test_message_filters(self):
+        opts = __parse_arguments__(args=['--silent',
+                                         '--exclude', 'message:^function,message:[Tt]est',
+                                         'build/tests/trie-repository'])
+        opts.progress = False
+
+        # Launch runner
+        r = Runner(opts, None)
+        r.process()
+
+        # Test number of commits filtered by their messages
+        filtered = [c for c in r.changes.all_commits() if c.type == CommitType.FILTERED]
+        self.assertEqual(len(filtered), 10)
+        self.assertEqual(set(c.sha for c in filtered),
+                         r.context.filtering.get_filtered(Filters.REVISION))
+
     def test_all_blames_without_spaces(self):
         opts = __parse_arguments__(args=['--silent', # '-b', 'master'
                                          'build/tests/trie-repository'])
@@ -15,6 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
 
+import contextlib
+import io
 import os
 import shutil
 import tempfile
@@ -150,3 +152,26 @@ class PelicanRepositoryTest(unittest.TestCase):
             self.assertTrue("Below are the number of rows" in contents)
             self.assertTrue("The following history timeline" in contents)
         os.remove(file.name)
+
+    def test_metrics_jobs(self):
+        def measure(jobs, *args):
+            opts = __parse_arguments__(args=['--silent', '--no-cache', '--metrics', '--file-types', '**',
+                                             '--jobs', jobs] + list(args) +
+                                       ['build/tests/pelican-repository'])
+            opts.progress = False
+            r = Runner(opts, None)
+            r.process()
+            return (r.metrics.eloc, r.metrics.cyclomatic_complexity,
+                    r.metrics.cyclomatic_complexity_density)
+
+        # The files measured by a pool of processes are recorded in order
+        reference = measure('1')
+        self.assertTrue(all(reference))
+        self.assertEqual([ list(m.items()) for m in measure('2') ],
+                         [ list(m.items()) for m in reference ])
+
+        # The time spent on each file is reported in debug mode
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr), contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(measure('2', '--debug-mode'), reference)
+        self.assertIn("debug: metrics of pelican/generators.py: ", stderr.getvalue())
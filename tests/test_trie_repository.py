@@ -15,14 +15,58 @@
 # You should have received a copy of the GNU General Public License
 # along with gitinspector. If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
+import json
 import os
+import pickle
 import shutil
+import subprocess
 import tempfile
 import unittest
 import zipfile
+import xml.dom.minidom
 
 import gitinspector.localization as localization
-from gitinspector.gitinspector import Runner, FileWriter, __parse_arguments__
+from gitinspector import git_utils
+from gitinspector.blame import Blame
+from gitinspector.changes import AuthorColors, Changes
+from gitinspector.filtering import Filters, InvalidRegExpError
+from gitinspector.gitinspector import Runner, FileWriter, WRITER_BUFFER_SIZE, __get_writers__, __parse_arguments__
+from gitinspector.output.outputable import Stage
+
+TRIE_REPOSITORY = 'build/tests/trie-repository'
+
+
+def __run__(*args, repositories=(TRIE_REPOSITORY,), writers=None):
+    """
+    Returns the Runner of an analysis with the given command-line
+    arguments, once processed. Nothing is output, unless `writers`
+    returns the writers of the outputs from the parsed options.
+    """
+    opts = __parse_arguments__(args=([] if writers else ['--silent']) + list(args) +
+                               list(repositories))
+    opts.progress = False
+    r = Runner(opts, writers(opts) if writers else None)
+    r.process()
+    return r
+
+
+def __report__(*args):
+    """
+    Returns the Runner of an analysis with the given command-line
+    arguments, along with its report.
+    """
+    localization.init_null()
+    file = tempfile.NamedTemporaryFile('w', delete=False)
+    r = __run__(*args, writers=lambda opts: FileWriter(file))
+    with open(file.name, 'r') as f:
+        contents = f.read()
+    os.remove(file.name)
+    return r, contents
+
+
+def __rows__(r):
+    return { k: v.rows for k, v in r.blames.all_blames().items() }
 
 
 class TrieRepositoryTest(unittest.TestCase):
@@ -126,3 +170,310 @@ class TrieRepositoryTest(unittest.TestCase):
             self.assertTrue("Below are the number of rows" in contents)
             self.assertTrue("The following history timeline" in contents)
         os.remove(file.name)
+
+    def test_prune(self):
+        args = ('--file-types', '*.c,*.h', '--exclude', 'author:Frodo,message:[Tt]est',
+                '--exclude', 'file_out:test/*')
+        full, pruned = __run__(*args), __run__('--prune', *args)
+
+        # git skips the filtered commits, the files being filtered as usual ...
+        self.assertTrue(len(pruned.changes.all_commits()) < len(full.changes.all_commits()))
+        self.assertTrue(all(c.author != "Frodo Baggins" for c in pruned.changes.all_commits()))
+        self.assertEqual(full.context.filtering.get_filtered(Filters.FILE_OUT),
+                         pruned.context.filtering.get_filtered(Filters.FILE_OUT))
+
+        # ... without changing the statistics of the other ones
+        def stats(changes):
+            return { k: (v.insertions, v.deletions)
+                     for k, v in changes.get_authorinfo_list().items() if v.insertions }
+        self.assertEqual(stats(full.changes), stats(pruned.changes))
+        self.assertEqual(__rows__(full), __rows__(pruned))
+
+    def test_prune_renames(self):
+        def stats(*args):
+            r = __run__('--file-types', '*.c,*.h', '--exclude', 'file_out:test/*', *args)
+            return { k: (v.insertions, v.deletions)
+                     for k, v in r.changes.get_authorinfo_list().items() }
+
+        # A file renamed from an accepted path to a filtered one is not
+        # counted as deleted
+        subprocess.check_call(["git", "mv", "src/trie.c", "test/trie.c"], cwd=TRIE_REPOSITORY)
+        subprocess.check_call(["git", "-c", "user.name=Bilbo Baggins",
+                               "-c", "user.email=bilbo@shire.net",
+                               "commit", "-m", "Move the trie"], cwd=TRIE_REPOSITORY,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.assertEqual(stats('--no-cache'), stats('--no-cache', '--prune'))
+
+    def test_jobs(self):
+        def blames(jobs, engine):
+            r = __run__('--file-types', '*.c,*.h', '--exclude', 'author:Frodo',
+                        '--jobs', jobs, '--blame-engine', engine)
+            self.assertEqual(r.context.filtering.get_filtered(Filters.AUTHOR), {"Frodo Baggins"})
+            return { k: (v.rows, v.comments, v.skew) for k, v in r.blames.all_blames().items() }
+
+        self.assertEqual(blames('1', 'thread'), blames('4', 'thread'))
+        self.assertEqual(blames('1', 'thread'), blames('4', 'process'))
+
+    def test_cache(self):
+        directory = tempfile.mkdtemp()
+
+        def blames(*args):
+            r = __run__('--file-types', '*.c,*.h', '--exclude', 'author:Frodo', *args)
+            return { k: (v.rows, v.comments, round(v.skew, 6))
+                     for k, v in r.blames.all_blames().items() }
+
+        reference = blames('--no-cache', '--cache-dir', directory)
+        self.assertEqual(os.listdir(directory), [])
+        self.assertEqual(blames('--cache-dir', directory), reference)
+        self.assertTrue(os.listdir(directory))
+        # The second run reads the blames from the cache
+        self.assertEqual(blames('--cache-dir', directory), reference)
+
+        # The keys hold the last commit modifying each file, as read by
+        # the changes rather than by another walk of the history
+        opts = __parse_arguments__(args=['--silent', '--no-cache', TRIE_REPOSITORY])
+        opts.branch = "HEAD"
+        changes = Changes(None, opts, Runner(opts, None).context, TRIE_REPOSITORY)
+        last_commits = git_utils.last_commits(changes.last_revision, opts, changes.location)
+        self.assertEqual(changes.last_commits, { f: sha for (f, (_, sha)) in last_commits.items() })
+        shutil.rmtree(directory)
+
+    def test_incremental_changes(self):
+        directory = tempfile.mkdtemp()
+
+        def commits(*args):
+            r = __run__('--file-types', '*.c,*.h,README', '--cache-dir', directory, *args)
+            return [ (c.sha, c.type, [ (d.name, d.insertions, d.deletions) for d in c.filediffs ])
+                     for c in r.changes.all_commits() ]
+
+        def git(*args):
+            subprocess.check_call(["git", "-c", "user.name=Bilbo Baggins",
+                                   "-c", "user.email=bilbo@shire.net"] + list(args),
+                                  cwd=TRIE_REPOSITORY,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        reference = commits()
+        self.assertEqual(reference, commits('--no-cache'))
+
+        # Only the new commit is read, on top of the cached ones
+        with open(os.path.join(TRIE_REPOSITORY, "README"), "a") as readme:
+            readme.write("One more line\n")
+        git("commit", "-a", "-m", "Extend the README")
+        self.assertEqual(len(commits()), len(reference) + 1)
+        self.assertEqual(commits(), commits('--no-cache'))
+
+        # The commits of an evicted range are read again
+        evicted = []
+        for (root, _, files) in os.walk(os.path.join(directory, "changes")):
+            for name in files:
+                with open(os.path.join(root, name), "rb") as entry:
+                    key = pickle.load(entry)
+                if isinstance(key[-1], int) and key[-3] == ():
+                    evicted.append(os.path.join(root, name))
+        self.assertTrue(evicted)
+        for path in evicted:
+            os.remove(path)
+        self.assertEqual(commits(), commits('--no-cache'))
+
+        # A rewritten history is read again from scratch
+        git("commit", "--amend", "-m", "Extend the README again")
+        self.assertEqual(len(commits()), len(reference) + 1)
+        self.assertEqual(commits(), commits('--no-cache'))
+        shutil.rmtree(directory)
+
+    def test_change_store(self):
+        r = __run__('--file-types', '*.c,*.h', '--no-cache')
+
+        # The commits and their diffs are views on the columns of the store
+        commits = r.changes.all_commits()
+        store = commits[0].store
+        self.assertEqual(len(store.shas), len(commits))
+        self.assertEqual(len(store.paths), sum(len(c.filediffs) for c in commits))
+        # The authors and the paths are interned once per run
+        self.assertEqual(len(set(store.strings)), len(store.strings))
+        for c in commits:
+            self.assertIs(c.author, store.strings[store.symbols[c.author]])
+            for d in c.filediffs:
+                self.assertIn(d.name, r.changes.files)
+
+    def test_authorinfo_views(self):
+        r = __run__('--file-types', '*.c,*.h', '--no-cache')
+
+        # The aggregates are computed once, and cannot be modified
+        authorinfos = r.changes.get_authorinfo_list()
+        self.assertIs(authorinfos[('Bilbo Baggins', 'bilbo.baggins@shire.net')],
+                      r.changes.get_authorinfo_list()[('Bilbo Baggins', 'bilbo.baggins@shire.net')])
+        with self.assertRaises(TypeError):
+            authorinfos[('Gandalf', 'gandalf@valinor.net')] = None
+        info = authorinfos[('Bilbo Baggins', 'bilbo.baggins@shire.net')]
+        with self.assertRaises(AttributeError):
+            info.insertions += 1
+        # A copy can be modified
+        copy = info.copy()
+        copy.insertions += 1
+        self.assertEqual(copy.insertions, info.insertions + 1)
+
+    def test_indexes(self):
+        r = __run__('--file-types', '*.c,*.h', '--no-cache')
+
+        # The indexed queries agree with a scan of all the commits and blames
+        commits = r.changes.all_commits()
+        for author in set(c.author for c in commits):
+            self.assertEqual(r.changes.commits_for_author(author),
+                             [c for c in commits if c.author == author])
+        for file in r.changes.files:
+            self.assertEqual([(d.name, d.insertions) for d in r.changes.diffs_for_file(file)],
+                             [(d.name, d.insertions) for c in commits for d in c.filediffs
+                              if d.name == file])
+        blames = r.blames.all_blames()
+        for committer in r.blames.committers_by_responsibilities():
+            self.assertEqual(r.blames.get_responsibilities(committer),
+                             sorted((f, b.rows - b.comments) for (c, f), b in blames.items()
+                                    if c == committer and b.rows - b.comments > 0))
+        rows = [sum(b.rows for (c, f), b in blames.items() if c == committer)
+                for committer in r.blames.committers_by_responsibilities()]
+        self.assertEqual(rows, sorted(rows, reverse=True))
+
+    def test_stages(self):
+        # Only the commits are read
+        r, contents = __report__('--grading', '--file-types', '*.c,*.h', '--only', 'changes')
+        self.assertTrue(r.changes.all_commits())
+        self.assertFalse(r.blames.all_blames())
+        self.assertEqual(r.stages, set([Stage.CHANGES]))
+        self.assertIsNone(r.timeline)
+        self.assertTrue("The following historical commit" in contents)
+        self.assertFalse("Below are the number of rows" in contents)
+        self.assertFalse("were skipped" in contents)
+
+        # The outputs depending on the blames are reported as skipped
+        r, contents = __report__('--grading', '--file-types', '*.c,*.h', '--no-blame')
+        self.assertFalse(r.blames.all_blames())
+        self.assertEqual(Blame.empty().blames_for_file("src/trie.c"), [])
+        self.assertEqual(Blame.empty().get_responsibilities(("Frodo Baggins", "frodo@shire.net")), [])
+        self.assertEqual(r.stages, set([Stage.CHANGES, Stage.METRICS, Stage.TIMELINE]))
+        self.assertFalse("Below are the number of rows" in contents)
+        self.assertTrue("were skipped" in contents)
+
+    def test_several_formats(self):
+        directory = tempfile.mkdtemp()
+
+        # The results are loaded once, and rendered in every format
+        localization.init_null()
+        __run__('--grading', '--file-types', '*.c,*.h', '--format', 'json,xml,text',
+                '--output', directory, writers=__get_writers__)
+        self.assertEqual(sorted(os.listdir(directory)),
+                         ["gitinspector.json", "gitinspector.txt", "gitinspector.xml"])
+        with open(os.path.join(directory, "gitinspector.json")) as f:
+            self.assertTrue(json.load(f)["gitinspector"]["blame"])
+        with open(os.path.join(directory, "gitinspector.xml")) as f:
+            self.assertTrue(xml.dom.minidom.parseString(f.read()).getElementsByTagName("blame"))
+        with open(os.path.join(directory, "gitinspector.txt")) as f:
+            self.assertTrue("Below are the number of rows" in f.read())
+        shutil.rmtree(directory)
+
+    def test_escaping(self):
+        directory = tempfile.mkdtemp()
+
+        # The names needing an escape still give valid documents
+        localization.init_null()
+        __run__('--grading', '--file-types', '*.c,*.h',
+                '--aliases', "{'bilbo.baggins@shire.net': "
+                "'Bilbo \"Ring-bearer\" Baggins & co <bilbo@shire.net>'}",
+                '--format', 'json,xml', '--output', directory, writers=__get_writers__)
+        name = 'Bilbo "Ring-bearer" Baggins & co'
+        with open(os.path.join(directory, "gitinspector.json")) as f:
+            authors = json.load(f)["gitinspector"]["changes"]["authors"]
+            self.assertTrue(name in [ a["name"] for a in authors ])
+        with open(os.path.join(directory, "gitinspector.xml")) as f:
+            document = xml.dom.minidom.parseString(f.read())
+            names = [ n.firstChild.data for n in document.getElementsByTagName("name") ]
+            self.assertTrue(name in names)
+        shutil.rmtree(directory)
+
+    def test_writers(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "gitinspector.txt")
+
+        # The report is encoded explicitly, and written out as it grows
+        writer = FileWriter(path, encoding="utf-8")
+        writer.writeln("Bilbo Sacquet à Cul-de-Sac")
+        writer.write("x" * (2 * WRITER_BUFFER_SIZE))
+        self.assertTrue(os.path.getsize(path) >= WRITER_BUFFER_SIZE)
+        writer.close()
+        with open(path, "rb") as f:
+            self.assertEqual(f.readline().decode("utf-8"), "Bilbo Sacquet à Cul-de-Sac\n")
+
+        # Opened text files are supported as well
+        with open(path, "w") as file:
+            writer = FileWriter(file)
+            writer.writeln("Bilbo")
+            writer.close()
+        with open(path) as f:
+            self.assertEqual(f.read(), "Bilbo\n")
+        shutil.rmtree(directory)
+
+    def test_repositories(self):
+        zip_ref = zipfile.ZipFile("tests/resources/basic-repository.zip", 'r')
+        zip_ref.extractall("build/tests")
+        zip_ref.close()
+        directory = os.getcwd()
+
+        def load(jobs):
+            r = __run__('--no-cache', '--exclude', 'author:Frodo', '--jobs', jobs,
+                        repositories=(TRIE_REPOSITORY, 'build/tests/basic-repository'))
+            self.assertEqual(r.context.filtering.get_filtered(Filters.AUTHOR), {"Frodo Baggins"})
+            # The colors are given by a counter shared by the runs
+            colors = [ AuthorColors.colors.index(c["color"]) for c in r.changes.committers.values() ]
+            return ([ (c.sha, c.author, c.type) for c in r.changes.all_commits() ],
+                    [ (c - colors[0]) % len(AuthorColors.colors) for c in colors ],
+                    __rows__(r), r.metrics.eloc)
+
+        # The repositories loaded by a pool of processes are merged in order
+        reference = load('1')
+        self.assertEqual(load('2'), reference)
+        self.assertEqual(os.getcwd(), directory)
+        shutil.rmtree("build/tests/basic-repository")
+
+    def test_contexts(self):
+        def load(*args):
+            r = __run__('--no-cache', '--jobs', '1', '--metrics', *args)
+            return (r.context.filtering.get_filtered(Filters.AUTHOR),
+                    [ (c.sha, c.type) for c in r.changes.all_commits() ], __rows__(r))
+
+        # The runners of a process do not share their filters nor their interval
+        arguments = [ ('--exclude', 'author:Frodo'), ('--since', '2015-10-25'), () ]
+        references = [ load(*a) for a in arguments ]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(arguments)) as executor:
+            self.assertEqual(list(executor.map(lambda a: load(*a), arguments)), references)
+        self.assertEqual(references[0][0], {"Frodo Baggins"})
+        self.assertEqual(references[2][0], set())
+        self.assertTrue(0 < len(references[1][1]) < len(references[2][1]))
+
+    def test_filters(self):
+        r = __run__('--no-cache', '--file-types', '*.c,*.h,Make*',
+                    '--exclude', 'file_out:*.h,author:(?i)FRODO,author:(z)\\1')
+        filtering = r.context.filtering
+        self.assertEqual(filtering.get_filtered(Filters.AUTHOR), {"Frodo Baggins"})
+        self.assertTrue(filtering.get_filtered(Filters.FILE_OUT))
+        for name in filtering.get_filtered(Filters.FILE_OUT):
+            self.assertTrue(name.endswith(".h"))
+        self.assertFalse([ f for f in r.blames.all_blames() if f[1].endswith(".h") ])
+
+        # The memoised results still record the filtered items
+        self.assertFalse(filtering.is_acceptable_file_name("trie.h"))
+        self.assertTrue(filtering.is_acceptable_file_name("src/trie.c"))
+        self.assertTrue(filtering.is_acceptable_file_name("Makefile"))
+        self.assertFalse(filtering.is_acceptable_file_name("README"))
+        self.assertIn("trie.h", filtering.get_filtered(Filters.FILE_OUT))
+        self.assertTrue(filtering.is_filtered("Fizz", Filters.AUTHOR))
+        self.assertIn("Fizz", filtering.get_filtered(Filters.AUTHOR))
+
+        # A global inline flag only applies to its own pattern
+        r = __run__('--no-cache', '--only', 'changes', '--exclude', 'author:(?i)frodo,author:bilbo')
+        filtering = r.context.filtering
+        self.assertTrue(filtering.is_filtered("FRODO", Filters.AUTHOR))
+        self.assertTrue(filtering.is_filtered("bilbo", Filters.AUTHOR))
+        self.assertFalse(filtering.is_filtered("BILBO", Filters.AUTHOR))
+
+        # The invalid regular expressions are rejected by the Runner
+        self.assertRaises(InvalidRegExpError, __run__, '--exclude', 'author:(Frodo')